@@ -1,26 +1,42 @@
 # admin_interface.py
 from PyQt6.QtWidgets import (
-    QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QTableWidget,
-    QTableWidgetItem, QMessageBox, QLineEdit, QDialog, QFormLayout, QHeaderView
+    QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QTableView,
+    QMessageBox, QLineEdit, QDialog, QFormLayout, QHeaderView, QFileDialog, QProgressDialog,
+    QDateEdit, QTabWidget, QTableWidget, QTableWidgetItem, QCheckBox
 )
-from PyQt6.QtCore import Qt
-from database import Database
+from PyQt6.QtCore import Qt, QDate
+from database import open_database
+from workers import run_in_background
+import bulk_io
+import diagnostics
+from catalog_model import ProductTableModel, AllOrdersTableModel
 
 class AdminWidget(QWidget):
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window  # Ссылка на главное окно
-        self.db = Database()
+        self.db = open_database()
+        self.orders_model = None
+        self.analytics_dialog = None
         self.init_ui()
 
+        # Изменения с других терминалов применяются построчно
+        watcher = self.main_window.change_watcher
+        watcher.products_changed.connect(self.apply_product_changes)
+        watcher.orders_changed.connect(self.apply_order_changes)
+        watcher.reset_required.connect(self.load_products)
+
     def init_ui(self):
         # Приветственное сообщение
         self.label = QLabel('Добро пожаловать, Администратор!')
 
         # Таблица товаров
-        self.products_table = QTableWidget()
-        self.products_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.products_table.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
+        self.products_model = ProductTableModel(self.db.get_products_page, parent=self)
+        self.products_table = QTableView()
+        self.products_table.setModel(self.products_model)
+        self.products_table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.products_table.setSelectionMode(QTableView.SelectionMode.SingleSelection)
+        self.products_table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
         self.products_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         self.load_products()
 
@@ -37,6 +53,21 @@ class AdminWidget(QWidget):
         self.view_orders_button = QPushButton('Просмотреть заказы')
         self.view_orders_button.clicked.connect(self.view_orders)
 
+        self.analytics_button = QPushButton('Аналитика')
+        self.analytics_button.clicked.connect(self.view_analytics)
+
+        self.diagnostics_button = QPushButton('Диагностика')
+        self.diagnostics_button.clicked.connect(self.view_diagnostics)
+
+        self.import_button = QPushButton('Импорт')
+        self.import_button.clicked.connect(self.import_products)
+
+        self.export_button = QPushButton('Экспорт')
+        self.export_button.clicked.connect(self.export_products)
+
+        self.lock_button = QPushButton('Сменить пользователя')
+        self.lock_button.clicked.connect(self.lock)
+
         self.logout_button = QPushButton('Выйти')
         self.logout_button.clicked.connect(self.logout)
 
@@ -47,10 +78,18 @@ class AdminWidget(QWidget):
         buttons_layout.addWidget(self.delete_product_button)
         buttons_layout.addWidget(self.view_orders_button)
 
+        bulk_layout = QHBoxLayout()
+        bulk_layout.addWidget(self.import_button)
+        bulk_layout.addWidget(self.export_button)
+        bulk_layout.addWidget(self.analytics_button)
+        bulk_layout.addWidget(self.diagnostics_button)
+
         layout = QVBoxLayout()
         layout.addWidget(self.label)
         layout.addWidget(self.products_table)
         layout.addLayout(buttons_layout)
+        layout.addLayout(bulk_layout)
+        layout.addWidget(self.lock_button)
         layout.addWidget(self.logout_button)
 
         # Устанавливаем растяжение для таблицы
@@ -59,28 +98,48 @@ class AdminWidget(QWidget):
         self.setLayout(layout)
 
     def load_products(self):
-        products = self.db.get_products()
-        self.products_table.clearContents()
-        self.products_table.setRowCount(len(products))
-        self.products_table.setColumnCount(5)
-        self.products_table.setHorizontalHeaderLabels(['ID', 'Название', 'Описание', 'Цена', 'Количество'])
-        self.products_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.products_model.reload()
 
-        for row_index, product in enumerate(products):
-            for col_index, item in enumerate(product):
-                self.products_table.setItem(row_index, col_index, QTableWidgetItem(str(item)))
+    def apply_product_changes(self, rows, deleted_ids):
+        self.products_model.apply_delta(rows, deleted_ids, append_new=True)
+
+    def apply_order_changes(self, rows, deleted_ids):
+        # Изменения приходят из основной базы; архив показывается как есть
+        if self.orders_model is not None and not self.orders_archive_box.isChecked():
+            self.orders_model.apply_delta(rows, deleted_ids, append_new=True)
+        # Скрытый экран (вошёл другой пользователь) не перечитывает аналитику
+        if self.analytics_dialog is not None and self.isVisible():
+            self.analytics_dialog.load()
+
+    def refresh(self):
+        """Повторный вход на экран, созданный ранее."""
+        self.load_products()
+        if self.analytics_dialog is not None:
+            self.analytics_dialog.load()
+
+    def dispose(self):
+        """Экран вытеснен из ``ScreenManager`` и будет уничтожен."""
+        for dialog in self.findChildren(QDialog):
+            dialog.close()
+
+    def selected_product(self):
+        return self.products_model.product_at(self.products_table.currentIndex().row())
 
     def disable_buttons(self):
         self.add_product_button.setEnabled(False)
         self.edit_product_button.setEnabled(False)
         self.delete_product_button.setEnabled(False)
         self.view_orders_button.setEnabled(False)
+        self.import_button.setEnabled(False)
+        self.export_button.setEnabled(False)
 
     def enable_buttons(self):
         self.add_product_button.setEnabled(True)
         self.edit_product_button.setEnabled(True)
         self.delete_product_button.setEnabled(True)
         self.view_orders_button.setEnabled(True)
+        self.import_button.setEnabled(True)
+        self.export_button.setEnabled(True)
 
     def add_product(self):
         self.disable_buttons()
@@ -92,22 +151,16 @@ class AdminWidget(QWidget):
         self.enable_buttons()
 
     def edit_product(self):
-        selected_row = self.products_table.currentRow()
-        if selected_row >= 0:
+        product = self.selected_product()
+        if product is not None:
             self.disable_buttons()
             # Получаем данные из выбранной строки
-            product_id_item = self.products_table.item(selected_row, 0)
-            name_item = self.products_table.item(selected_row, 1)
-            description_item = self.products_table.item(selected_row, 2)
-            price_item = self.products_table.item(selected_row, 3)
-            quantity_item = self.products_table.item(selected_row, 4)
-
             try:
-                product_id = int(product_id_item.text())
-                name = name_item.text()
-                description = description_item.text()
-                price = float(price_item.text())
-                quantity = int(quantity_item.text())
+                product_id = int(product.id)
+                name = product.name
+                description = product.description or ''
+                price = float(product.price)
+                quantity = int(product.quantity)
 
                 dialog = ProductDialog(product_id, name, description, price, quantity)
                 if dialog.exec():
@@ -121,12 +174,11 @@ class AdminWidget(QWidget):
             QMessageBox.warning(self, 'Ошибка', 'Пожалуйста, выберите товар для редактирования.')
 
     def delete_product(self):
-        selected_row = self.products_table.currentRow()
-        if selected_row >= 0:
+        product = self.selected_product()
+        if product is not None:
             self.disable_buttons()
-            product_id_item = self.products_table.item(selected_row, 0)
             try:
-                product_id = int(product_id_item.text())
+                product_id = int(product.id)
                 confirm = QMessageBox.question(
                     self, 'Подверждение', 'Вы уверены, что хотите удалить этот товар?',
                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
@@ -141,38 +193,373 @@ class AdminWidget(QWidget):
             QMessageBox.warning(self, 'Ошибка', 'Пожалуйста, выберите товар для удаления.')
 
     def view_orders(self):
-        orders = self.db.get_all_orders()
-        if orders:
+        orders_model = AllOrdersTableModel(self.db.get_all_orders_page, parent=self)
+        orders_model.fetchMore()
+        archived = False
+        if not orders_model.rowCount():
+            # Все заказы могли уже уйти в архив
+            orders_model.reload(fetch_page=self.db.get_archived_orders_page)
+            archived = True
+        if orders_model.rowCount():
             self.disable_buttons()
             # Создаём диалоговое окно для отображения заказов
             self.orders_dialog = QDialog(self)
             self.orders_dialog.setWindowTitle('Все заказы')
-            self.orders_dialog.setFixedSize(600, 400)
+            self.orders_dialog.setFixedSize(700, 450)
             self.orders_dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
             self.orders_dialog.finished.connect(self.enable_buttons)
-
-            orders_table = QTableWidget()
-            orders_table.setRowCount(len(orders))
-            orders_table.setColumnCount(5)
-            orders_table.setHorizontalHeaderLabels(['ID заказа', 'Пользователь', 'Товар', 'Количество', 'Сумма'])
-            orders_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
-            orders_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
-
-            for row_index, order in enumerate(orders):
-                for col_index, item in enumerate(order):
-                    orders_table.setItem(row_index, col_index, QTableWidgetItem(str(item)))
+            self.orders_dialog.finished.connect(self.forget_orders_model)
+
+            # Заказы подгружаются страницами по мере прокрутки
+            self.orders_table = QTableView()
+            orders_model.setParent(self.orders_table)
+            self.orders_table.setModel(orders_model)
+            self.orders_model = orders_model
+            self.orders_table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+            self.orders_table.setSelectionMode(QTableView.SelectionMode.SingleSelection)
+            self.orders_table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
+            self.orders_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+
+            # Старые выполненные и отменённые заказы хранятся в отдельной базе
+            # и читаются только по запросу
+            self.orders_archive_box = QCheckBox('Архив')
+            self.orders_archive_box.setChecked(archived)
+            self.orders_archive_box.toggled.connect(self.reload_orders)
+
+            # Очередь к выполнению: только оформленные заказы, по порядку
+            self.orders_placed_box = QCheckBox('К выполнению')
+            self.orders_placed_box.setEnabled(not archived)
+            self.orders_placed_box.toggled.connect(self.reload_orders)
+
+            self.fulfill_order_button = QPushButton('Отметить выполненным')
+            self.fulfill_order_button.setEnabled(not archived)
+            self.fulfill_order_button.clicked.connect(self.fulfill_order)
+
+            header_layout = QHBoxLayout()
+            header_layout.addWidget(QLabel('Все заказы'))
+            header_layout.addStretch()
+            header_layout.addWidget(self.orders_placed_box)
+            header_layout.addWidget(self.orders_archive_box)
 
             layout = QVBoxLayout()
-            layout.addWidget(QLabel('Все заказы'))
-            layout.addWidget(orders_table)
+            layout.addLayout(header_layout)
+            layout.addWidget(self.orders_table)
+            layout.addWidget(self.fulfill_order_button)
 
             self.orders_dialog.setLayout(layout)
             self.orders_dialog.exec()
         else:
             QMessageBox.information(self, 'Заказы', 'Заказов нет.')
 
+    def reload_orders(self):
+        # В архиве только выполненные и отменённые заказы: очередь там пуста
+        archived = self.orders_archive_box.isChecked()
+        placed_only = self.orders_placed_box.isChecked() and not archived
+        if archived:
+            fetch_page = self.db.get_archived_orders_page
+        elif placed_only:
+            fetch_page = self.db.get_placed_orders_page
+        else:
+            fetch_page = self.db.get_all_orders_page
+        self.orders_model.placed_only = placed_only
+        self.orders_model.reload(fetch_page=fetch_page)
+        self.orders_placed_box.setEnabled(not archived)
+        self.fulfill_order_button.setEnabled(not archived)
+
+    def fulfill_order(self):
+        order = self.orders_model.row_at(self.orders_table.currentIndex().row())
+        if order is None or order.status != 'placed':
+            QMessageBox.warning(self.orders_dialog, 'Ошибка', 'Пожалуйста, выберите оформленный заказ.')
+            return
+        if self.db.fulfill_order(order.id):
+            self.orders_model.apply_delta(self.db.get_orders_by_ids([order.id]), [])
+        else:
+            QMessageBox.warning(self.orders_dialog, 'Ошибка', 'Заказ уже отменён или выполнен.')
+
+    def forget_orders_model(self):
+        self.orders_model = None
+
+    def view_analytics(self):
+        # Немодальное окно: продажи обновляются по мере поступления заказов
+        if self.analytics_dialog is None:
+            self.analytics_dialog = AnalyticsDialog(self.db, self)
+            self.analytics_dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+            self.analytics_dialog.finished.connect(self.forget_analytics_dialog)
+        self.analytics_dialog.show()
+        self.analytics_dialog.raise_()
+
+    def forget_analytics_dialog(self):
+        self.analytics_dialog = None
+
+    def view_diagnostics(self):
+        dialog = DiagnosticsDialog(self.db, self)
+        dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        dialog.show()
+
+    def import_products(self):
+        path, _ = QFileDialog.getOpenFileName(
+            self, 'Импорт товаров', '', 'Каталог товаров (*.csv *.jsonl *.ndjson)'
+        )
+        if not path:
+            return
+        self.disable_buttons()
+        self.import_cancelled = False
+        self.import_progress = QProgressDialog('Импорт товаров...', 'Остановить', 0, 0, self)
+        self.import_progress.setWindowTitle('Импорт')
+        self.import_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.import_progress.canceled.connect(self.stop_import)
+        self.import_progress.show()
+        # Файл читается и записывается пакетами в фоновом потоке
+        run_in_background(
+            bulk_io.import_products, self.db, path,
+            should_stop=lambda: self.import_cancelled,
+            on_progress=lambda report: self.import_progress.setLabelText(report.summary()),
+            on_finished=self.import_finished,
+            on_failed=self.bulk_failed,
+        )
+
+    def stop_import(self):
+        self.import_cancelled = True
+
+    def import_finished(self, report):
+        self.import_progress.reset()
+        self.enable_buttons()
+        self.load_products()
+        message = report.summary()
+        if report.rejected:
+            shown = '\n'.join(f'Строка {line}: {reason}' for line, reason in report.rejected[:20])
+            if len(report.rejected) > 20:
+                shown += f'\n... и ещё {len(report.rejected) - 20}'
+            message += '\n\nОтклонённые строки:\n' + shown
+        QMessageBox.information(self, 'Импорт', message)
+
+    def export_products(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, 'Экспорт товаров', 'products.csv', 'CSV (*.csv);;JSON Lines (*.jsonl)'
+        )
+        if not path:
+            return
+        self.disable_buttons()
+        run_in_background(
+            bulk_io.export_products, self.db, path,
+            on_finished=self.export_finished,
+            on_failed=self.bulk_failed,
+        )
+
+    def export_finished(self, exported):
+        self.enable_buttons()
+        QMessageBox.information(self, 'Экспорт', f'Выгружено товаров: {exported}.')
+
+    def bulk_failed(self, error):
+        if getattr(self, 'import_progress', None) is not None:
+            self.import_progress.reset()
+        self.enable_buttons()
+        QMessageBox.warning(self, 'Ошибка', f'Не удалось выполнить операцию: {error}')
+
+    def lock(self):
+        self.main_window.lock()
+
     def logout(self):
-        self.main_window.switch_to_auth()
+        self.main_window.logout()
+
+class AnalyticsDialog(QDialog):
+    """Сводка продаж за период.
+
+    Читает только сводные таблицы, которые поддерживаются триггерами
+    (``sales_by_product_day``, ``sales_by_user_day``), поэтому строится
+    за миллисекунды при любом числе заказов.
+    """
+
+    TOP_LIMIT = 20
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.init_ui()
+        self.load()
+
+    def init_ui(self):
+        self.setWindowTitle('Аналитика продаж')
+        self.resize(700, 500)
+
+        today = QDate.currentDate()
+        self.date_from = QDateEdit(today.addDays(-29))
+        self.date_to = QDateEdit(today)
+        for date_edit in (self.date_from, self.date_to):
+            date_edit.setCalendarPopup(True)
+            date_edit.setDisplayFormat('dd.MM.yyyy')
+            date_edit.dateChanged.connect(self.load)
+
+        period_layout = QHBoxLayout()
+        period_layout.addWidget(QLabel('С:'))
+        period_layout.addWidget(self.date_from)
+        period_layout.addWidget(QLabel('По:'))
+        period_layout.addWidget(self.date_to)
+        period_layout.addStretch()
+
+        self.totals_label = QLabel()
+
+        self.days_table = self.create_table(['День', 'Заказов', 'Штук', 'Выручка'])
+        self.products_table = self.create_table(['Товар', 'Заказов', 'Штук', 'Выручка'])
+        self.customers_table = self.create_table(['Покупатель', 'Заказов', 'Штук', 'Выручка'])
+
+        tabs = QTabWidget()
+        tabs.addTab(self.days_table, 'По дням')
+        tabs.addTab(self.products_table, 'Товары')
+        tabs.addTab(self.customers_table, 'Покупатели')
+
+        layout = QVBoxLayout()
+        layout.addLayout(period_layout)
+        layout.addWidget(self.totals_label)
+        layout.addWidget(tabs)
+        self.setLayout(layout)
+
+    @staticmethod
+    def create_table(headers):
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        table.verticalHeader().setVisible(False)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        return table
+
+    @staticmethod
+    def fill_table(table, rows):
+        table.setRowCount(len(rows))
+        for row_index, row in enumerate(rows):
+            for col_index, value in enumerate(row):
+                item = QTableWidgetItem(str(value))
+                if col_index:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                table.setItem(row_index, col_index, item)
+
+    def load(self):
+        # Дни в сводных таблицах хранятся по UTC в формате ГГГГ-ММ-ДД
+        date_from = self.date_from.date().toString(Qt.DateFormat.ISODate)
+        date_to = self.date_to.date().toString(Qt.DateFormat.ISODate)
+
+        totals = self.db.get_sales_totals(date_from, date_to)
+        self.totals_label.setText(
+            f'Заказов: {totals.orders}    Продано штук: {totals.units}    '
+            f'Выручка: {totals.revenue:.2f}'
+        )
+        self.fill_table(self.days_table, [
+            (day.key, day.orders, day.units, f'{day.revenue:.2f}')
+            for day in self.db.get_sales_by_day(date_from, date_to)
+        ])
+        self.fill_table(self.products_table, [
+            (product.name or f'Удалённый товар #{product.key}', product.orders, product.units,
+             f'{product.revenue:.2f}')
+            for product in self.db.get_top_products(date_from, date_to, self.TOP_LIMIT)
+        ])
+        self.fill_table(self.customers_table, [
+            (customer.name or f'Пользователь #{customer.key}', customer.orders, customer.units,
+             f'{customer.revenue:.2f}')
+            for customer in self.db.get_top_customers(date_from, date_to, self.TOP_LIMIT)
+        ])
+
+
+class DiagnosticsDialog(QDialog):
+    """Замеры ``diagnostics.py``: время методов базы и SQL-запросов, медленные запросы."""
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.init_ui()
+        self.load()
+
+    def init_ui(self):
+        self.setWindowTitle('Диагностика')
+        self.resize(800, 550)
+
+        self.summary_label = QLabel()
+        self.summary_label.setWordWrap(True)
+
+        columns = ['Вызовов', 'p50, мс', 'p95, мс', 'p99, мс', 'Макс., мс', 'Всего, мс']
+        self.methods_table = AnalyticsDialog.create_table(['Метод'] + columns)
+        self.statements_table = AnalyticsDialog.create_table(['Запрос'] + columns)
+        self.slow_table = AnalyticsDialog.create_table(['Время', 'мс', 'Запрос', 'План'])
+        for table in (self.statements_table, self.slow_table):
+            table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+            table.setWordWrap(True)
+
+        tabs = QTabWidget()
+        tabs.addTab(self.methods_table, 'Методы')
+        tabs.addTab(self.statements_table, 'SQL')
+        tabs.addTab(self.slow_table, 'Медленные запросы')
+
+        self.refresh_button = QPushButton('Обновить')
+        self.refresh_button.clicked.connect(self.load)
+        self.reset_button = QPushButton('Сбросить')
+        self.reset_button.clicked.connect(self.reset)
+        self.dump_button = QPushButton('Сохранить в файл')
+        self.dump_button.clicked.connect(self.dump)
+
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addWidget(self.refresh_button)
+        buttons_layout.addWidget(self.reset_button)
+        buttons_layout.addWidget(self.dump_button)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.summary_label)
+        layout.addWidget(tabs)
+        layout.addLayout(buttons_layout)
+        self.setLayout(layout)
+
+    @staticmethod
+    def timing_rows(timings):
+        return [
+            (name, stats['count'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'],
+             stats['max_ms'], stats['total_ms'])
+            for name, stats in timings.items()
+        ]
+
+    def load(self):
+        snapshot = diagnostics.snapshot(self.db)
+        if snapshot['enabled']:
+            summary = (
+                f'Данные с {snapshot["since"]} за последние {snapshot["window_seconds"] // 60} мин. '
+                f'Медленный запрос: от {snapshot["slow_query_ms"]:g} мс.'
+            )
+        else:
+            summary = 'Замеры выключены: запустите приложение с переменной WAREHOUSE_DIAGNOSTICS=1.'
+        write_stats = snapshot.get('write_stats')
+        if write_stats:
+            summary += (
+                f'\nЗаписей: {write_stats["transactions"]}, ожиданий блокировки: {write_stats["lock_waits"]} '
+                f'({write_stats["lock_wait_seconds"]:.2f} с), повторов: {write_stats["busy_retries"]}, '
+                f'отказов: {write_stats["busy_failures"]}.'
+            )
+        cache_stats = snapshot.get('cache_stats') or {}
+        if 'hits' in cache_stats:
+            summary += (
+                f'\nКэш запросов: попаданий {cache_stats["hits"]}, промахов {cache_stats["misses"]} '
+                f'({cache_stats["hit_rate"]:.0%}), вытеснено {cache_stats["evictions"]}.'
+            )
+        self.summary_label.setText(summary)
+
+        AnalyticsDialog.fill_table(self.methods_table, self.timing_rows(snapshot['methods']))
+        AnalyticsDialog.fill_table(self.statements_table, self.timing_rows(snapshot['statements']))
+        AnalyticsDialog.fill_table(self.slow_table, [
+            (entry['at'], entry['ms'], entry['sql'], '\n'.join(entry['plan']))
+            for entry in reversed(snapshot['slow_queries'])
+        ])
+        self.slow_table.resizeRowsToContents()
+
+    def reset(self):
+        diagnostics.recorder.reset()
+        self.load()
+
+    def dump(self):
+        path, _ = QFileDialog.getSaveFileName(self, 'Сохранить диагностику', 'diagnostics.json', 'JSON (*.json)')
+        if path:
+            try:
+                diagnostics.dump(path, self.db)
+            except OSError as error:
+                QMessageBox.warning(self, 'Ошибка', f'Не удалось сохранить файл: {error}')
+                return
+            QMessageBox.information(self, 'Диагностика', f'Сохранено в {path}.')
+
 
 class ProductDialog(QDialog):
     def __init__(self, product_id=None, name='', description='', price=0.0, quantity=0):
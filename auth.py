@@ -1,106 +1,71 @@
 # auth.py
 from PyQt6.QtWidgets import (
-    QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout, QMessageBox, QHBoxLayout, QGridLayout, QFrame
+    QWidget, QLabel, QLineEdit, QPushButton, QVBoxLayout, QMessageBox, QHBoxLayout, QGridLayout, QFrame,
+    QProgressBar, QApplication, QInputDialog
 )
 from PyQt6.QtCore import Qt
-from database import Database
+from database import open_database
+from workers import run_in_background, auth_pool
+
+# PIN, которым блокируется сеанс при смене пользователя
+PIN_MIN_LENGTH = 4
+
+
+def create_busy_indicator():
+    """Бесконечный индикатор загрузки, пока bcrypt работает в фоновом потоке."""
+    indicator = QProgressBar()
+    indicator.setRange(0, 0)
+    indicator.setTextVisible(False)
+    indicator.setFixedHeight(6)
+    indicator.hide()
+    return indicator
+
+
+def ask_pin(parent, title, label):
+    """Запрос PIN-кода скрытым вводом; None, если пользователь отказался."""
+    pin, ok = QInputDialog.getText(parent, title, label, QLineEdit.EchoMode.Password)
+    return pin if ok else None
+
+
+def set_busy(widgets, indicator, busy):
+    for widget in widgets:
+        widget.setEnabled(not busy)
+    indicator.setVisible(busy)
+    if busy:
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+    else:
+        QApplication.restoreOverrideCursor()
+
 
 class AuthWidget(QWidget):
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window
-        self.db = Database()
+        self._db = None
         self.init_ui()
 
+    @property
+    def db(self):
+        # База открывается при первом обращении, а не до показа первого кадра
+        if self._db is None:
+            self._db = open_database()
+        return self._db
+
     def init_ui(self):
         # Создаем метки и поля ввода
         self.login_label = QLabel('Логин:')
-        self.login_label.setStyleSheet(
-            """
-            QLabel {
-                font-size: 12px;
-                font-weight: bold;
-                color: white;
-                margin-bottom: -15px; /* Опускаем метку ближе к полю */
-            }
-            """
-        )
         self.login_input = QLineEdit()
         self.login_input.setPlaceholderText("Введите ваш логин")
-        self.login_input.setStyleSheet(
-            """
-            QLineEdit {
-                padding: 8px;
-                border: 1px solid #363636;
-                border-radius: 8px;
-                background-color: #242424;
-                color: white;
-                font-size: 12px;
-            }
-            """
-        )
 
         self.password_label = QLabel('Пароль:')
-        self.password_label.setStyleSheet(
-            """
-            QLabel {
-                font-size: 12px;
-                font-weight: bold;
-                color: white;
-                margin-bottom: -15px;
-            }
-            """
-        )
         self.password_input = QLineEdit()
         self.password_input.setEchoMode(QLineEdit.EchoMode.Password)
         self.password_input.setPlaceholderText("Введите ваш пароль")
-        self.password_input.setStyleSheet(
-            """
-            QLineEdit {
-                padding: 8px;
-                border: 1px solid #363636;
-                border-radius: 8px;
-                background-color: #242424;
-                color: white;
-                font-size: 12px;
-            }
-            """
-        )
 
         # Создаем кнопки
         self.login_button = QPushButton('Войти')
-        self.login_button.setStyleSheet(
-            """
-            QPushButton {
-                background-color: #363636;
-                color: white;
-                font-size: 12px;
-                padding: 8px 15px;
-                border-radius: 8px;
-                border: 1px solid #242424;
-            }
-            QPushButton:hover {
-                background-color: #4A4A4A;
-            }
-            """
-        )
 
         self.register_button = QPushButton('Регистрация')
-        self.register_button.setStyleSheet(
-            """
-            QPushButton {
-                background-color: #363636;
-                color: white;
-                font-size: 12px;
-                padding: 8px 15px;
-                border-radius: 8px;
-                border: 1px solid #242424;
-            }
-            QPushButton:hover {
-                background-color: #4A4A4A;
-            }
-            """
-        )
 
         # Подключаем кнопки к методам
         self.login_button.clicked.connect(self.handle_login)
@@ -120,19 +85,17 @@ class AuthWidget(QWidget):
         form_layout.addWidget(self.password_label)
         form_layout.addWidget(self.password_input)
         form_layout.addLayout(buttons_layout)
+        self.busy_indicator = create_busy_indicator()
+        form_layout.addWidget(self.busy_indicator)
+
+        # Кнопки возврата по PIN к заблокированным на этом терминале сеансам
+        self.resume_layout = QVBoxLayout()
+        self.resume_layout.setSpacing(5)
+        form_layout.addLayout(self.resume_layout)
 
         # Блок-контейнер для формы
         form_frame = QFrame()
-        form_frame.setStyleSheet(
-            """
-            QFrame {
-                background-color: #1E1E1E;
-                border-radius: 10px;
-                padding: 15px; /* Уменьшен padding для компактности */
-                max-width: 400px; /* Ограничиваем ширину блока */
-            }
-            """
-        )
+        form_frame.setObjectName('authForm')  # Оформление — в styles.qss
         form_frame.setLayout(form_layout)
 
         # Внешний слой: центрирование формы
@@ -150,147 +113,100 @@ class AuthWidget(QWidget):
             QMessageBox.warning(self, 'Ошибка', 'Пожалуйста, введите логин и пароль.')
             return
 
-        user = self.db.authenticate_user(username, password)
+        # bcrypt занимает заметное время, поэтому проверка идёт в фоновом потоке
+        self.set_busy(True)
+        run_in_background(
+            self.db.login, username, password,
+            pool=auth_pool(),
+            on_finished=self.login_finished,
+            on_failed=self.login_failed,
+        )
+
+    def set_busy(self, busy):
+        set_busy(
+            [self.login_input, self.password_input, self.login_button, self.register_button],
+            self.busy_indicator, busy,
+        )
+
+    def login_failed(self, error):
+        self.set_busy(False)
+        QMessageBox.warning(self, 'Ошибка', f'Не удалось выполнить вход: {error}')
 
+    def login_finished(self, user):
+        self.set_busy(False)
         if user:
-            role = user['role']
-            if role == 'admin':
-                self.main_window.switch_to_admin()
-            elif role == 'client':
-                self.main_window.switch_to_client(user_id=user['id'], username=user['username'])
-            else:
-                QMessageBox.warning(self, 'Ошибка', 'Неизвестная роль пользователя.')
+            self.password_input.clear()
+            self.main_window.start_session(user)
+            self.enter(user)
         else:
             QMessageBox.warning(self, 'Ошибка', 'Неправильный логин или пароль.')
 
+    def resume(self, username, token):
+        """Возврат к заблокированному сеансу по его PIN-коду, без bcrypt."""
+        pin = ask_pin(self, 'Возврат в сеанс', f'PIN сеанса {username}:')
+        if pin is None:
+            return
+        user = self.db.unlock_session(token, pin)
+        if user:
+            del self.main_window.terminal_sessions[username]
+            self.main_window.current_token = token
+            self.main_window.current_username = username
+            self.enter(user)
+        else:
+            # После нескольких неверных PIN сеанс закрывается и пропадает из списка
+            QMessageBox.warning(self, 'Ошибка', 'Неверный PIN или сеанс истёк.')
+            self.refresh_sessions()
+
+    def enter(self, user):
+        role = user.role
+        if role == 'admin':
+            self.main_window.switch_to_admin()
+        elif role == 'client':
+            self.main_window.switch_to_client(user_id=user.id, username=user.username)
+        else:
+            QMessageBox.warning(self, 'Ошибка', 'Неизвестная роль пользователя.')
+
+    def refresh_sessions(self):
+        while self.resume_layout.count():
+            self.resume_layout.takeAt(0).widget().deleteLater()
+        for username, token in list(self.main_window.terminal_sessions.items()):
+            if not self.db.is_session_locked(token):
+                del self.main_window.terminal_sessions[username]
+                continue
+            button = QPushButton(f'Продолжить как {username}')
+            button.clicked.connect(lambda checked, username=username, token=token: self.resume(username, token))
+            self.resume_layout.addWidget(button)
+
     def open_registration(self):
-        self.registration_widget = RegistrationWidget(self.main_window)
-        self.main_window.stack.addWidget(self.registration_widget)
-        self.main_window.stack.setCurrentWidget(self.registration_widget)
+        self.main_window.switch_to_registration()
 
 class RegistrationWidget(QWidget):
     def __init__(self, main_window):
         super().__init__()
         self.main_window = main_window
-        self.db = Database()
+        self.db = open_database()
         self.init_ui()
 
     def init_ui(self):
         # Создаем поля ввода с метками над ними
         self.username_label = QLabel('Логин:')
-        self.username_label.setStyleSheet(
-            """
-            QLabel {
-                font-size: 12px;
-                font-weight: bold;
-                color: white;
-                margin-bottom: -15px; /* Опустить метку ближе к полю */
-            }
-            """
-        )
         self.username_input = QLineEdit()
         self.username_input.setPlaceholderText("Введите ваш логин")
-        self.username_input.setStyleSheet(
-            """
-            QLineEdit {
-                padding: 8px;
-                border: 1px solid #363636;
-                border-radius: 8px;
-                background-color: #242424;
-                color: white;
-                font-size: 12px;
-            }
-            """
-        )
 
         self.password_label = QLabel('Пароль:')
-        self.password_label.setStyleSheet(
-            """
-            QLabel {
-                font-size: 12px;
-                font-weight: bold;
-                color: white;
-                margin-bottom: -15px;
-            }
-            """
-        )
         self.password_input = QLineEdit()
         self.password_input.setEchoMode(QLineEdit.EchoMode.Password)
         self.password_input.setPlaceholderText("Введите ваш пароль")
-        self.password_input.setStyleSheet(
-            """
-            QLineEdit {
-                padding: 8px;
-                border: 1px solid #363636;
-                border-radius: 8px;
-                background-color: #242424;
-                color: white;
-                font-size: 12px;
-            }
-            """
-        )
 
         self.confirm_password_label = QLabel('Подтвердите пароль:')
-        self.confirm_password_label.setStyleSheet(
-            """
-            QLabel {
-                font-size: 12px;
-                font-weight: bold;
-                color: white;
-                margin-bottom: -15px;
-            }
-            """
-        )
         self.confirm_password_input = QLineEdit()
         self.confirm_password_input.setEchoMode(QLineEdit.EchoMode.Password)
         self.confirm_password_input.setPlaceholderText("Введите пароль ещё раз")
-        self.confirm_password_input.setStyleSheet(
-            """
-            QLineEdit {
-                padding: 8px;
-                border: 1px solid #363636;
-                border-radius: 8px;
-                background-color: #242424;
-                color: white;
-                font-size: 12px;
-            }
-            """
-        )
 
         # Создаем кнопки
         self.register_button = QPushButton('Зарегистрироваться')
-        self.register_button.setStyleSheet(
-            """
-            QPushButton {
-                background-color: #363636;
-                color: white;
-                font-size: 12px;
-                padding: 8px 15px;
-                border-radius: 8px;
-                border: 1px solid #242424;
-            }
-            QPushButton:hover {
-                background-color: #4A4A4A;
-            }
-            """
-        )
 
         self.back_button = QPushButton('Назад')
-        self.back_button.setStyleSheet(
-            """
-            QPushButton {
-                background-color: #363636;
-                color: white;
-                font-size: 12px;
-                padding: 8px 15px;
-                border-radius: 8px;
-                border: 1px solid #242424;
-            }
-            QPushButton:hover {
-                background-color: #4A4A4A;
-            }
-            """
-        )
 
         # Подключаем кнопки к методам
         self.register_button.clicked.connect(self.handle_registration)
@@ -312,19 +228,12 @@ class RegistrationWidget(QWidget):
         form_layout.addWidget(self.confirm_password_label)
         form_layout.addWidget(self.confirm_password_input)
         form_layout.addLayout(buttons_layout)
+        self.busy_indicator = create_busy_indicator()
+        form_layout.addWidget(self.busy_indicator)
 
         # Блок-контейнер для формы
         form_frame = QFrame()
-        form_frame.setStyleSheet(
-            """
-            QFrame {
-                background-color: #1E1E1E;
-                border-radius: 10px;
-                padding: 15px; /* Уменьшен padding для компактности */
-                max-width: 400px; /* Ограничиваем ширину блока */
-            }
-            """
-        )
+        form_frame.setObjectName('authForm')  # Оформление — в styles.qss
         form_frame.setLayout(form_layout)
 
         # Внешний слой: центрирование формы
@@ -333,6 +242,12 @@ class RegistrationWidget(QWidget):
         main_layout.setAlignment(Qt.AlignmentFlag.AlignCenter)
         self.setLayout(main_layout)
 
+    def refresh(self):
+        """Повторный показ экрана: форма начинается с чистого листа."""
+        self.username_input.clear()
+        self.password_input.clear()
+        self.confirm_password_input.clear()
+
     def handle_registration(self):
         username = self.username_input.text().strip()
         password = self.password_input.text()
@@ -358,11 +273,32 @@ class RegistrationWidget(QWidget):
         # Additional password strength checks can be added here
         # For example, checking for numbers, uppercase letters, etc.
 
-        if self.db.add_user(username, password):
+        self.set_busy(True)
+        run_in_background(
+            self.db.add_user, username, password,
+            pool=auth_pool(),
+            on_finished=self.registration_finished,
+            on_failed=self.registration_failed,
+        )
+
+    def set_busy(self, busy):
+        set_busy(
+            [self.username_input, self.password_input, self.confirm_password_input,
+             self.register_button, self.back_button],
+            self.busy_indicator, busy,
+        )
+
+    def registration_failed(self, error):
+        self.set_busy(False)
+        QMessageBox.warning(self, 'Ошибка', f'Не удалось зарегистрироваться: {error}')
+
+    def registration_finished(self, created):
+        self.set_busy(False)
+        if created:
             QMessageBox.information(self, 'Успех', 'Вы успешно зарегистрировались!')
             self.go_back()
         else:
             QMessageBox.warning(self, 'Ошибка', 'Пользователь с таким логином уже существует.')
 
     def go_back(self):
-        self.main_window.stack.setCurrentWidget(self.main_window.auth_widget)
\ No newline at end of file
+        self.main_window.switch_to_auth()
\ No newline at end of file
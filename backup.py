@@ -0,0 +1,584 @@
+# backup.py
+"""Резервные копии базы во время работы магазина.
+
+Копия снимается SQLite online backup API (``sqlite3.Connection.backup``)
+порциями по ``WAREHOUSE_BACKUP_PAGES`` страниц с паузой между порциями.
+Каждая порция держит базу лишь на время своего шага, поэтому терминалы
+продолжают оформлять заказы, пока копируется даже многогигабайтная база.
+Копирование идёт через соединение записи процесса
+(``ConnectionManager.backup``), каждый шаг — под его замком записи: то, что
+процесс записывает между шагами, попадает в копию без перезапуска. Запись из другого процесса
+начинает копирование заново; после ``WAREHOUSE_BACKUP_MAX_RESTARTS``
+перезапусков копия снимается одним шагом через отдельное соединение чтения —
+в режиме WAL оно тоже не задерживает запись.
+
+Копии базы и архива заказов складываются в ``WAREHOUSE_BACKUP_DIR`` под
+именами ``<база>-ГГГГММДД-ЧЧММСС-микросекунды.db`` (время UTC, ``.db.gz`` со
+сжатием); уже существующая копия никогда не перезаписывается.
+
+Использование из командной строки::
+
+    python backup.py create
+    python backup.py list
+    python backup.py verify backups/app-20261018-120000-000000.db.gz
+    python backup.py restore backups/app-20261018-120000-000000.db.gz \
+        --archive backups/app-archive-20261018-120001-000000.db.gz
+"""
+import argparse
+import contextlib
+import datetime
+import gzip
+import logging
+import os
+import random
+import re
+import shutil
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from urllib.request import pathname2url
+
+import settings
+from database import ConnectionManager, archive_db_path, is_busy
+
+logger = logging.getLogger(__name__)
+
+# Микросекунды в имени: копии, снятые в одну секунду, не совпадают
+STAMP_FORMAT = '%Y%m%d-%H%M%S-%f'
+# Копии прежних версий названы без микросекунд
+BACKUP_NAME = re.compile(r'^(?P<stem>.+)-(?P<stamp>\d{8}-\d{6}(?:-\d{6})?)\.db(?:\.gz)?$')
+COMPRESS_LEVEL = 6
+CHUNK_SIZE = 1024 * 1024
+# Первая копия по расписанию — не сразу после запуска, когда идёт вход
+FIRST_BACKUP_DELAY = 60  # секунд
+# Случайная добавка к ожиданию: терминалы не приходят к каталогу копий одновременно
+SCHEDULE_JITTER = 30  # секунд
+# Пока копию снимает другой терминал, проверять снова через столько секунд
+LOCK_RETRY = 60
+# Замок каталога копий, который не обновлялся столько секунд, оставлен упавшим процессом
+LOCK_STALE = 10 * 60
+LOCK_NAME = '.backup.lock'
+
+
+class BackupCancelled(Exception):
+    """Копирование прервано (``should_stop``), незаконченный файл удалён."""
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+class BackupReport:
+    """Итог одной резервной копии."""
+
+    def __init__(self, source, path):
+        self.source = source
+        self.path = path
+        self.pages = 0
+        self.steps = 0
+        self.restarts = 0
+        self.size = 0
+        self.problems = None  # результат check_database; None — копия не проверялась
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def summary(self):
+        if self.problems is None:
+            checked = ''
+        else:
+            checked = ', проверена' if not self.problems else ', ПОВРЕЖДЕНА'
+        return (f'{self.path}: {self.pages} страниц, {self.size / 1024 / 1024:.1f} МБ '
+                f'за {self.elapsed:.1f} с, перезапусков {self.restarts}{checked}')
+
+
+def _stem(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def list_backups(directory=None, source=None):
+    """Копии в каталоге от старых к новым; ``source`` — только копии этого файла базы."""
+    directory = directory or settings.BACKUP_DIR
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    backups = []
+    for name in names:
+        match = BACKUP_NAME.match(name)
+        if match and (source is None or match.group('stem') == _stem(source)):
+            backups.append((match.group('stamp'), name))
+    return [os.path.join(directory, name) for _, name in sorted(backups)]
+
+
+def prune_backups(directory=None, source=None, keep=None):
+    """Удаляет старые копии файла ``source``, оставляя ``keep`` новейших. Возвращает удалённые пути."""
+    keep = settings.BACKUP_KEEP if keep is None else keep
+    backups = list_backups(directory, source)
+    removed = backups[:-keep] if keep > 0 else backups
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def backup_database(path=None, directory=None, name='main', compress=None, verify=None,
+                    pages=None, pause=None, progress=None, should_stop=None):
+    """Снимает копию базы ``path`` (``name='archive'`` — её архива заказов) в каталог ``directory``.
+
+    ``progress(report, remaining, total)`` вызывается после каждого шага,
+    ``should_stop()`` проверяется между шагами. Возвращает ``BackupReport``
+    или None, если архива ещё нет.
+    """
+    path = path or settings.DB_PATH
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'Нет базы данных {path}')
+    manager = ConnectionManager.instance(path)
+    source = manager.archive_path if name == 'archive' else manager.path
+    directory = directory or settings.BACKUP_DIR
+    compress = settings.BACKUP_COMPRESS if compress is None else compress
+    verify = settings.BACKUP_VERIFY if verify is None else verify
+    if name == 'archive' and not os.path.exists(source):
+        return None
+
+    os.makedirs(directory, exist_ok=True)
+    started = _now()
+    report = BackupReport(source, None)
+    # Незаконченная копия не должна выглядеть как готовая; уникальные
+    # временные имена не сталкиваются с копированием, идущим параллельно
+    partial = _temporary(directory, f'.{_stem(source)}-', '.db.part')
+    packed = _temporary(directory, f'.{_stem(source)}-', '.db.part.gz')
+    try:
+        try:
+            _copy(manager, name, partial, report, pages, pause, progress, should_stop)
+        except _TooManyRestarts:
+            logger.info('backup of %s restarted %d times, copying in one step', source, report.restarts)
+            _remove(partial)
+            _copy_at_once(source, partial)
+        if verify:
+            report.problems = check_database(partial)
+        if compress:
+            _compress(partial, packed)
+        report.path = _publish(packed if compress else partial, directory, _stem(source),
+                               '.db.gz' if compress else '.db', started)
+    finally:
+        for leftover in (partial, packed):
+            _remove(leftover)
+    target = report.path
+    report.size = os.path.getsize(target)
+    report.elapsed = time.perf_counter() - report.started
+    if report.problems:
+        logger.error('backup %s failed the integrity check: %s', target, '; '.join(report.problems[:5]))
+    else:
+        logger.info('backup %s', report.summary())
+    return report
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def _temporary(directory, prefix, suffix):
+    handle, path = tempfile.mkstemp(suffix=suffix, prefix=prefix, dir=directory)
+    os.close(handle)
+    return path
+
+
+def _publish(path, directory, stem, suffix, stamp):
+    """Даёт готовому файлу имя копии, не перезаписывая существующую; возвращает новый путь.
+
+    Имя занимается жёсткой ссылкой, которая не создаётся поверх
+    существующего файла. Если имя занято, берётся отметка текущего времени.
+    """
+    while True:
+        target = os.path.join(directory, f'{stem}-{stamp.strftime(STAMP_FORMAT)}{suffix}')
+        try:
+            os.link(path, target)
+        except FileExistsError:
+            pass
+        except OSError:
+            # Файловая система без жёстких ссылок
+            if not os.path.exists(target):
+                os.replace(path, target)
+                return target
+        else:
+            os.remove(path)
+            return target
+        stamp = max(_now(), stamp + datetime.timedelta(microseconds=1))
+
+
+def _copy(manager, name, partial, report, pages, pause, progress, should_stop):
+    pages = settings.BACKUP_PAGES if pages is None else pages
+    pause = (settings.BACKUP_PAUSE if pause is None else pause) / 1000
+    copied = [0]
+
+    def on_step(status, remaining, total):
+        if should_stop is not None and should_stop():
+            raise BackupCancelled()
+        done = total - remaining
+        if done < copied[0]:
+            # Базу изменило другое соединение: SQLite начал копирование сначала
+            report.restarts += 1
+            if report.restarts > settings.BACKUP_MAX_RESTARTS:
+                raise _TooManyRestarts()
+        copied[0] = done
+        report.steps += 1
+        report.pages = total
+        if progress is not None:
+            progress(report, remaining, total)
+        if remaining:
+            time.sleep(pause)
+
+    target = sqlite3.connect(partial)
+    try:
+        manager.backup(target, name, pages=pages, progress=on_step)
+    finally:
+        target.close()
+
+
+def _copy_at_once(source, partial):
+    # Один шаг — одна транзакция чтения: снимок согласован, а запись в WAL не ждёт
+    conn = sqlite3.connect(source, timeout=settings.DB_BUSY_TIMEOUT / 1000)
+    target = sqlite3.connect(partial)
+    try:
+        conn.backup(target)
+    finally:
+        target.close()
+        conn.close()
+
+
+def _compress(source, target):
+    with open(source, 'rb') as src, gzip.open(target, 'wb', compresslevel=COMPRESS_LEVEL) as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+def _remove(path):
+    for leftover in (path, path + '-journal', path + '-wal', path + '-shm'):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(leftover)
+
+
+def _open_read_only(path):
+    # immutable: файл копии никто не меняет, SQLite не создаёт рядом -wal и -shm
+    return sqlite3.connect('file:' + pathname2url(os.path.abspath(path)) + '?immutable=1', uri=True)
+
+
+@contextlib.contextmanager
+def _unpacked(path):
+    """Путь к файлу базы копии; сжатая копия распаковывается во временный файл рядом."""
+    if not path.endswith('.gz') or not os.path.isfile(path):
+        yield path
+        return
+    handle, temporary = tempfile.mkstemp(suffix='.db', dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(handle, 'wb') as dst, gzip.open(path, 'rb') as src:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+        yield temporary
+    finally:
+        _remove(temporary)
+
+
+def check_database(path):
+    """``PRAGMA integrity_check`` файла базы; пустой список, если повреждений нет."""
+    if not os.path.isfile(path):
+        return [f'Нет файла {path}']
+    try:
+        conn = _open_read_only(path)
+        try:
+            rows = [row[0] for row in conn.execute('PRAGMA integrity_check')]
+            tables = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as error:
+        return [str(error)]
+    if rows != ['ok']:
+        return rows
+    # Пустой файл SQLite тоже считает целой базой
+    return [] if tables else ['В базе нет ни одной таблицы']
+
+
+def verify_backup(path):
+    """Проверяет копию, в том числе сжатую; пустой список, если она цела."""
+    try:
+        with _unpacked(path) as db_path:
+            return check_database(db_path)
+    except (OSError, EOFError, zlib.error) as error:
+        return [str(error)]
+
+
+def restore_backup(path, db_path=None, directory=None, archive=None, keep_archive=False):
+    """Заменяет содержимое базы ``db_path`` копией ``path``, а её архива заказов — копией ``archive``.
+
+    База и архив восстанавливаются вместе: иначе заказы, перенесённые в
+    архив после снятия копии, оказались бы и в базе, и в архиве. Без
+    ``archive`` существующий архив остаётся как есть, только если передан
+    ``keep_archive``, иначе — ``ValueError``.
+
+    Копии сначала проверяются (``ValueError``, если они повреждены). Пока
+    базу или архив держит открытыми кто-нибудь — терминал, сервер или этот
+    же процесс, — восстановление отказывается (тоже ``ValueError``). Текущие
+    файлы сохраняются обычными резервными копиями; возвращается список их путей.
+    """
+    db_path = db_path or settings.DB_PATH
+    directory = directory or settings.BACKUP_DIR
+    archive_path = archive_db_path(db_path)
+    if archive is None and os.path.exists(archive_path) and not keep_archive:
+        raise ValueError(f'Укажите копию архива заказов {archive_path} или оставьте архив как есть')
+    restores = [(path, db_path)]
+    if archive is not None:
+        restores.append((archive, archive_path))
+    for backup_path, _ in restores:
+        problems = verify_backup(backup_path)
+        if problems:
+            raise ValueError(f'Копия {backup_path} повреждена: ' + '; '.join(problems[:5]))
+
+    saved = []
+    with contextlib.ExitStack() as stack:
+        # Сначала берутся все файлы, потом меняется любой из них
+        targets = []
+        for backup_path, target_path in restores:
+            existed = os.path.exists(target_path)
+            targets.append((backup_path, target_path, existed, stack.enter_context(_exclusive(target_path))))
+        for backup_path, target_path, existed, target in targets:
+            if existed:
+                saved.append(_save_current(target, target_path, directory))
+            with _unpacked(backup_path) as source_path:
+                source = _open_read_only(source_path)
+                try:
+                    source.backup(target)
+                finally:
+                    source.close()
+    return saved
+
+
+@contextlib.contextmanager
+def _exclusive(path):
+    """Соединение, которое держит файл базы ``path`` один; ``ValueError``, если базу уже открыли.
+
+    В режиме WAL исключительная блокировка не берётся, пока файл открыт
+    хоть одним соединением, даже бездействующим.
+    """
+    conn = sqlite3.connect(path, timeout=0, isolation_level=None)
+    try:
+        try:
+            conn.execute('PRAGMA locking_mode=EXCLUSIVE')
+            conn.execute('BEGIN EXCLUSIVE')
+            conn.execute('ROLLBACK')
+        except sqlite3.OperationalError as error:
+            if not is_busy(error):
+                raise
+            raise ValueError(f'База {path} открыта: закройте терминалы и сервер перед восстановлением') from None
+        yield conn
+    finally:
+        conn.close()
+
+
+def _save_current(conn, path, directory):
+    # Прежнее содержимое файла — обычной копией в каталоге копий
+    os.makedirs(directory, exist_ok=True)
+    started = _now()
+    partial = _temporary(directory, f'.{_stem(path)}-', '.db.part')
+    try:
+        target = sqlite3.connect(partial)
+        try:
+            conn.backup(target)
+        finally:
+            target.close()
+        return _publish(partial, directory, _stem(path), '.db', started)
+    finally:
+        _remove(partial)
+
+
+class BackupLock:
+    """Исключительный замок каталога копий между процессами и терминалами.
+
+    Замок — файл ``.backup.lock``, созданный с ``O_CREAT | O_EXCL``: так он
+    работает и в общем сетевом каталоге. Владелец обновляет время файла
+    (``touch``) во время копирования; замок, который не обновлялся
+    ``LOCK_STALE`` секунд, считается брошенным и снимается.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, LOCK_NAME)
+
+    def acquire(self):
+        """True, если замок взят; False, если его держит другой."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        for _ in range(2):
+            try:
+                handle = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._stale():
+                    return False
+                logger.warning('removing stale backup lock %s', self.path)
+                self.release()
+                continue
+            with os.fdopen(handle, 'w') as lock_file:
+                lock_file.write(f'{socket.gethostname()} {os.getpid()}\n')
+            return True
+        return False
+
+    def touch(self):
+        with contextlib.suppress(OSError):
+            os.utime(self.path)
+
+    def release(self):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.path)
+
+    def _stale(self):
+        try:
+            return time.time() - os.path.getmtime(self.path) > LOCK_STALE
+        except FileNotFoundError:
+            return True
+
+
+class BackupScheduler:
+    """Резервные копии по расписанию в фоновом потоке.
+
+    Раз в ``interval`` секунд снимает копии базы и её архива и удаляет
+    лишние старые. Срок отсчитывается от новейшей копии в каталоге, а
+    копирует только терминал, взявший замок каталога (``BackupLock``) и
+    убедившийся под ним, что срок всё ещё подошёл, — несколько терминалов с
+    одной базой не снимают каждый свою копию.
+    """
+
+    def __init__(self, path=None, interval=None, directory=None, keep=None, first_delay=FIRST_BACKUP_DELAY):
+        self.path = path or settings.DB_PATH
+        self.interval = settings.BACKUP_INTERVAL if interval is None else interval
+        self.directory = directory or settings.BACKUP_DIR
+        self.keep = keep
+        self.first_delay = first_delay
+        self.reports = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='backup', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Останавливает расписание; копирование, которое идёт сейчас, прерывается."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def seconds_until_due(self):
+        backups = list_backups(self.directory, self.path)
+        if not backups:
+            return 0.0
+        return max(0.0, os.path.getmtime(backups[-1]) + self.interval - time.time())
+
+    def run_once(self, progress=None):
+        """Копии базы и архива сейчас; возвращает их ``BackupReport``."""
+        reports = []
+        for name in ('main', 'archive'):
+            report = backup_database(self.path, self.directory, name=name, progress=progress,
+                                     should_stop=self._stop.is_set)
+            if report is not None:
+                prune_backups(self.directory, report.source, self.keep)
+                reports.append(report)
+        self.reports = reports
+        return reports
+
+    def run_if_due(self):
+        """Снимает копии, если срок подошёл и их не снимает другой терминал.
+
+        Возвращает, через сколько секунд проверить снова.
+        """
+        delay = self.seconds_until_due()
+        if delay:
+            return delay
+        lock = BackupLock(self.directory)
+        if not lock.acquire():
+            return LOCK_RETRY
+        try:
+            # Пока ждали замок, копию мог снять другой терминал
+            delay = self.seconds_until_due()
+            if delay:
+                return delay
+            self.run_once(progress=lambda report, remaining, total: lock.touch())
+        finally:
+            lock.release()
+        return self.seconds_until_due() or self.interval
+
+    def _run(self):
+        delay = max(self.first_delay, self.seconds_until_due())
+        while not self._stop.wait(delay + random.uniform(0, SCHEDULE_JITTER)):
+            try:
+                delay = self.run_if_due()
+            except BackupCancelled:
+                return
+            except Exception:
+                logger.exception('scheduled backup failed')
+                delay = self.interval
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Резервные копии базы магазина.')
+    parser.add_argument('--db', help='путь к файлу базы данных')
+    parser.add_argument('--dir', help='каталог копий')
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help='снять копию базы и архива заказов')
+    create.add_argument('--compress', action='store_true', default=None, help='сжать копию gzip')
+    create.add_argument('--keep', type=int, help='сколько новейших копий оставить')
+    commands.add_parser('list', help='показать копии')
+    verify = commands.add_parser('verify', help='проверить целостность копий')
+    verify.add_argument('paths', nargs='+')
+    restore = commands.add_parser('restore', help='восстановить базу и архив заказов из копий')
+    restore.add_argument('path')
+    restore.add_argument('--archive', help='копия архива заказов')
+    restore.add_argument('--keep-archive', action='store_true', help='оставить текущий архив как есть')
+    args = parser.parse_args(argv)
+
+    if args.command == 'create':
+        def show(report, remaining, total):
+            print(f'\r{report.source}: {100 * (total - remaining) // max(total, 1)}%',
+                  end='' if remaining else '\n', file=sys.stderr, flush=True)
+
+        failed = False
+        for name in ('main', 'archive'):
+            try:
+                report = backup_database(args.db, args.dir, name=name, compress=args.compress, progress=show)
+            except FileNotFoundError as error:
+                print(error, file=sys.stderr)
+                return 1
+            if report is None:
+                continue
+            print(report.summary())
+            failed = failed or bool(report.problems)
+            for path in prune_backups(args.dir, report.source, args.keep):
+                print(f'удалена старая копия {path}')
+        return 1 if failed else 0
+
+    if args.command == 'list':
+        for path in list_backups(args.dir):
+            print(f'{path}\t{os.path.getsize(path) / 1024 / 1024:.1f} МБ')
+        return 0
+
+    if args.command == 'verify':
+        failed = False
+        for path in args.paths:
+            problems = verify_backup(path)
+            print(f'{path}: ' + ('в порядке' if not problems else '; '.join(problems[:5])))
+            failed = failed or bool(problems)
+        return 1 if failed else 0
+
+    try:
+        saved = restore_backup(args.path, args.db, args.dir, args.archive, args.keep_archive)
+    except (ValueError, OSError) as error:
+        print(error, file=sys.stderr)
+        return 1
+    for path in saved:
+        print(f'Прежнее содержимое сохранено в {path}')
+    print(f'База {args.db or settings.DB_PATH} восстановлена из {args.path}')
+    if args.archive:
+        print(f'Архив заказов восстановлен из {args.archive}')
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    sys.exit(main())
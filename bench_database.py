@@ -0,0 +1,326 @@
+# bench_database.py
+"""Замер скорости операций ``Database`` на синтетических данных разного объёма.
+
+Для каждого масштаба (число товаров и заказов) создаётся временная база,
+заполняется детерминированным генератором (одинаковый ``--seed`` даёт
+одинаковые данные) и каждая операция выполняется ``--repeat`` раз.
+Результат — JSON с перцентилями задержки и пропускной способностью по
+каждой операции; его можно сохранить (``--output``) и сравнить со
+следующим прогоном (``--compare``), чтобы поймать регрессию до релиза.
+
+    python bench_database.py --scales 10000,100000 --output bench.json
+    python bench_database.py --scales 10000,100000 --compare bench.json --tolerance 0.25
+
+Кэш запросов (``query_cache.py``) на время замера выключен, иначе
+повторные чтения измеряли бы словарь, а не базу; ``--with-cache``
+оставляет его включённым.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import bcrypt
+
+from database import ConnectionManager, Database, configure_database, encode_cursor
+from query_cache import QueryCache
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_SCALES = '10000,100000'
+DEFAULT_REPEAT = 200
+# Операции, читающие всю таблицу, на больших масштабах повторяются реже
+FULL_SCAN_REPEAT = 5
+GENERATE_BATCH = 20000
+PASSWORD = 'bench-password'
+
+ADJECTIVES = [
+    'красный', 'синий', 'большой', 'малый', 'тёплый', 'лёгкий', 'прочный', 'складной',
+    'кожаный', 'детский', 'садовый', 'кухонный', 'зимний', 'летний', 'матовый', 'глянцевый',
+]
+NOUNS = [
+    'стул', 'стол', 'чайник', 'фонарь', 'рюкзак', 'зонт', 'ковёр', 'нож', 'молоток', 'шарф',
+    'чехол', 'кабель', 'коврик', 'термос', 'кресло', 'плед', 'ящик', 'таймер', 'ведро', 'лоток',
+]
+# Типичные запросы покупателей: начала слов из словаря генератора
+SEARCH_TERMS = ['ст', 'чай', 'фон', 'рюк', 'зон', 'кожаный', 'садовый стул', 'тер', 'кабель', 'плед']
+
+
+class Dataset:
+    """Что сгенерировано: диапазоны id для выбора аргументов операций."""
+
+    def __init__(self, users, products, orders, first_user=1):
+        self.users = users
+        self.products = products
+        self.orders = orders
+        self.user_ids = range(first_user, first_user + users)
+        self.usernames = [f'user{n}' for n in range(1, users + 1)]
+
+
+def product_rows(rng, count):
+    for n in range(count):
+        adjective, noun = rng.choice(ADJECTIVES), rng.choice(NOUNS)
+        yield (
+            f'{adjective.capitalize()} {noun} {n}',
+            f'{noun.capitalize()}: {rng.choice(ADJECTIVES)}, артикул {rng.randrange(10 ** 6):06d}',
+            round(rng.uniform(10, 5000), 2),
+            rng.randrange(1000, 100000),
+        )
+
+
+def generate_dataset(db, products, orders=None, users=None, seed=1):
+    """Заполнить пустую базу: ``products`` товаров, ``orders`` заказов, ``users`` клиентов.
+
+    Пишет прямо в таблицы пакетами (триггеры FTS, ``change_log`` и сводок
+    продаж срабатывают как обычно). У всех клиентов пароль ``PASSWORD``;
+    хеш вычисляется один раз с минимальной сложностью bcrypt.
+    """
+    rng = random.Random(seed)
+    orders = products if orders is None else orders
+    users = max(10, products // 100) if users is None else users
+    password_hash = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=4))
+
+    with db.manager.writer() as conn:
+        first_user = conn.execute('SELECT COALESCE(MAX(id), 0) FROM users').fetchone()[0] + 1
+        conn.executemany(
+            "INSERT INTO users (username, password, role) VALUES (?, ?, 'client')",
+            ((f'user{n}', password_hash) for n in range(1, users + 1)),
+        )
+    user_ids = range(first_user, first_user + users)
+
+    rows = product_rows(rng, products)
+    while True:
+        batch = [row for _, row in zip(range(GENERATE_BATCH), rows)]
+        if not batch:
+            break
+        with db.manager.writer() as conn:
+            conn.executemany(
+                'INSERT INTO products (name, description, price, quantity) VALUES (?, ?, ?, ?)', batch
+            )
+
+    # Заказы за последний год, у активных клиентов их больше
+    started = datetime.datetime(2026, 1, 1)
+    remaining = orders
+    while remaining:
+        batch = []
+        for _ in range(min(GENERATE_BATCH, remaining)):
+            quantity = rng.randint(1, 5)
+            created = started + datetime.timedelta(seconds=rng.randrange(365 * 24 * 3600))
+            batch.append((
+                user_ids[int(users * rng.random() ** 2)],
+                rng.randint(1, products),
+                quantity,
+                round(quantity * rng.uniform(10, 5000), 2),
+                created.strftime('%Y-%m-%d %H:%M:%S'),
+            ))
+        with db.manager.writer() as conn:
+            conn.executemany('''
+                INSERT INTO orders (user_id, product_id, quantity, total_price, created_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', batch)
+        remaining -= len(batch)
+
+    with db.manager.writer() as conn:
+        conn.execute('ANALYZE')
+    return Dataset(users, products, orders, first_user)
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль по ближайшему рангу из отсортированного списка."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed):
+    """Сводка по списку задержек (секунды) и общему времени прогона."""
+    values = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        'count': len(values),
+        'ops_per_sec': round(len(values) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': ms(sum(values) / len(values)) if values else 0.0,
+        'p50_ms': ms(percentile(values, 0.50)),
+        'p90_ms': ms(percentile(values, 0.90)),
+        'p95_ms': ms(percentile(values, 0.95)),
+        'p99_ms': ms(percentile(values, 0.99)),
+        'max_ms': ms(values[-1]) if values else 0.0,
+    }
+
+
+def measure(operation, arguments):
+    """Выполнить ``operation(*args)`` для каждого набора аргументов и вернуть сводку."""
+    latencies = []
+    started = time.perf_counter()
+    for args in arguments:
+        call_started = time.perf_counter()
+        operation(*args)
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def benchmark_operations(db, dataset, repeat, rng):
+    """(имя, функция, список аргументов) для каждой замеряемой операции."""
+    user_id = lambda: rng.choice(dataset.user_ids)
+    product_id = lambda: rng.randint(1, dataset.products)
+    random_cursor = lambda total: encode_cursor(rng.randint(1, total)) if rng.random() < 0.9 else None
+    full_scan = min(repeat, FULL_SCAN_REPEAT) if dataset.products > 10000 else repeat
+
+    operations = [
+        ('get_products', db.get_products, [()] * full_scan),
+        ('get_products_page', db.get_products_page,
+         [(random_cursor(dataset.products),) for _ in range(repeat)]),
+        ('search_products', db.search_products, [(rng.choice(SEARCH_TERMS),) for _ in range(full_scan)]),
+        ('search_products_page', db.search_products_page,
+         [(rng.choice(SEARCH_TERMS),) for _ in range(repeat)]),
+        ('get_products_by_ids', db.get_products_by_ids,
+         [([product_id() for _ in range(20)],) for _ in range(repeat)]),
+        ('get_orders_by_user', db.get_orders_by_user, [(user_id(),) for _ in range(repeat)]),
+        ('get_orders_by_user_page', db.get_orders_by_user_page, [(user_id(),) for _ in range(repeat)]),
+        ('get_all_orders', db.get_all_orders, [()] * full_scan),
+        ('get_all_orders_page', db.get_all_orders_page,
+         [(random_cursor(dataset.orders),) for _ in range(repeat)]),
+        ('get_placed_orders_page', db.get_placed_orders_page,
+         [(random_cursor(dataset.orders),) for _ in range(repeat)]),
+        ('get_sales_totals', db.get_sales_totals, [('2026-01-01', '2026-12-31')] * repeat),
+        ('get_top_products', db.get_top_products, [('2026-06-01', '2026-06-30')] * repeat),
+    ]
+    yield from operations
+
+    # Записи: заказы, затем отмена заказов, созданных этим замером
+    yield 'place_order', db.place_order, [(user_id(), product_id(), 1) for _ in range(repeat)]
+    yield 'checkout', db.checkout, [
+        (user_id(), [(product_id(), 1) for _ in range(3)]) for _ in range(repeat)
+    ]
+    placed = db.conn.execute(
+        'SELECT id FROM orders WHERE id > ? ORDER BY id LIMIT ?', (dataset.orders, repeat)
+    ).fetchall()
+    yield 'cancel_order', db.cancel_order, [(order_id,) for order_id, in placed]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_scale(scale, repeat, seed, with_cache, workdir):
+    path = os.path.join(workdir, f'bench_{scale}.db')
+    configure_database(path)
+    db = Database(path)
+    if not with_cache:
+        db.manager.cache = QueryCache(max_entries=0)
+
+    started = time.perf_counter()
+    dataset = generate_dataset(db, scale, seed=seed)
+    generated = time.perf_counter() - started
+    print(f'[{scale}] данные созданы за {generated:.1f} с', file=sys.stderr)
+
+    rng = random.Random(seed)
+    results = {}
+    for name, operation, arguments in benchmark_operations(db, dataset, repeat, rng):
+        results[name] = measure(operation, arguments)
+        print(f'[{scale}] {name}: p50 {results[name]["p50_ms"]} мс, '
+              f'p95 {results[name]["p95_ms"]} мс', file=sys.stderr)
+
+    ConnectionManager.close_all()
+    return {
+        'users': dataset.users,
+        'products': dataset.products,
+        'orders': dataset.orders,
+        'generate_seconds': round(generated, 2),
+        'db_bytes': os.path.getsize(path),
+        'operations': results,
+    }
+
+
+def compare(report, baseline, tolerance, metric='p50_ms'):
+    """Операции, у которых ``metric`` вырос больше чем на ``tolerance`` (доля) относительно базового прогона."""
+    regressions = []
+    for scale, current in report['scales'].items():
+        previous = baseline.get('scales', {}).get(scale)
+        if previous is None:
+            continue
+        for name, stats in current['operations'].items():
+            before = previous['operations'].get(name, {}).get(metric)
+            if before and stats[metric] > before * (1 + tolerance):
+                regressions.append({
+                    'scale': scale, 'operation': name, 'metric': metric,
+                    'baseline': before, 'current': stats[metric],
+                    'change': round(stats[metric] / before - 1, 3),
+                })
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Замер операций базы данных на синтетических данных.')
+    parser.add_argument('--scales', default=DEFAULT_SCALES,
+                        help='число товаров и заказов через запятую, например 10000,100000,1000000')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='повторов каждой операции')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--with-cache', action='store_true', help='не выключать кэш запросов')
+    parser.add_argument('--output', help='сохранить JSON-отчёт в файл')
+    parser.add_argument('--compare', help='JSON-отчёт прошлого прогона для поиска регрессий')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='допустимый рост p50 относительно --compare (доля); при превышении код возврата 1')
+    parser.add_argument('--keep-db', action='store_true', help='не удалять временные базы')
+    args = parser.parse_args(argv)
+
+    scales = [int(scale) for scale in args.scales.split(',') if scale.strip()]
+    workdir = tempfile.mkdtemp(prefix='warehouse-bench-')
+    try:
+        report = {
+            'meta': {
+                'revision': git_revision(),
+                'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+                'seed': args.seed,
+                'repeat': args.repeat,
+                'query_cache': args.with_cache,
+            },
+            'scales': {
+                str(scale): run_scale(scale, args.repeat, args.seed, args.with_cache, workdir)
+                for scale in scales
+            },
+        }
+    finally:
+        if args.keep_db:
+            print(f'Базы сохранены в {workdir}', file=sys.stderr)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    status = 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['regressions'] = compare(report, baseline, args.tolerance)
+        if report['regressions']:
+            status = 1
+            for regression in report['regressions']:
+                print(f"Регрессия: {regression['operation']} на {regression['scale']}: "
+                      f"{regression['baseline']} -> {regression['current']} мс", file=sys.stderr)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+# bench_startup.py
+"""Повторяемый замер холодного старта: время до первого кадра окна входа.
+
+Каждый прогон запускает ``main.py`` в отдельном процессе с переменной
+``WAREHOUSE_STARTUP_PROBE``; приложение само сообщает время от начала
+импорта ``main.py`` до первой отрисовки и завершается. Дополнительно
+измеряется полное время процесса вместе с запуском интерпретатора.
+
+    python bench_startup.py --runs 10 --budget-ms 800
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_once():
+    env = dict(os.environ, WAREHOUSE_STARTUP_PROBE='1')
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'main.py')],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=60,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    for line in result.stdout.splitlines():
+        if line.startswith('STARTUP_PROBE '):
+            probe = json.loads(line[len('STARTUP_PROBE '):])
+            return probe['first_frame_ms'], wall_ms
+    raise RuntimeError(f'main.py не сообщил время первого кадра:\n{result.stderr}')
+
+
+def summarize(values):
+    return {
+        'min': round(min(values), 2),
+        'median': round(statistics.median(values), 2),
+        'max': round(max(values), 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Замер времени до первого кадра.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, help='порог медианы first_frame_ms; при превышении код возврата 1')
+    args = parser.parse_args(argv)
+
+    first_frame, wall = [], []
+    for _ in range(args.runs):
+        frame_ms, wall_ms = run_once()
+        first_frame.append(frame_ms)
+        wall.append(wall_ms)
+
+    report = {
+        'runs': args.runs,
+        'first_frame_ms': summarize(first_frame),
+        'process_wall_ms': summarize(wall),
+    }
+    print(json.dumps(report, indent=2))
+    if args.budget_ms is not None and report['first_frame_ms']['median'] > args.budget_ms:
+        print(f"Превышен бюджет старта: {report['first_frame_ms']['median']} > {args.budget_ms} мс", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
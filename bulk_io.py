@@ -0,0 +1,184 @@
+# bulk_io.py
+"""Потоковый импорт и экспорт каталога товаров в CSV и JSON Lines.
+
+Использование из командной строки::
+
+    python bulk_io.py import supplier.csv
+    python bulk_io.py export catalog.jsonl
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+
+from database import Database
+
+BATCH_SIZE = 1000
+FIELDS = ['id', 'name', 'description', 'price', 'quantity']
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+
+class ImportReport:
+    """Итог (или промежуточное состояние) импорта."""
+
+    def __init__(self):
+        self.imported = 0
+        self.rejected = []  # (номер строки, причина)
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (f'Импортировано: {self.imported}, отклонено: {len(self.rejected)}, '
+                f'{self.rows_per_second:.0f} строк/с')
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    for suffix, name in FORMATS.items():
+        if path.lower().endswith(suffix):
+            return name
+    raise ValueError(f'Не удалось определить формат файла: {path}')
+
+
+def read_records(path, fmt=None):
+    """Построчно читает файл, выдавая (номер строки, словарь полей, ошибка разбора)."""
+    fmt = detect_format(path, fmt)
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record, None
+        else:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as error:
+                    yield line_number, None, f'некорректный JSON: {error}'
+                    continue
+                if not isinstance(record, dict):
+                    yield line_number, None, 'ожидается JSON-объект'
+                    continue
+                yield line_number, record, None
+
+
+def validate_record(record):
+    """Приводит запись к кортежу для ``Database.upsert_products`` или бросает ValueError."""
+    name = str(record.get('name') or '').strip()
+    if not name:
+        raise ValueError('пустое название')
+    description = record.get('description')
+    description = None if description in (None, '') else str(description)
+    try:
+        price = float(record.get('price'))
+        quantity = int(record.get('quantity'))
+    except (TypeError, ValueError):
+        raise ValueError('некорректная цена или количество')
+    if price < 0 or quantity < 0:
+        raise ValueError('отрицательная цена или количество')
+    product_id = record.get('id')
+    if product_id in (None, ''):
+        product_id = None
+    else:
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            raise ValueError('некорректный id')
+    return product_id, name, description, price, quantity
+
+
+def import_products(db, path, fmt=None, batch_size=BATCH_SIZE, progress=None, should_stop=None):
+    """Импортирует товары из файла пакетами по ``batch_size`` строк.
+
+    Каждый пакет записывается через ``executemany`` в своей транзакции, так что
+    файл не загружается в память целиком, а другие записи успевают выполняться
+    между пакетами. ``progress(report)`` вызывается после каждого пакета,
+    ``should_stop()`` позволяет прервать импорт между пакетами.
+    """
+    report = ImportReport()
+    batch = []
+
+    def flush():
+        db.upsert_products(batch)
+        report.imported += len(batch)
+        batch.clear()
+        report.elapsed = time.perf_counter() - report.started
+        if progress is not None:
+            progress(report)
+
+    for line_number, record, error in read_records(path, fmt):
+        if error is None:
+            try:
+                batch.append(validate_record(record))
+            except ValueError as validation_error:
+                error = str(validation_error)
+        if error is not None:
+            report.rejected.append((line_number, error))
+        if len(batch) >= batch_size:
+            flush()
+            if should_stop is not None and should_stop():
+                break
+    if batch:
+        flush()
+    report.elapsed = time.perf_counter() - report.started
+    return report
+
+
+def export_products(db, path, fmt=None, page_size=BATCH_SIZE):
+    """Выгружает каталог постранично, не держа всю таблицу в памяти. Возвращает число строк."""
+    fmt = detect_format(path, fmt)
+    exported = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f) if fmt == 'csv' else None
+        if writer is not None:
+            writer.writerow(FIELDS)
+        cursor = None
+        while True:
+            rows, cursor = db.get_products_page(cursor, page_size)
+            for row in rows:
+                values = [getattr(row, field) for field in FIELDS]
+                if writer is not None:
+                    writer.writerow(values)
+                else:
+                    f.write(json.dumps(dict(zip(FIELDS, values)), ensure_ascii=False) + '\n')
+            exported += len(rows)
+            if cursor is None:
+                return exported
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Импорт и экспорт каталога товаров.')
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=['csv', 'jsonl'])
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--db', help='путь к файлу базы данных')
+    args = parser.parse_args(argv)
+
+    db = Database(args.db)
+    if args.command == 'export':
+        started = time.perf_counter()
+        exported = export_products(db, args.path, args.format, args.batch_size)
+        print(f'Выгружено: {exported} за {time.perf_counter() - started:.2f} с')
+        return 0
+
+    report = import_products(
+        db, args.path, args.format, args.batch_size,
+        progress=lambda r: print(f'\r{r.summary()}', end='', file=sys.stderr, flush=True),
+    )
+    print(file=sys.stderr)
+    for line_number, reason in report.rejected:
+        print(f'строка {line_number}: {reason}', file=sys.stderr)
+    print(report.summary())
+    return 0 if not report.rejected else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# cache_tests.py
+"""Query cache: writes and archiving drop exactly the results they made stale.
+
+    python -m unittest cache_tests
+"""
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault('WAREHOUSE_BCRYPT_ROUNDS', '4')
+
+from database import ConnectionManager, Database, archive_cutoff
+from query_cache import QueryCache
+
+
+class QueryCacheTests(unittest.TestCase):
+    def test_invalidate_drops_only_tagged_entries(self):
+        cache = QueryCache(max_entries=10, ttl=0)
+        cache.get_or_load('products', ['products'], lambda: [1])
+        cache.get_or_load('orders 1', [('orders', 1)], lambda: [2])
+        cache.invalidate(('orders', 1))
+        self.assertEqual(cache.get_or_load('products', ['products'], lambda: []), [1])
+        self.assertEqual(cache.get_or_load('orders 1', [('orders', 1)], lambda: [3]), [3])
+
+    def test_load_overlapping_invalidation_is_not_stored(self):
+        cache = QueryCache(max_entries=10, ttl=0)
+
+        def load():
+            # A write lands while the read is running
+            cache.invalidate('products')
+            return ['before the write']
+
+        self.assertEqual(cache.get_or_load('products', ['products'], load), ['before the write'])
+        self.assertEqual(cache.get_or_load('products', ['products'], lambda: ['after']), ['after'])
+
+    def test_callers_get_copies(self):
+        cache = QueryCache(max_entries=10, ttl=0)
+        cache.get_or_load('products', ['products'], lambda: [1]).append(2)
+        self.assertEqual(cache.get_or_load('products', ['products'], lambda: []), [1])
+
+
+class DatabaseCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.directory.name, 'app.db'))
+        self.db.add_user('first', 'secret')
+        self.db.add_user('second', 'secret')
+        self.first = self.db.authenticate_user('first', 'secret').id
+        self.second = self.db.authenticate_user('second', 'secret').id
+        self.db.add_product('Widget', '', 2.0, 100)
+        self.product = self.db.get_products()[0].id
+        self.cache = self.db.manager.cache
+
+    def tearDown(self):
+        ConnectionManager.close_all()
+        self.directory.cleanup()
+
+    def order_ids(self, user_id):
+        rows, _ = self.db.get_orders_by_user_page(user_id)
+        return [order.id for order in rows]
+
+    def test_repeated_read_is_a_hit(self):
+        self.db.get_products_page()
+        hits = self.cache.stats()['hits']
+        self.db.get_products_page()
+        self.assertEqual(self.cache.stats()['hits'], hits + 1)
+
+    def test_product_update_refreshes_catalog(self):
+        self.assertEqual(self.db.get_products_page()[0][0].price, 2.0)
+        self.db.update_product(self.product, 'Widget', '', 3.0, 100)
+        self.assertEqual(self.db.get_products_page()[0][0].price, 3.0)
+
+    def test_order_invalidates_only_its_user(self):
+        self.assertEqual(self.order_ids(self.first), [])
+        self.assertEqual(self.order_ids(self.second), [])
+        self.db.place_order(self.first, self.product, 1)
+        hits = self.cache.stats()['hits']
+        self.assertEqual(len(self.order_ids(self.first)), 1)
+        self.assertEqual(self.order_ids(self.second), [])
+        # Only the second user's history came from the cache
+        self.assertEqual(self.cache.stats()['hits'], hits + 1)
+        self.assertEqual(self.db.get_products_page()[0][0].quantity, 99)
+
+    def test_status_change_refreshes_history_and_all_orders(self):
+        self.db.place_order(self.first, self.product, 1)
+        order_id = self.order_ids(self.first)[0]
+        self.db.get_all_orders_page()
+        self.db.fulfill_order(order_id)
+        self.assertEqual(self.db.get_orders_by_user_page(self.first)[0][0].status, 'fulfilled')
+        self.assertEqual(self.db.get_all_orders_page()[0][0].status, 'fulfilled')
+        self.assertEqual(self.db.get_placed_orders_page()[0], [])
+
+    def test_archiving_refreshes_history(self):
+        self.db.place_order(self.first, self.product, 1)
+        self.db.place_order(self.second, self.product, 1)
+        archived_id = self.order_ids(self.first)[0]
+        self.db.fulfill_order(archived_id)
+        self.assertEqual(self.order_ids(self.first), [archived_id])
+        self.db.get_all_orders_page()
+        self.db.get_archived_orders_page()
+
+        self.assertEqual(self.db.archive_orders(archive_cutoff(-1)), 1)
+        self.assertEqual(self.order_ids(self.first), [])
+        self.assertEqual(len(self.db.get_all_orders_page()[0]), 1)
+        self.assertEqual([order.id for order in self.db.get_archived_orders_page()[0]], [archived_id])
+
+
+if __name__ == '__main__':
+    unittest.main()
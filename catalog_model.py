@@ -0,0 +1,327 @@
+# catalog_model.py
+import logging
+import threading
+import time
+
+from PyQt6.QtCore import QAbstractTableModel, QEvent, QModelIndex, QObject, Qt, QTimer, pyqtSignal
+from PyQt6.QtWidgets import QApplication, QStyle, QStyledItemDelegate, QStyleOptionButton
+
+import settings
+from workers import run_in_background
+
+PAGE_SIZE = 200
+
+logger = logging.getLogger(__name__)
+
+
+class PagedTableModel(QAbstractTableModel):
+    """Табличная модель, подгружающая строки страницами.
+
+    ``fetch_page(cursor, page_size)`` возвращает ``(rows, next_cursor)``, как
+    постраничные методы ``Database``; ``next_cursor`` равен None на последней
+    странице. Представление само запрашивает следующие страницы через
+    ``canFetchMore``/``fetchMore`` по мере прокрутки, а текст ячеек
+    формируется только в ``data()``.
+    """
+
+    HEADERS = []
+    COLUMNS = []
+
+    def __init__(self, fetch_page, page_size=PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self._fetch_page = fetch_page
+        self._page_size = page_size
+        self._rows = []
+        self._cursor = None
+        self._exhausted = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role != Qt.ItemDataRole.DisplayRole:
+            return None
+        value = getattr(self._rows[index.row()], self.COLUMNS[index.column()])
+        return '' if value is None else str(value)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return str(section + 1)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        rows, next_cursor = self._fetch_page(self._cursor, self._page_size)
+        self._cursor = next_cursor
+        self._exhausted = next_cursor is None
+        if not rows:
+            return
+        first = len(self._rows)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self._rows.extend(rows)
+        self.endInsertRows()
+
+    def reload(self, fetch_page=None, first_page=None):
+        """Сбрасывает загруженные строки и подгружает первую страницу заново.
+
+        ``first_page`` — уже полученная (например, в фоновом потоке) первая
+        страница в виде ``(rows, next_cursor)``.
+        """
+        self.beginResetModel()
+        if fetch_page is not None:
+            self._fetch_page = fetch_page
+        self._rows = []
+        self._cursor = None
+        self._exhausted = False
+        if first_page is not None:
+            rows, self._cursor = first_page
+            self._rows = list(rows)
+            self._exhausted = self._cursor is None
+        self.endResetModel()
+        if first_page is None:
+            self.fetchMore()
+
+    def apply_delta(self, rows, deleted_ids, append_new=False):
+        """Применяет изменения отдельных строк без перезагрузки модели.
+
+        Загруженные строки с теми же ``id`` заменяются, удалённые и
+        переставшие подходить под выборку (``_accepts``) убираются. Новые
+        строки добавляются в конец только при ``append_new`` и только если
+        все страницы уже загружены — иначе они придут со следующей страницей.
+        """
+        positions = {row.id: index for index, row in enumerate(self._rows)}
+        removed = {positions[i] for i in deleted_ids if i in positions}
+        for row in rows:
+            index = positions.get(row.id)
+            if index is not None and not self._accepts(row):
+                removed.add(index)
+            elif index is not None:
+                self._rows[index] = row
+                self.dataChanged.emit(self.index(index, 0), self.index(index, len(self.COLUMNS) - 1))
+            elif append_new and self._exhausted and self._accepts(row):
+                last = len(self._rows)
+                self.beginInsertRows(QModelIndex(), last, last)
+                self._rows.append(row)
+                self.endInsertRows()
+        for index in sorted(removed, reverse=True):
+            self.beginRemoveRows(QModelIndex(), index, index)
+            del self._rows[index]
+            self.endRemoveRows()
+
+    def _accepts(self, row):
+        """Подходит ли строка под выборку модели; переопределяется в подклассах."""
+        return True
+
+    def row_at(self, row):
+        """Строка данных по номеру строки представления или None."""
+        if 0 <= row < len(self._rows):
+            return self._rows[row]
+        return None
+
+
+class ProductTableModel(PagedTableModel):
+    HEADERS = ['ID', 'Название', 'Описание', 'Цена', 'Количество']
+    COLUMNS = ['id', 'name', 'description', 'price', 'quantity']
+
+    def product_at(self, row):
+        return self.row_at(row)
+
+
+ORDER_STATUS_TITLES = {'placed': 'Оформлен', 'cancelled': 'Отменён', 'fulfilled': 'Выполнен'}
+
+
+class AllOrdersTableModel(PagedTableModel):
+    """Все заказы любого статуса — из основной базы или из архива, смотря по ``fetch_page``.
+
+    С ``placed_only`` это очередь заказов к выполнению: выполненный или
+    отменённый заказ уходит из неё при ``apply_delta``.
+    """
+
+    HEADERS = ['ID заказа', 'Пользователь', 'Товар', 'Количество', 'Сумма', 'Дата', 'Статус']
+    COLUMNS = ['id', 'username', 'product_name', 'quantity', 'total_price', 'created_at', 'status']
+    STATUS_COLUMN = 6
+
+    def __init__(self, fetch_page, page_size=PAGE_SIZE, parent=None, placed_only=False):
+        super().__init__(fetch_page, page_size, parent)
+        self.placed_only = placed_only
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if index.isValid() and index.column() == self.STATUS_COLUMN and role == Qt.ItemDataRole.DisplayRole:
+            status = self._rows[index.row()].status
+            return ORDER_STATUS_TITLES.get(status, status)
+        return super().data(index, role)
+
+    def _accepts(self, row):
+        return not self.placed_only or row.status == 'placed'
+
+
+class UserOrdersTableModel(PagedTableModel):
+    """Заказы одного пользователя любого статуса; последний столбец — кнопка отмены (см. ``ButtonDelegate``).
+
+    Кнопка есть только у оформленных заказов: после отмены или выполнения
+    ``apply_delta`` обновляет статус строки, и кнопка пропадает.
+    """
+
+    HEADERS = ['ID заказа', 'Товар', 'Количество', 'Сумма', 'Статус', 'Отменить']
+    COLUMNS = ['id', 'product_name', 'quantity', 'total_price', 'status', None]
+    STATUS_COLUMN = 4
+    BUTTON_COLUMN = 5
+
+    def __init__(self, user_id, fetch_page, page_size=PAGE_SIZE, parent=None):
+        super().__init__(fetch_page, page_size, parent)
+        self.user_id = user_id
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if index.isValid() and role == Qt.ItemDataRole.DisplayRole:
+            status = self._rows[index.row()].status
+            if index.column() == self.BUTTON_COLUMN:
+                return 'Отменить' if status == 'placed' else None
+            if index.column() == self.STATUS_COLUMN:
+                return ORDER_STATUS_TITLES.get(status, status)
+        return super().data(index, role)
+
+    def _accepts(self, row):
+        return row.user_id == self.user_id
+
+
+class ButtonDelegate(QStyledItemDelegate):
+    """Рисует в ячейке кнопку вместо создания настоящего ``QPushButton`` на каждую строку.
+
+    Нажатие отправляет ``clicked(row)``. Ячейка без текста остаётся пустой и
+    нажатий не принимает.
+    """
+
+    clicked = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pressed = None
+
+    def _button_option(self, option, index):
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(4, 2, -4, -2)
+        button.text = index.data()
+        button.state = QStyle.StateFlag.State_Enabled
+        if self._pressed == (index.row(), index.column()):
+            button.state |= QStyle.StateFlag.State_Sunken
+        else:
+            button.state |= QStyle.StateFlag.State_Raised
+        return button
+
+    def paint(self, painter, option, index):
+        if not index.data():
+            super().paint(painter, option, index)
+            return
+        style = option.widget.style() if option.widget else QApplication.style()
+        style.drawControl(QStyle.ControlElement.CE_PushButton, self._button_option(option, index), painter, option.widget)
+
+    def editorEvent(self, event, model, option, index):
+        if not index.data():
+            return False
+        if event.type() == QEvent.Type.MouseButtonPress and option.rect.contains(event.position().toPoint()):
+            self._pressed = (index.row(), index.column())
+            return True
+        if event.type() == QEvent.Type.MouseButtonRelease:
+            pressed, self._pressed = self._pressed, None
+            if pressed == (index.row(), index.column()) and option.rect.contains(event.position().toPoint()):
+                self.clicked.emit(index.row())
+            return True
+        return False
+
+
+class CatalogSearch(QObject):
+    """Поиск по каталогу с задержкой ввода в фоновом потоке.
+
+    ``submit`` перезапускает таймер задержки; по его срабатыванию первая порция
+    результатов запрашивается в пуле потоков. Более новый запрос прерывает
+    выполняющийся старый (``sqlite3.Connection.interrupt``), а результаты
+    устаревших запросов отбрасываются: ``results_ready`` приходит только для
+    последнего (первая страница в виде ``(rows, next_cursor)``).
+    ``latency_measured`` сообщает время выполнения каждого запроса в
+    миллисекундах.
+    """
+
+    results_ready = pyqtSignal(str, object)
+    latency_measured = pyqtSignal(str, float)
+
+    def __init__(self, db, debounce_ms=None, page_size=PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.page_size = page_size
+        self._generation = 0
+        self._pending_text = ''
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(settings.SEARCH_DEBOUNCE_MS if debounce_ms is None else debounce_ms)
+        self._timer.timeout.connect(self._start_query)
+
+    def submit(self, search_text):
+        """Запланировать поиск; предыдущие незавершённые запросы становятся устаревшими."""
+        self._pending_text = search_text
+        self._generation += 1
+        self._interrupt_stale()
+        self._timer.start()
+
+    def cancel(self):
+        """Отменить ожидающий и выполняющийся поиск."""
+        self._timer.stop()
+        self._generation += 1
+        self._interrupt_stale()
+
+    def fetch_page(self, search_text):
+        """Функция подгрузки страниц для ``ProductTableModel`` по тексту запроса."""
+        return lambda cursor, page_size: self.db.search_products_page(search_text, cursor, page_size)
+
+    def _start_query(self):
+        generation = self._generation
+        search_text = self._pending_text
+        run_in_background(
+            self._run_query, generation, search_text,
+            on_finished=self._deliver,
+            on_failed=lambda error: self._discard(generation, search_text, error),
+        )
+
+    def _run_query(self, generation, search_text):
+        conn = self.db.conn
+        with self._in_flight_lock:
+            if generation != self._generation:
+                return generation, search_text, None, 0.0
+            self._in_flight[generation] = conn
+        started = time.perf_counter()
+        try:
+            page = self.db.search_products_page(search_text, None, self.page_size)
+        finally:
+            with self._in_flight_lock:
+                self._in_flight.pop(generation, None)
+        return generation, search_text, page, (time.perf_counter() - started) * 1000
+
+    def _interrupt_stale(self):
+        with self._in_flight_lock:
+            for generation, conn in self._in_flight.items():
+                if generation != self._generation:
+                    conn.interrupt()
+
+    def _deliver(self, result):
+        generation, search_text, page, elapsed_ms = result
+        if page is None:
+            return
+        logger.debug('search %r: %d rows in %.1f ms', search_text, len(page[0]), elapsed_ms)
+        self.latency_measured.emit(search_text, elapsed_ms)
+        if generation == self._generation:
+            self.results_ready.emit(search_text, page)
+
+    def _discard(self, generation, search_text, error):
+        if generation == self._generation:
+            logger.warning('search %r failed: %s', search_text, error)
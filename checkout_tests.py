@@ -0,0 +1,87 @@
+# checkout_tests.py
+"""Checkout: the conditional stock decrement never oversells and a shortage writes nothing.
+
+    python -m unittest checkout_tests
+"""
+import os
+import tempfile
+import threading
+import unittest
+
+os.environ.setdefault('WAREHOUSE_BCRYPT_ROUNDS', '4')
+
+from database import ConnectionManager, Database
+
+
+class CheckoutTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.directory.name, 'app.db'))
+        self.db.add_user('client', 'secret')
+        self.user = self.db.authenticate_user('client', 'secret').id
+        self.db.add_product('Widget', '', 2.0, 10)
+        self.db.add_product('Gadget', '', 5.0, 3)
+        self.widget, self.gadget = (product.id for product in self.db.get_products())
+
+    def tearDown(self):
+        ConnectionManager.close_all()
+        self.directory.cleanup()
+
+    def stock(self):
+        return {product.id: product.quantity for product in self.db.get_products()}
+
+    def test_checkout_decrements_every_line(self):
+        self.assertEqual(self.db.checkout(self.user, [(self.widget, 4), (self.gadget, 3)]), (True, []))
+        self.assertEqual(self.stock(), {self.widget: 6, self.gadget: 0})
+        orders = self.db.get_orders_by_user(self.user)
+        self.assertEqual(sorted((order.product_id, order.quantity, order.total_price) for order in orders),
+                         sorted([(self.widget, 4, 8.0), (self.gadget, 3, 15.0)]))
+
+    def test_shortage_rolls_back_the_whole_cart(self):
+        # The first line's decrement succeeds before the second one fails
+        success, shortages = self.db.checkout(self.user, [(self.widget, 4), (self.gadget, 5)])
+        self.assertFalse(success)
+        self.assertEqual(shortages, [(self.gadget, 5, 3)])
+        self.assertEqual(self.stock(), {self.widget: 10, self.gadget: 3})
+        self.assertEqual(self.db.get_orders_by_user(self.user), [])
+
+    def test_repeated_lines_are_checked_together(self):
+        success, shortages = self.db.checkout(self.user, [(self.gadget, 2), (self.gadget, 2)])
+        self.assertFalse(success)
+        self.assertEqual(shortages, [(self.gadget, 4, 3)])
+        self.assertEqual(self.stock()[self.gadget], 3)
+
+    def test_invalid_lines_are_shortages(self):
+        self.assertEqual(self.db.checkout(self.user, [(self.widget, 0)]), (False, [(self.widget, 0, 10)]))
+        self.assertEqual(self.db.checkout(self.user, [(self.widget, -1)]), (False, [(self.widget, -1, 10)]))
+        self.assertEqual(self.db.checkout(self.user, [(999, 1)]), (False, [(999, 1, 0)]))
+        self.assertEqual(self.db.checkout(self.user, []), (False, []))
+        self.assertEqual(self.stock(), {self.widget: 10, self.gadget: 3})
+
+    def test_last_unit_is_sold_once(self):
+        self.assertTrue(self.db.place_order(self.user, self.gadget, 3))
+        self.assertFalse(self.db.place_order(self.user, self.gadget, 1))
+        self.assertEqual(self.stock()[self.gadget], 0)
+
+    def test_concurrent_orders_never_oversell(self):
+        results = []
+        lock = threading.Lock()
+
+        def buy():
+            # Each thread has its own Database object and read connection
+            placed = Database(self.db.manager.path).place_order(self.user, self.widget, 1)
+            with lock:
+                results.append(placed)
+
+        threads = [threading.Thread(target=buy) for _ in range(25)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 10)
+        self.assertEqual(self.stock()[self.widget], 0)
+        self.assertEqual(sum(order.quantity for order in self.db.get_orders_by_user(self.user)), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
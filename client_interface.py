@@ -1,48 +1,74 @@
 # client_interface.py
 from PyQt6.QtWidgets import (
-    QWidget, QLabel, QVBoxLayout, QTableWidget, QTableWidgetItem, QPushButton, QHBoxLayout,
+    QWidget, QLabel, QVBoxLayout, QTableWidget, QTableWidgetItem, QTableView, QPushButton, QHBoxLayout,
     QMessageBox, QInputDialog, QLineEdit, QHeaderView, QDialog
 )
-from PyQt6.QtCore import Qt
-from database import Database
+from PyQt6.QtCore import Qt, pyqtSignal
+from database import open_database
+from catalog_model import ProductTableModel, UserOrdersTableModel, ButtonDelegate, CatalogSearch
+from models import OrderLine
 
 class ClientWidget(QWidget):
     def __init__(self, main_window, user_id, username):
         super().__init__()
         self.main_window = main_window  # Reference to the main window
-        self.db = Database()
+        self.db = open_database()
         self.user_id = user_id
         self.username = username
+        self.cart = {}  # product_id -> OrderLine
+        self.orders_model = None
         self.init_ui()
 
+        # Live stock: rows changed by other terminals are patched in place
+        watcher = self.main_window.change_watcher
+        watcher.products_changed.connect(self.apply_product_changes)
+        watcher.orders_changed.connect(self.apply_order_changes)
+        watcher.reset_required.connect(self.load_products)
+
     def init_ui(self):
         # Welcome message
         self.label = QLabel(f'Добро пожаловать, {self.username}!')
 
-        # Search input for products
+        # Search input for products: queries are debounced and run off the GUI thread
+        self.search = CatalogSearch(self.db, parent=self)
+        self.search.results_ready.connect(self.show_search_results)
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText('Поиск товаров...')
-        self.search_input.textChanged.connect(self.load_products)
+        self.search_input.textChanged.connect(self.search.submit)
 
-        # Products table
-        self.products_table = QTableWidget()
-        self.products_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
-        self.products_table.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
+        # Products table, rows are fetched lazily page by page as the view scrolls
+        self.products_model = ProductTableModel(self.db.get_products_page, parent=self)
+        self.products_table = QTableView()
+        self.products_table.setModel(self.products_model)
+        self.products_table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.products_table.setSelectionMode(QTableView.SelectionMode.SingleSelection)
+        self.products_table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
         self.products_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
 
         # Action buttons
         self.order_button = QPushButton('Сделать заказ')
         self.order_button.clicked.connect(self.place_order)
 
+        self.add_to_cart_button = QPushButton('В корзину')
+        self.add_to_cart_button.clicked.connect(self.add_to_cart)
+
+        self.cart_button = QPushButton('Корзина (0)')
+        self.cart_button.clicked.connect(self.view_cart)
+
         self.view_orders_button = QPushButton('Мои заказы')
         self.view_orders_button.clicked.connect(self.view_orders)
 
+        self.lock_button = QPushButton('Сменить пользователя')
+        self.lock_button.clicked.connect(self.lock)
+
         self.logout_button = QPushButton('Выйти')
         self.logout_button.clicked.connect(self.logout)
 
         # Layouts
         buttons_layout = QHBoxLayout()
         buttons_layout.addWidget(self.order_button)
+        buttons_layout.addWidget(self.add_to_cart_button)
+        buttons_layout.addWidget(self.cart_button)
         buttons_layout.addWidget(self.view_orders_button)
 
         layout = QVBoxLayout()
@@ -50,6 +76,7 @@ class ClientWidget(QWidget):
         layout.addWidget(self.search_input)
         layout.addWidget(self.products_table)
         layout.addLayout(buttons_layout)
+        layout.addWidget(self.lock_button)
         layout.addWidget(self.logout_button)
 
         # Set stretch factor for the products table to fill available space
@@ -62,50 +89,107 @@ class ClientWidget(QWidget):
 
     def load_products(self):
         search_text = self.search_input.text()
-        products = self.db.search_products(search_text)
-        self.products_table.clearContents()
-        self.products_table.setRowCount(len(products))
-        self.products_table.setColumnCount(5)
-        self.products_table.setHorizontalHeaderLabels(['ID', 'Название', 'Описание', 'Цена', 'Количество'])
-        self.products_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.search.cancel()
+        self.products_model.reload(self.search.fetch_page(search_text))
 
-        for row_index, product in enumerate(products):
-            for col_index, item in enumerate(product):
-                self.products_table.setItem(row_index, col_index, QTableWidgetItem(str(item)))
+    def apply_product_changes(self, rows, deleted_ids):
+        # New products can only be placed correctly in the unfiltered, id-ordered catalog
+        self.products_model.apply_delta(rows, deleted_ids, append_new=not self.search_input.text())
+
+    def refresh(self):
+        """Repeat visit of an already created screen: show current stock."""
+        self.load_products()
+
+    def dispose(self):
+        """The screen was evicted by ``ScreenManager`` and is about to be destroyed."""
+        self.search.cancel()
+        for dialog in self.findChildren(QDialog):
+            dialog.close()
+
+    def show_search_results(self, search_text, first_page):
+        self.products_model.reload(self.search.fetch_page(search_text), first_page=first_page)
 
     def disable_buttons(self):
         self.order_button.setEnabled(False)
+        self.add_to_cart_button.setEnabled(False)
+        self.cart_button.setEnabled(False)
         self.view_orders_button.setEnabled(False)
 
     def enable_buttons(self):
         self.order_button.setEnabled(True)
+        self.add_to_cart_button.setEnabled(True)
+        self.cart_button.setEnabled(True)
         self.view_orders_button.setEnabled(True)
 
     def place_order(self):
-        selected_row = self.products_table.currentRow()
-        if selected_row >= 0:
+        product = self.products_model.product_at(self.products_table.currentIndex().row())
+        if product is not None:
             self.disable_buttons()
-            product_id_item = self.products_table.item(selected_row, 0)
-            if product_id_item:
-                try:
-                    product_id = int(product_id_item.text())
-                    quantity, ok = QInputDialog.getInt(self, 'Количество', 'Введите количество:', min=1)
-                    if ok:
-                        success = self.db.place_order(self.user_id, product_id, quantity)
-                        if success:
-                            QMessageBox.information(self, 'Успех', 'Заказ успешно оформлен!')
-                            self.load_products()  # Refresh product list
-                        else:
-                            QMessageBox.warning(self, 'Ошибка', 'Недостаточное количество товара на складе.')
-                except ValueError:
-                    QMessageBox.warning(self, 'Ошибка', 'Неверный идентификатор товара.')
+            try:
+                product_id = int(product.id)
+                quantity, ok = QInputDialog.getInt(self, 'Количество', 'Введите количество:', min=1)
+                if ok:
+                    success = self.db.place_order(self.user_id, product_id, quantity)
+                    if success:
+                        QMessageBox.information(self, 'Успех', 'Заказ успешно оформлен!')
+                        self.load_products()  # Refresh product list
+                    else:
+                        QMessageBox.warning(self, 'Ошибка', 'Недостаточное количество товара на складе.')
+            except ValueError:
+                QMessageBox.warning(self, 'Ошибка', 'Неверный идентификатор товара.')
             self.enable_buttons()
         else:
             QMessageBox.warning(self, 'Ошибка', 'Пожалуйста, выберите товар для заказа.')
 
+    def add_to_cart(self):
+        product = self.products_model.product_at(self.products_table.currentIndex().row())
+        if product is None:
+            QMessageBox.warning(self, 'Ошибка', 'Пожалуйста, выберите товар.')
+            return
+        quantity, ok = QInputDialog.getInt(self, 'Количество', 'Введите количество:', min=1)
+        if ok:
+            line = self.cart.setdefault(product.id, OrderLine(product.id, product.name, product.price, 0))
+            line.quantity += quantity
+            self.update_cart_button()
+
+    def update_cart_button(self):
+        self.cart_button.setText(f'Корзина ({len(self.cart)})')
+
+    def view_cart(self):
+        if not self.cart:
+            QMessageBox.information(self, 'Корзина', 'Корзина пуста.')
+            return
+        self.disable_buttons()
+        dialog = CartDialog(self, self.cart)
+        dialog.checkout_requested.connect(self.checkout_cart)
+        dialog.finished.connect(self.enable_buttons)
+        dialog.finished.connect(self.update_cart_button)
+        self.cart_dialog = dialog
+        dialog.exec()
+
+    def checkout_cart(self):
+        lines = [(line.product_id, line.quantity) for line in self.cart.values()]
+        # All lines are ordered in one transaction, or none of them is
+        success, shortages = self.db.checkout(self.user_id, lines)
+        if success:
+            self.cart.clear()
+            self.cart_dialog.accept()
+            QMessageBox.information(self, 'Успех', 'Заказ успешно оформлен!')
+            self.load_products()
+        else:
+            details = '\n'.join(
+                f"{self.cart[product_id].name}: заказано {requested}, на складе {available}"
+                for product_id, requested, available in shortages
+            )
+            QMessageBox.warning(self.cart_dialog, 'Ошибка', 'Недостаточное количество товара на складе:\n' + details)
+
     def view_orders(self):
-        orders = self.db.get_orders_by_user(self.user_id)
-        if orders:
+        orders_model = UserOrdersTableModel(
+            self.user_id,
+            lambda cursor, page_size: self.db.get_orders_by_user_page(self.user_id, cursor, page_size),
+        )
+        orders_model.fetchMore()
+        if orders_model.rowCount():
             self.disable_buttons()
             # Create a dialog window to display orders
             self.orders_dialog = QDialog(self)
@@ -113,20 +197,18 @@ class ClientWidget(QWidget):
             self.orders_dialog.setFixedSize(600, 400)
             self.orders_dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
             self.orders_dialog.finished.connect(self.enable_buttons)
+            self.orders_dialog.finished.connect(self.forget_orders_model)
 
-            self.orders_table = QTableWidget()
-            self.orders_table.setRowCount(len(orders))
-            self.orders_table.setColumnCount(5)
-            self.orders_table.setHorizontalHeaderLabels(['ID заказа', 'Товар', 'Количество', 'Сумма', 'Отменить'])
-            self.orders_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+            # Orders are paged in lazily; cancel buttons are painted by a delegate
+            self.orders_table = QTableView()
+            orders_model.setParent(self.orders_table)
+            self.orders_table.setModel(orders_model)
+            self.orders_table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
             self.orders_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
-
-            for row_index, order in enumerate(orders):
-                for col_index, item in enumerate(order):
-                    self.orders_table.setItem(row_index, col_index, QTableWidgetItem(str(item)))
-                cancel_button = QPushButton('Отменить')
-                cancel_button.clicked.connect(lambda checked, order_id=order['id']: self.cancel_order(order_id))
-                self.orders_table.setCellWidget(row_index, 4, cancel_button)
+            cancel_delegate = ButtonDelegate(self.orders_table)
+            cancel_delegate.clicked.connect(self.cancel_order_at)
+            self.orders_table.setItemDelegateForColumn(UserOrdersTableModel.BUTTON_COLUMN, cancel_delegate)
+            self.orders_model = orders_model
 
             layout = QVBoxLayout()
             layout.addWidget(QLabel('Мои заказы'))
@@ -137,7 +219,19 @@ class ClientWidget(QWidget):
         else:
             QMessageBox.information(self, 'Мои заказы', 'У вас пока нет заказов.')
 
-    def cancel_order(self, order_id):
+    def forget_orders_model(self):
+        self.orders_model = None
+
+    def apply_order_changes(self, rows, deleted_ids):
+        if self.orders_model is not None:
+            self.orders_model.apply_delta(rows, deleted_ids, append_new=True)
+
+    def cancel_order_at(self, row):
+        order = self.orders_model.row_at(row)
+        if order is not None and order.status == 'placed':
+            self.cancel_order(order.id, order.product_id)
+
+    def cancel_order(self, order_id, product_id=None):
         confirm = QMessageBox.question(
             self, 'Подтверждение', 'Вы уверены, что хотите отменить этот заказ?',
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
@@ -145,31 +239,78 @@ class ClientWidget(QWidget):
         if confirm == QMessageBox.StandardButton.Yes:
             if self.db.cancel_order(order_id):
                 QMessageBox.information(self, 'Успех', 'Заказ успешно отменён.')
-                # Refresh the products table to show updated quantities
-                self.load_products()
-                # Check if there are any orders left
-                remaining_orders = self.db.get_orders_by_user(self.user_id)
-                if remaining_orders:
-                    # Refresh the orders table
-                    self.refresh_orders_table(remaining_orders)
-                else:
-                    # Close the orders dialog if no orders are left
-                    self.orders_dialog.close()
-                    QMessageBox.information(self, 'Мои заказы', 'У вас пока нет заказов.')
+                # Update only the stock of the returned product
+                if product_id is not None:
+                    self.products_model.apply_delta(self.db.get_products_by_ids([product_id]), [])
+                if self.orders_model is not None:
+                    # The cancelled order stays in the history: refresh just its row
+                    self.orders_model.apply_delta(self.db.get_orders_by_ids([order_id]), [])
             else:
                 QMessageBox.warning(self, 'Ошибка', 'Не удалось отменить заказ.')
 
-    def refresh_orders_table(self, orders):
-        # Clear the orders table and reload it with updated data
-        self.orders_table.clearContents()
-        self.orders_table.setRowCount(len(orders))
-
-        for row_index, order in enumerate(orders):
-            for col_index, item in enumerate(order):
-                self.orders_table.setItem(row_index, col_index, QTableWidgetItem(str(item)))
-            cancel_button = QPushButton('Отменить')
-            cancel_button.clicked.connect(lambda checked, order_id=order['id']: self.cancel_order(order_id))
-            self.orders_table.setCellWidget(row_index, 4, cancel_button)
+    def lock(self):
+        self.main_window.lock()
 
     def logout(self):
-        self.main_window.switch_to_auth()
\ No newline at end of file
+        self.main_window.logout()
+
+class CartDialog(QDialog):
+    checkout_requested = pyqtSignal()
+
+    def __init__(self, parent, cart):
+        super().__init__(parent)
+        self.cart = cart
+        self.init_ui()
+
+    def init_ui(self):
+        self.setWindowTitle('Корзина')
+        self.setFixedSize(600, 400)
+
+        self.cart_table = QTableWidget()
+        self.cart_table.setColumnCount(4)
+        self.cart_table.setHorizontalHeaderLabels(['Товар', 'Цена', 'Количество', 'Сумма'])
+        self.cart_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.cart_table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.cart_table.setSelectionMode(QTableWidget.SelectionMode.SingleSelection)
+        self.cart_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+
+        self.total_label = QLabel()
+
+        self.remove_button = QPushButton('Удалить из корзины')
+        self.remove_button.clicked.connect(self.remove_line)
+        self.checkout_button = QPushButton('Оформить заказ')
+        self.checkout_button.clicked.connect(self.checkout_requested)
+        self.close_button = QPushButton('Закрыть')
+        self.close_button.clicked.connect(self.reject)
+
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addWidget(self.remove_button)
+        buttons_layout.addWidget(self.checkout_button)
+        buttons_layout.addWidget(self.close_button)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.cart_table)
+        layout.addWidget(self.total_label)
+        layout.addLayout(buttons_layout)
+        self.setLayout(layout)
+
+        self.refresh()
+
+    def refresh(self):
+        self.product_ids = list(self.cart)
+        self.cart_table.setRowCount(len(self.product_ids))
+        total = 0
+        for row_index, product_id in enumerate(self.product_ids):
+            line = self.cart[product_id]
+            total += line.total
+            values = [line.name, line.price, line.quantity, round(line.total, 2)]
+            for col_index, value in enumerate(values):
+                self.cart_table.setItem(row_index, col_index, QTableWidgetItem(str(value)))
+        self.total_label.setText(f'Итого: {round(total, 2)}')
+        self.checkout_button.setEnabled(bool(self.cart))
+
+    def remove_line(self):
+        row = self.cart_table.currentRow()
+        if row >= 0:
+            del self.cart[self.product_ids[row]]
+            self.refresh()
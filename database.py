@@ -1,171 +1,1097 @@
 # database.py
+import base64
+import collections
+import datetime
+import functools
+import inspect
+import json
+import os
+import random
+import re
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
 import bcrypt
 
+import diagnostics
+import migrations
+import settings
+from models import Order, Product, Sales, User
+from query_cache import QueryCache
+from sessions import SessionStore
+
+
+LOCK_WAIT_THRESHOLD = 0.001  # seconds; a faster BEGIN IMMEDIATE did not wait for anyone
+# Write transactions whose change_log ids are remembered for own_changes()
+OWN_CHANGE_RANGES = 1000
+
+
+class ConnectionManager:
+    """Process-wide owner of the SQLite connections for one database file.
+
+    The file is opened once in WAL mode. Every thread gets its own read
+    connection, while all writes go through a single connection guarded
+    by a lock, so readers never block on the writer and writers never
+    fight each other for the rollback journal.
+
+    Write transactions start with ``BEGIN IMMEDIATE``, so the database write
+    lock is taken before anything is read. When another process holds it,
+    the attempt is retried with bounded exponential backoff; the retries and
+    lock waits are counted in ``write_stats()``.
+
+    Archived orders live in a separate file (``archive_path``) that is
+    attached to a connection as ``archive`` on first use.
+
+    Once the schema is ready, every write transaction remembers the range of
+    ``change_log`` ids it wrote, so live refresh can tell this process's own
+    changes from other instances' (``own_changes()``).
+    """
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path, synchronous=None, cache_size=None, mmap_size=None, busy_timeout=None,
+                 archive_path=None):
+        self.path = path
+        self.archive_path = archive_path or archive_db_path(path)
+        pragmas = {
+            'synchronous': synchronous if synchronous is not None else settings.DB_SYNCHRONOUS,
+            'cache_size': cache_size if cache_size is not None else settings.DB_CACHE_SIZE,
+            'mmap_size': mmap_size if mmap_size is not None else settings.DB_MMAP_SIZE,
+            'busy_timeout': busy_timeout if busy_timeout is not None else settings.DB_BUSY_TIMEOUT,
+        }
+        self.pragmas = {name: _pragma_value(name, value) for name, value in pragmas.items()}
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'transactions': 0,
+            'busy_retries': 0,
+            'busy_failures': 0,
+            'lock_waits': 0,
+            'lock_wait_seconds': 0.0,
+        }
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        self._own_changes = collections.deque(maxlen=OWN_CHANGE_RANGES)
+        self.fts_enabled = False
+        # Login sessions belong to the users of this database file
+        self.sessions = SessionStore()
+        # Query results shared by every Database object of this file
+        self.cache = QueryCache()
+
+        self._writer = self._connect(busy_timeout=settings.DB_WRITE_BUSY_TIMEOUT)
+        self._writer.execute('PRAGMA journal_mode=WAL')
+
+    @classmethod
+    def instance(cls, path=None, **pragmas):
+        """Return the shared manager for ``path``, creating it on first use."""
+        path = path or settings.DB_PATH
+        with cls._instances_lock:
+            manager = cls._instances.get(path)
+            if manager is None:
+                manager = cls(path, **pragmas)
+                cls._instances[path] = manager
+            return manager
+
+    @classmethod
+    def close_all(cls):
+        with cls._instances_lock:
+            for manager in cls._instances.values():
+                manager.close()
+            cls._instances.clear()
+
+    def _connect(self, busy_timeout=None):
+        if busy_timeout is None:
+            busy_timeout = self.pragmas['busy_timeout']
+        else:
+            busy_timeout = _pragma_value('busy_timeout', busy_timeout)
+        conn = sqlite3.connect(
+            self.path,
+            timeout=busy_timeout / 1000,
+            check_same_thread=False,
+            factory=diagnostics.connection_factory(),
+        )
+        conn.execute(f"PRAGMA synchronous={self.pragmas['synchronous']}")
+        conn.execute(f"PRAGMA cache_size={self.pragmas['cache_size']}")
+        conn.execute(f"PRAGMA mmap_size={self.pragmas['mmap_size']}")
+        conn.execute(f'PRAGMA busy_timeout={busy_timeout}')
+        return conn
+
+    def reader(self):
+        """Read connection owned by the calling thread."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    @contextmanager
+    def writer(self, track_changes=True):
+        """Serialized ``BEGIN IMMEDIATE`` transaction: commits on success, rolls back on error.
+
+        Nested use from the same thread joins the outer transaction.
+        ``track_changes=False`` leaves the transaction's change log entries
+        out of ``own_changes()``, for background jobs whose changes open
+        screens must still pick up from the change log.
+        """
+        if not self._write_lock.acquire(blocking=False):
+            started = time.perf_counter()
+            self._write_lock.acquire()
+            self._count('lock_waits', time.perf_counter() - started)
+        try:
+            if self._write_depth:
+                self._write_depth += 1
+                try:
+                    yield self._writer
+                finally:
+                    self._write_depth -= 1
+                return
+
+            self._begin_immediate()
+            self._write_depth = 1
+            track_changes = track_changes and self._schema_ready
+            try:
+                first_change = self._newest_change() if track_changes else None
+                yield self._writer
+            except BaseException:
+                self._writer.rollback()
+                raise
+            else:
+                last_change = self._newest_change() if track_changes else None
+                self._writer.commit()
+                # Only committed ids: a rolled-back id is reused by the next writer
+                if track_changes and last_change > first_change:
+                    with self._stats_lock:
+                        self._own_changes.append((first_change, last_change))
+            finally:
+                self._write_depth = 0
+        finally:
+            self._write_lock.release()
+
+    def _newest_change(self):
+        # The write lock is held: nobody else adds change log entries meanwhile
+        return self._writer.execute('SELECT MAX(id) FROM change_log').fetchone()[0] or 0
+
+    def own_changes(self, after_id):
+        """``(first, last]`` ranges of change log ids written by this process after ``after_id``."""
+        with self._stats_lock:
+            return [(first, last) for first, last in self._own_changes if last > after_id]
+
+    @contextmanager
+    def archive_writer(self):
+        """``writer()`` transaction on the write connection with the archive attached.
+
+        The archive file and its table are created on first use. A
+        transaction spanning two WAL databases is not atomic across them, so
+        callers must keep each step safe to repeat.
+        """
+        with self._write_lock:
+            # ATTACH is not allowed inside a transaction
+            if not self._write_depth:
+                self.attach_archive(self._writer, create=True)
+            with self.writer() as conn:
+                yield conn
+
+    def attach_archive(self, conn, create=False):
+        """Attach the archive to ``conn`` unless it already is; False if there is no archive yet."""
+        if any(name == 'archive' for _, name, _ in conn.execute('PRAGMA database_list')):
+            return True
+        if not create and not os.path.exists(self.archive_path):
+            return False
+        conn.execute('ATTACH DATABASE ? AS archive', (self.archive_path,))
+        if create:
+            conn.execute('PRAGMA archive.journal_mode=WAL')
+            conn.execute(ARCHIVE_SCHEMA)
+        return True
+
+    def backup(self, target, name='main', pages=-1, progress=None, sleep=0.25):
+        """Copy database ``name`` ('main' or 'archive') into the ``target`` connection.
+
+        Uses the online backup API on the write connection. Each step runs
+        under the write lock, so it never shares the connection with an open
+        transaction; the lock is released between steps, while ``progress``
+        runs. Pages committed through the write connection meanwhile are
+        written to the copy as well, but a commit by any other connection
+        (another process) restarts the copy from the first page. Returns
+        False if ``name`` is 'archive' and there is no archive yet.
+        """
+        def step(status, remaining, total):
+            # The copy takes the lock back before its next step
+            self._write_lock.release()
+            try:
+                if progress is not None:
+                    progress(status, remaining, total)
+            finally:
+                self._write_lock.acquire()
+
+        with self._write_lock:
+            if name == 'archive' and not self.attach_archive(self._writer):
+                return False
+            self._writer.backup(target, pages=pages, progress=step, name=name, sleep=sleep)
+        return True
+
+    def _begin_immediate(self):
+        delay = settings.DB_RETRY_BASE_DELAY / 1000
+        for attempt in range(settings.DB_WRITE_RETRIES + 1):
+            started = time.perf_counter()
+            try:
+                self._writer.execute('BEGIN IMMEDIATE')
+            except sqlite3.OperationalError as error:
+                self._count('lock_waits', time.perf_counter() - started)
+                if not is_busy(error) or attempt == settings.DB_WRITE_RETRIES:
+                    self._count('busy_failures')
+                    raise
+                self._count('busy_retries')
+                # Full jitter keeps competing terminals from retrying in lockstep
+                time.sleep(random.uniform(0, delay))
+                delay = min(delay * 2, settings.DB_RETRY_MAX_DELAY / 1000)
+            else:
+                waited = time.perf_counter() - started
+                if waited > LOCK_WAIT_THRESHOLD:
+                    # SQLite's busy handler had to wait for another connection
+                    self._count('lock_waits', waited)
+                self._count('transactions')
+                return
+
+    def _count(self, name, seconds=None):
+        with self._stats_lock:
+            self._stats[name] += 1
+            if seconds is not None:
+                self._stats['lock_wait_seconds'] += seconds
+
+    def write_stats(self):
+        """Counters of write transactions, busy retries and lock waits since start."""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def ensure_schema(self, create_schema):
+        """Run ``create_schema`` once per process, however many ``Database`` objects exist."""
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if not self._schema_ready:
+                create_schema()
+                self._schema_ready = True
+
+    def close(self):
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        self._local = threading.local()
+        with self._write_lock:
+            self._writer.close()
+
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def _pragma_value(name, value):
+    """Checked value of a connection pragma, safe to format into ``PRAGMA name=value``.
+
+    ``synchronous`` takes a mode name or its number (0-3), the other pragmas
+    integers; anything else raises ValueError.
+    """
+    if name == 'synchronous':
+        mode = str(value).strip().upper()
+        if mode in SYNCHRONOUS_MODES:
+            return mode
+        if mode in ('0', '1', '2', '3'):
+            return SYNCHRONOUS_MODES[int(mode)]
+        raise ValueError(f'synchronous must be OFF, NORMAL, FULL, EXTRA or 0-3, not {value!r}')
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f'{name} must be an integer, not {value!r}')
+    return value
+
+
+def archive_db_path(path):
+    """The archive file that goes with database ``path``."""
+    if settings.ARCHIVE_DB and path == settings.DB_PATH:
+        return settings.ARCHIVE_DB
+    stem, extension = os.path.splitext(path)
+    return f'{stem}-archive{extension or ".db"}'
+
+
+# Archived orders keep the names they had when archived (users and products
+# may be deleted later); the columns up to status match ``Order``
+ARCHIVE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS archive.orders (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        product_id INTEGER NOT NULL,
+        product_name TEXT,
+        quantity INTEGER NOT NULL,
+        total_price REAL NOT NULL,
+        created_at TEXT,
+        status TEXT NOT NULL,
+        archived_at TEXT NOT NULL
+    )
+'''
+
+
+def is_busy(error):
+    """True if ``error`` (an ``sqlite3.OperationalError``) means the database was locked."""
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, getattr(sqlite3, 'SQLITE_LOCKED', 6))
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+PAGE_SIZE = 200
+
+
+def encode_cursor(key):
+    """Pack a keyset position into an opaque string cursor."""
+    return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Inverse of ``encode_cursor``; ``None`` means the first page."""
+    if cursor is None:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError(f'Invalid page cursor: {cursor!r}')
+
+
+def _page(rows, page_size, key, record):
+    """Split a ``page_size + 1`` row fetch into the page's records and the next cursor.
+
+    ``key`` gives the keyset position of a raw row, ``record`` builds a record from one.
+    """
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(key(rows[-1]))
+    return [record(*row) for row in rows], next_cursor
+
+
+def _row_id(row):
+    return row[0]
+
+
+# Column lists matching the record fields, so rows can be passed to the record as is
+PRODUCT_COLUMNS = 'products.id, products.name, products.description, products.price, products.quantity'
+ORDER_COLUMNS = '''orders.id, orders.user_id, users.username, orders.product_id, products.name,
+                   orders.quantity, orders.total_price, orders.created_at, orders.status'''
+ORDER_TABLES = '''orders
+            JOIN users ON orders.user_id = users.id
+            JOIN products ON orders.product_id = products.id'''
+
+
+def archive_cutoff(older_than_days=None):
+    """UTC timestamp in the format of ``orders.created_at``, ``older_than_days`` days ago."""
+    older_than_days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    # created_at is CURRENT_TIMESTAMP: UTC without an offset
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=older_than_days)
+    return cutoff.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _cached(*tags):
+    """Serve a read method through ``ConnectionManager.cache``.
+
+    The key is the method name plus its bound arguments (defaults filled in,
+    so ``get_products_page()`` and ``get_products_page(None, PAGE_SIZE)``
+    share an entry). ``tags`` name the data the result depends on; a tag
+    may be a callable that builds it from the arguments. Writes invalidate
+    those tags through ``Database._invalidate``.
+    """
+    def decorate(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+            del arguments['self']
+            key = (method.__name__, tuple(arguments.values()))
+            entry_tags = [tag(arguments) if callable(tag) else tag for tag in tags]
+            return self.manager.cache.get_or_load(key, entry_tags, lambda: method(self, *args, **kwargs))
+        return wrapper
+    return decorate
+
+
+def _user_orders(arguments):
+    return ('orders', arguments['user_id'])
+
+
+def open_database(path=None):
+    """The store the app should use: the shared server when ``settings.SERVER_URL``
+    is set (see ``server.py``), otherwise the database file itself."""
+    if path is None and settings.SERVER_URL:
+        from remote_database import RemoteDatabase
+        return RemoteDatabase(settings.SERVER_URL)
+    return Database(path)
+
+
+def configure_database(path=None, **pragmas):
+    """Create the shared connection manager with explicit pragmas.
+
+    Must be called before the first ``Database()`` for the settings to apply.
+    """
+    return ConnectionManager.instance(path, **pragmas)
+
+
+class _Shortage(Exception):
+    """Raised inside a checkout transaction to roll it back."""
+
+    def __init__(self, lines):
+        super().__init__(lines)
+        self.lines = lines
+
+
 class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('app.db')
-        self.conn.row_factory = sqlite3.Row  # Enable named column access
-        self.create_tables()
+    def __init__(self, path=None):
+        self.manager = ConnectionManager.instance(path)
+        self.manager.ensure_schema(self.create_tables)
+
+    @property
+    def conn(self):
+        return self.manager.reader()
+
+    # Query cache. Tags: 'products' (rows of products), 'product_names'
+    # (product names joined into orders and sales), ('orders', user_id) and
+    # 'all_orders' (order lists), 'orders' (any order list, for changes made
+    # elsewhere), 'sales' (analytics summaries), 'archive' (archived orders).
+    def _invalidate(self, *tags):
+        self.manager.cache.invalidate(*tags)
+
+    def invalidate_cache(self, *tags):
+        """Drop cached results for changes this process did not make itself (see ``ChangeWatcher``)."""
+        if tags:
+            self.manager.cache.invalidate(*tags)
+        else:
+            self.manager.cache.clear()
+
+    def cache_stats(self):
+        return self.manager.cache.stats()
 
     def create_tables(self):
-        with self.conn:
-            cursor = self.conn.cursor()
+        migrations.migrate(self.manager)
 
-            # Table for users
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password BLOB NOT NULL,
-                    role TEXT NOT NULL CHECK(role IN ('admin', 'client'))
-                )
-            ''')
+        with self.manager.writer() as conn:
+            cursor = conn.cursor()
 
-            # Table for products
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS products (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    description TEXT,
-                    price REAL NOT NULL CHECK(price >= 0),
-                    quantity INTEGER NOT NULL CHECK(quantity >= 0)
-                )
-            ''')
+            # Not a numbered migration: FTS5 depends on the SQLite build the
+            # process runs with, so the index is checked on every start
+            self.manager.fts_enabled = self._create_search_index(cursor)
 
-            # Table for orders
+            # Add default admin user if not exists
+            cursor.execute('SELECT 1 FROM users WHERE role = ?', ('admin',))
+            has_admin = cursor.fetchone() is not None
+
+        if not has_admin:
+            self.add_user('admin', 'admin', 'admin')
+
+    def _create_search_index(self, cursor):
+        """Create the FTS5 index over product names and descriptions.
+
+        The index is an external-content table kept in sync by triggers, so
+        products are stored once. Returns False when this SQLite build has no
+        FTS5, in which case search falls back to LIKE scans.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+        if cursor.fetchone():
+            return True
+        try:
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS orders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    product_id INTEGER NOT NULL,
-                    quantity INTEGER NOT NULL CHECK(quantity > 0),
-                    total_price REAL NOT NULL CHECK(total_price >= 0),
-                    FOREIGN KEY(user_id) REFERENCES users(id),
-                    FOREIGN KEY(product_id) REFERENCES products(id)
+                CREATE VIRTUAL TABLE products_fts USING fts5(
+                    name, description,
+                    content='products', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2',
+                    prefix='2 3'
                 )
             ''')
+        except sqlite3.OperationalError:
+            return False
 
-            # Add default admin user if not exists
-            cursor.execute('SELECT * FROM users WHERE role = ?', ('admin',))
-            if not cursor.fetchone():
-                self.add_user('admin', 'admin', 'admin')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts (rowid, name, description)
+                VALUES (new.id, new.name, new.description);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name, description)
+                VALUES ('delete', old.id, old.name, old.description);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description ON products BEGIN
+                INSERT INTO products_fts (products_fts, rowid, name, description)
+                VALUES ('delete', old.id, old.name, old.description);
+                INSERT INTO products_fts (rowid, name, description)
+                VALUES (new.id, new.name, new.description);
+            END
+        ''')
+        # Index products that existed before the search index was added
+        cursor.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+        return True
+
+    @staticmethod
+    def _fts_query(search_text):
+        """Turn user input into an FTS5 prefix query: every word must match a word start."""
+        words = re.findall(r'\w+', search_text)
+        return ' '.join('"{}"*'.format(word) for word in words)
 
     # User management methods
+    @staticmethod
+    def hash_password(password):
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS))
+
+    @staticmethod
+    def hash_rounds(hashed_password):
+        """Work factor of a stored bcrypt hash (``$2b$<rounds>$...``), or None if unreadable."""
+        try:
+            return int(bytes(hashed_password).split(b'$')[2])
+        except (IndexError, ValueError):
+            return None
+
     def add_user(self, username, password, role='client'):
-        cursor = self.conn.cursor()
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        hashed_password = self.hash_password(password)
         try:
-            cursor.execute('''
-                INSERT INTO users (username, password, role)
-                VALUES (?, ?, ?)
-            ''', (username, hashed_password, role))
-            self.conn.commit()
+            with self.manager.writer() as conn:
+                conn.execute('''
+                    INSERT INTO users (username, password, role)
+                    VALUES (?, ?, ?)
+                ''', (username, hashed_password, role))
             return True
         except sqlite3.IntegrityError:
             return False
 
     def authenticate_user(self, username, password):
+        """Check the password; slow (bcrypt), so UI code should call it off the GUI thread."""
         cursor = self.conn.cursor()
         cursor.execute('SELECT id, username, password, role FROM users WHERE username = ?', (username,))
-        user = cursor.fetchone()
-        if user and bcrypt.checkpw(password.encode('utf-8'), user['password']):
-            return {'id': user['id'], 'username': user['username'], 'role': user['role']}
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        user_id, username, hashed_password, role = row
+        if bcrypt.checkpw(password.encode('utf-8'), hashed_password):
+            if self.hash_rounds(hashed_password) != settings.BCRYPT_ROUNDS:
+                self._rehash_password(user_id, hashed_password, password)
+            return User(user_id, username, role, None)
         else:
             return None
 
+    def login(self, username, password):
+        """Authenticate and open a session: the returned user's ``token`` is set."""
+        user = self.authenticate_user(username, password)
+        if user is not None:
+            user.token = self.manager.sessions.issue(user)
+        return user
+
+    def resume_session(self, token, touch=True):
+        """User of a live, unlocked session without re-checking the password, or None.
+
+        ``touch`` restarts the session's idle timer.
+        """
+        return self.manager.sessions.validate(token, touch)
+
+    def lock_session(self, token, pin):
+        """Lock a session when its terminal switches users; returning to it takes ``pin``."""
+        return self.manager.sessions.lock(token, pin)
+
+    def unlock_session(self, token, pin):
+        """User of a locked session if ``pin`` is right, or None."""
+        return self.manager.sessions.unlock(token, pin)
+
+    def is_session_locked(self, token):
+        """True while a locked session can still be resumed with its PIN."""
+        return self.manager.sessions.is_locked(token)
+
+    def end_session(self, token):
+        self.manager.sessions.revoke(token)
+
+    def change_password(self, user_id, new_password):
+        """Set a new password and end every open session of the user."""
+        # bcrypt runs before the transaction: the write lock is held only for the UPDATE
+        new_hash = self.hash_password(new_password)
+        with self.manager.writer() as conn:
+            updated = conn.execute('UPDATE users SET password = ? WHERE id = ?', (new_hash, user_id)).rowcount
+            self.manager.sessions.revoke_user(user_id)
+        return bool(updated)
+
+    def _rehash_password(self, user_id, old_hash, password):
+        """Store the password again with the configured work factor.
+
+        The hash is computed before the write transaction, so bcrypt never
+        holds the write lock. The update only applies if the hash is still
+        the one that was verified, so a concurrent password change is never
+        overwritten.
+        """
+        new_hash = self.hash_password(password)
+        with self.manager.writer() as conn:
+            conn.execute(
+                'UPDATE users SET password = ? WHERE id = ? AND password = ?',
+                (new_hash, user_id, old_hash),
+            )
+
     # Product management methods
     def add_product(self, name, description, price, quantity):
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute('''
+        with self.manager.writer() as conn:
+            conn.execute('''
                 INSERT INTO products (name, description, price, quantity)
                 VALUES (?, ?, ?, ?)
             ''', (name, description, price, quantity))
+        self._invalidate('products')
 
+    @_cached('products')
     def get_products(self):
         cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM products')
-        return cursor.fetchall()
+        cursor.execute(f'SELECT {PRODUCT_COLUMNS} FROM products')
+        return [Product(*row) for row in cursor]
+
+    @_cached('products')
+    def get_products_page(self, cursor=None, page_size=PAGE_SIZE):
+        """One page of products ordered by id; returns ``(rows, next_cursor)``."""
+        after_id = decode_cursor(cursor) or 0
+        rows = self.conn.execute(
+            f'SELECT {PRODUCT_COLUMNS} FROM products WHERE id > ? ORDER BY id LIMIT ?', (after_id, page_size + 1)
+        ).fetchall()
+        return _page(rows, page_size, _row_id, Product)
+
+    def upsert_products(self, rows):
+        """Insert or update a batch of products in one transaction.
+
+        ``rows`` are ``(id, name, description, price, quantity)`` tuples; rows
+        with ``id`` None are inserted as new products, the rest replace the
+        product with that id or create it.
+        """
+        new_rows = [row[1:] for row in rows if row[0] is None]
+        keyed_rows = [row for row in rows if row[0] is not None]
+        with self.manager.writer() as conn:
+            if new_rows:
+                conn.executemany('''
+                    INSERT INTO products (name, description, price, quantity)
+                    VALUES (?, ?, ?, ?)
+                ''', new_rows)
+            if keyed_rows:
+                conn.executemany('''
+                    INSERT INTO products (id, name, description, price, quantity)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        name = excluded.name,
+                        description = excluded.description,
+                        price = excluded.price,
+                        quantity = excluded.quantity
+                ''', keyed_rows)
+        self._invalidate('products', 'product_names')
 
     def update_product(self, product_id, name, description, price, quantity):
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute('''
+        with self.manager.writer() as conn:
+            conn.execute('''
                 UPDATE products
                 SET name = ?, description = ?, price = ?, quantity = ?
                 WHERE id = ?
             ''', (name, description, price, quantity, product_id))
+        self._invalidate('products', 'product_names')
 
     def delete_product(self, product_id):
-        with self.conn:
-            cursor = self.conn.cursor()
-            cursor.execute('DELETE FROM products WHERE id = ?', (product_id,))
+        with self.manager.writer() as conn:
+            conn.execute('DELETE FROM products WHERE id = ?', (product_id,))
+        self._invalidate('products', 'product_names')
 
     # Order management methods
     def place_order(self, user_id, product_id, quantity):
-        with self.conn:
-            cursor = self.conn.cursor()
-            # Check product availability
-            cursor.execute('SELECT price, quantity FROM products WHERE id = ?', (product_id,))
-            product = cursor.fetchone()
-            if product and product['quantity'] >= quantity:
-                total_price = product['price'] * quantity
-                # Insert order
-                cursor.execute('''
-                    INSERT INTO orders (user_id, product_id, quantity, total_price)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, product_id, quantity, total_price))
-                # Update product quantity
-                cursor.execute('''
-                    UPDATE products SET quantity = quantity - ? WHERE id = ?
-                ''', (quantity, product_id))
-                return True
-            else:
-                return False
+        success, _ = self.checkout(user_id, [(product_id, quantity)])
+        return success
+
+    def checkout(self, user_id, lines):
+        """Place one order row per cart line in a single transaction.
+
+        ``lines`` is an iterable of ``(product_id, quantity)``; repeated products
+        are merged. Either every line is ordered and ``(True, [])`` is returned,
+        or nothing is written and ``(False, shortages)`` lists each line that
+        cannot be served as ``(product_id, requested, available)``.
+        """
+        requested = {}
+        for product_id, quantity in lines:
+            requested[product_id] = requested.get(product_id, 0) + quantity
+        if not requested:
+            return False, []
 
+        try:
+            with self.manager.writer() as conn:
+                # Each decrement only succeeds while enough stock is left, so
+                # concurrent terminals can never oversell a product
+                shortages = []
+                for product_id, quantity in requested.items():
+                    updated = conn.execute('''
+                        UPDATE products SET quantity = quantity - ?
+                        WHERE id = ? AND quantity >= ? AND ? > 0
+                    ''', (quantity, product_id, quantity, quantity)).rowcount
+                    if not updated:
+                        shortages.append((product_id, quantity))
+                if shortages:
+                    raise _Shortage(self._shortage_details(conn, shortages))
+
+                conn.executemany('''
+                    INSERT INTO orders (user_id, product_id, quantity, total_price, created_at)
+                    SELECT ?, id, ?, price * ?, datetime('now') FROM products WHERE id = ?
+                ''', [
+                    (user_id, quantity, quantity, product_id)
+                    for product_id, quantity in requested.items()
+                ])
+        except _Shortage as shortage:
+            return False, shortage.lines
+        self._invalidate('products', 'all_orders', ('orders', user_id), 'sales')
+        return True, []
+
+    @staticmethod
+    def _shortage_details(conn, shortages):
+        details = []
+        for product_id, quantity in shortages:
+            row = conn.execute('SELECT quantity FROM products WHERE id = ?', (product_id,)).fetchone()
+            details.append((product_id, quantity, row[0] if row else 0))
+        return details
+
+    # A user's order history: orders of every status still in the main database
+    @_cached(_user_orders, 'orders', 'product_names')
     def get_orders_by_user(self, user_id):
         cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT orders.id, products.name, orders.quantity, orders.total_price
-            FROM orders
-            JOIN products ON orders.product_id = products.id
+        cursor.execute(f'''
+            SELECT {ORDER_COLUMNS}
+            FROM {ORDER_TABLES}
             WHERE orders.user_id = ?
         ''', (user_id,))
-        return cursor.fetchall()
+        return [Order(*row) for row in cursor]
 
+    @_cached(_user_orders, 'orders', 'product_names')
+    def get_orders_by_user_page(self, user_id, cursor=None, page_size=PAGE_SIZE):
+        """One page of a user's orders ordered by id; returns ``(rows, next_cursor)``."""
+        rows = self.conn.execute(f'''
+            SELECT {ORDER_COLUMNS}
+            FROM {ORDER_TABLES}
+            WHERE orders.user_id = ? AND orders.id > ?
+            ORDER BY orders.id
+            LIMIT ?
+        ''', (user_id, decode_cursor(cursor) or 0, page_size + 1)).fetchall()
+        return _page(rows, page_size, _row_id, Order)
+
+    @_cached('all_orders', 'orders', 'product_names')
     def get_all_orders(self):
         cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT orders.id, users.username, products.name, orders.quantity, orders.total_price
-            FROM orders
-            JOIN users ON orders.user_id = users.id
-            JOIN products ON orders.product_id = products.id
-        ''')
-        return cursor.fetchall()
+        cursor.execute(f'SELECT {ORDER_COLUMNS} FROM {ORDER_TABLES}')
+        return [Order(*row) for row in cursor]
+
+    @_cached('all_orders', 'orders', 'product_names')
+    def get_all_orders_page(self, cursor=None, page_size=PAGE_SIZE):
+        """One page of all orders ordered by id; returns ``(rows, next_cursor)``."""
+        rows = self.conn.execute(f'''
+            SELECT {ORDER_COLUMNS}
+            FROM {ORDER_TABLES}
+            WHERE orders.id > ?
+            ORDER BY orders.id
+            LIMIT ?
+        ''', (decode_cursor(cursor) or 0, page_size + 1)).fetchall()
+        return _page(rows, page_size, _row_id, Order)
+
+    @_cached('all_orders', 'orders', 'product_names')
+    def get_placed_orders_page(self, cursor=None, page_size=PAGE_SIZE):
+        """One page of the orders awaiting fulfillment, oldest first; returns ``(rows, next_cursor)``."""
+        # Served by the partial index idx_orders_placed
+        rows = self.conn.execute(f'''
+            SELECT {ORDER_COLUMNS}
+            FROM {ORDER_TABLES}
+            WHERE orders.status = 'placed' AND orders.id > ?
+            ORDER BY orders.id
+            LIMIT ?
+        ''', (decode_cursor(cursor) or 0, page_size + 1)).fetchall()
+        return _page(rows, page_size, _row_id, Order)
+
+    def get_order_owner(self, order_id):
+        """id of the user who placed the order, or None if there is no such order."""
+        row = self.conn.execute('SELECT user_id FROM orders WHERE id = ?', (order_id,)).fetchone()
+        return row[0] if row else None
+
+    def get_products_by_ids(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return []
+        placeholders = ', '.join('?' * len(product_ids))
+        cursor = self.conn.execute(
+            f'SELECT {PRODUCT_COLUMNS} FROM products WHERE id IN ({placeholders}) ORDER BY id', product_ids
+        )
+        return [Product(*row) for row in cursor]
+
+    def get_orders_by_ids(self, order_ids):
+        order_ids = list(order_ids)
+        if not order_ids:
+            return []
+        placeholders = ', '.join('?' * len(order_ids))
+        cursor = self.conn.execute(f'''
+            SELECT {ORDER_COLUMNS}
+            FROM {ORDER_TABLES}
+            WHERE orders.id IN ({placeholders})
+            ORDER BY orders.id
+        ''', order_ids)
+        return [Order(*row) for row in cursor]
+
+    # Sales analytics: read only the summary tables kept up to date by triggers
+    # (migrations._004_sales_analytics), never the orders table itself.
+    # Days are 'YYYY-MM-DD' in UTC, both bounds inclusive; date_from=None also
+    # includes orders placed before created_at was recorded (day '').
+    @staticmethod
+    def _day_range(date_from, date_to):
+        return (date_from or '', date_to or '9999-12-31')
+
+    @_cached('sales')
+    def get_sales_totals(self, date_from=None, date_to=None):
+        row = self.conn.execute('''
+            SELECT NULL, NULL, COALESCE(SUM(orders), 0), COALESCE(SUM(units), 0), COALESCE(SUM(revenue), 0)
+            FROM sales_by_product_day
+            WHERE day BETWEEN ? AND ?
+        ''', self._day_range(date_from, date_to)).fetchone()
+        return Sales(*row)
 
+    @_cached('sales')
+    def get_sales_by_day(self, date_from=None, date_to=None):
+        cursor = self.conn.execute('''
+            SELECT day, NULL, SUM(orders), SUM(units), SUM(revenue)
+            FROM sales_by_product_day
+            WHERE day BETWEEN ? AND ?
+            GROUP BY day
+            ORDER BY day
+        ''', self._day_range(date_from, date_to))
+        return [Sales(*row) for row in cursor]
+
+    @_cached('sales', 'product_names')
+    def get_top_products(self, date_from=None, date_to=None, limit=10):
+        # LEFT JOIN: deleted products keep their sales history
+        cursor = self.conn.execute('''
+            SELECT sales.product_id, products.name, sales.orders, sales.units, sales.revenue
+            FROM (
+                SELECT product_id, SUM(orders) AS orders, SUM(units) AS units, SUM(revenue) AS revenue
+                FROM sales_by_product_day
+                WHERE day BETWEEN ? AND ?
+                GROUP BY product_id
+            ) AS sales
+            LEFT JOIN products ON products.id = sales.product_id
+            ORDER BY sales.revenue DESC
+            LIMIT ?
+        ''', (*self._day_range(date_from, date_to), limit))
+        return [Sales(*row) for row in cursor]
+
+    @_cached('sales')
+    def get_top_customers(self, date_from=None, date_to=None, limit=10):
+        cursor = self.conn.execute('''
+            SELECT sales.user_id, users.username, sales.orders, sales.units, sales.revenue
+            FROM (
+                SELECT user_id, SUM(orders) AS orders, SUM(units) AS units, SUM(revenue) AS revenue
+                FROM sales_by_user_day
+                WHERE day BETWEEN ? AND ?
+                GROUP BY user_id
+            ) AS sales
+            LEFT JOIN users ON users.id = sales.user_id
+            ORDER BY sales.revenue DESC
+            LIMIT ?
+        ''', (*self._day_range(date_from, date_to), limit))
+        return [Sales(*row) for row in cursor]
+
+    # Change feed used by live refresh
+    def data_version(self):
+        """``PRAGMA data_version`` of this thread's connection; changes when another connection commits."""
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def get_changes(self, after_id, limit):
+        """``(id, table_name, row_id)`` change log entries after ``after_id``."""
+        return self.conn.execute(
+            'SELECT id, table_name, row_id FROM change_log WHERE id > ? ORDER BY id LIMIT ?',
+            (after_id, limit),
+        ).fetchall()
+
+    def change_log_bounds(self):
+        """``(oldest, newest)`` change ids still in the log, ``(None, None)`` if empty."""
+        row = self.conn.execute('SELECT MIN(id), MAX(id) FROM change_log').fetchone()
+        return row[0], row[1]
+
+    def own_changes(self, after_id):
+        """``(first, last]`` id ranges of change log entries after ``after_id`` that this process wrote."""
+        return self.manager.own_changes(after_id)
+
+    def prune_changes(self, keep):
+        """Drop all but the newest ``keep`` change log entries."""
+        with self.manager.writer() as conn:
+            conn.execute(
+                'DELETE FROM change_log WHERE id <= (SELECT MAX(id) FROM change_log) - ?', (keep,)
+            )
+
+    @_cached('products')
     def search_products(self, search_text):
         cursor = self.conn.cursor()
-        query = '''
-            SELECT * FROM products
+        fts_query = self._fts_query(search_text)
+        if self.manager.fts_enabled and fts_query:
+            cursor.execute(f'''
+                SELECT {PRODUCT_COLUMNS}
+                FROM products_fts
+                JOIN products ON products.id = products_fts.rowid
+                WHERE products_fts MATCH ?
+                ORDER BY products_fts.rank, products.id
+            ''', (fts_query,))
+            return [Product(*row) for row in cursor]
+        query = f'''
+            SELECT {PRODUCT_COLUMNS} FROM products
             WHERE name LIKE ? OR description LIKE ?
         '''
         search_pattern = f'%{search_text}%'
         cursor.execute(query, (search_pattern, search_pattern))
-        return cursor.fetchall()
+        return [Product(*row) for row in cursor]
+
+    @_cached('products')
+    def search_products_page(self, search_text, cursor=None, page_size=PAGE_SIZE):
+        """One page of search results in rank order; returns ``(rows, next_cursor)``."""
+        if not search_text:
+            return self.get_products_page(cursor, page_size)
+        fts_query = self._fts_query(search_text)
+        if self.manager.fts_enabled and fts_query:
+            after_rank, after_id = decode_cursor(cursor) or (None, 0)
+            rows = self.conn.execute(f'''
+                SELECT {PRODUCT_COLUMNS}, products_fts.rank
+                FROM products_fts
+                JOIN products ON products.id = products_fts.rowid
+                WHERE products_fts MATCH :query
+                  AND (:rank IS NULL OR products_fts.rank > :rank
+                       OR (products_fts.rank = :rank AND products.id > :id))
+                ORDER BY products_fts.rank, products.id
+                LIMIT :limit
+            ''', {'query': fts_query, 'rank': after_rank, 'id': after_id, 'limit': page_size + 1}).fetchall()
+            # The last column is the rank: part of the cursor, not of the record
+            return _page(rows, page_size, lambda row: (row[-1], row[0]), lambda *row: Product(*row[:-1]))
+        search_pattern = f'%{search_text}%'
+        rows = self.conn.execute(f'''
+            SELECT {PRODUCT_COLUMNS} FROM products
+            WHERE (name LIKE ? OR description LIKE ?) AND id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (search_pattern, search_pattern, decode_cursor(cursor) or 0, page_size + 1)).fetchall()
+        return _page(rows, page_size, _row_id, Product)
 
     def cancel_order(self, order_id):
-        with self.conn:
-            cursor = self.conn.cursor()
+        """Cancel a placed order and return its quantity to stock; False if it is not placed."""
+        # BEGIN IMMEDIATE holds the write lock from the read onward, so the
+        # order cannot be cancelled twice by two terminals at once
+        with self.manager.writer() as conn:
+            cursor = conn.cursor()
             # Get order details
-            cursor.execute('SELECT product_id, quantity FROM orders WHERE id = ?', (order_id,))
+            cursor.execute(
+                "SELECT user_id, product_id, quantity FROM orders WHERE id = ? AND status = 'placed'", (order_id,)
+            )
             order = cursor.fetchone()
             if order:
-                product_id, quantity = order['product_id'], order['quantity']
+                user_id, product_id, quantity = order
                 # Update product quantity
                 cursor.execute('UPDATE products SET quantity = quantity + ? WHERE id = ?', (quantity, product_id))
-                # Delete the order
-                cursor.execute('DELETE FROM orders WHERE id = ?', (order_id,))
-                return True
-            else:
-                return False
\ No newline at end of file
+                # The order stays in history; triggers take it out of the sales summaries
+                cursor.execute("UPDATE orders SET status = 'cancelled' WHERE id = ?", (order_id,))
+        if not order:
+            return False
+        self._invalidate('products', 'all_orders', ('orders', user_id), 'sales')
+        return True
+
+    def fulfill_order(self, order_id):
+        """Mark a placed order as fulfilled; False if it is not placed."""
+        with self.manager.writer() as conn:
+            row = conn.execute(
+                "SELECT user_id FROM orders WHERE id = ? AND status = 'placed'", (order_id,)
+            ).fetchone()
+            if row:
+                conn.execute("UPDATE orders SET status = 'fulfilled' WHERE id = ?", (order_id,))
+        if not row:
+            return False
+        self._invalidate('all_orders', ('orders', row[0]))
+        return True
+
+    # Archive: finished orders older than a cutoff move to the attached
+    # archive database (ConnectionManager.archive_writer), so the hot orders
+    # table and its joins only grow with recent and still placed orders.
+    # Placed orders are never archived: they can still be cancelled.
+    def archive_orders(self, before, batch_size=None):
+        """Move up to ``batch_size`` finished orders created before ``before`` to the archive.
+
+        ``before`` is a 'YYYY-MM-DD HH:MM:SS' UTC timestamp; orders without
+        ``created_at`` count as older than any cutoff. Returns the number of
+        orders moved; the sales summaries are not affected.
+        """
+        batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+        # Two transactions, copy then delete: a crash in between leaves the
+        # orders in both databases, and the next run copies them again
+        # (INSERT OR REPLACE) before deleting them. Finished orders never
+        # change, so the copy stays exact.
+        with self.manager.archive_writer() as conn:
+            rows = conn.execute('''
+                SELECT id, user_id FROM orders
+                WHERE status <> 'placed' AND (created_at IS NULL OR created_at < ?)
+                ORDER BY created_at
+                LIMIT ?
+            ''', (before, batch_size)).fetchall()
+            if not rows:
+                return 0
+            ids = [order_id for order_id, _ in rows]
+            placeholders = ', '.join('?' * len(ids))
+            conn.execute(f'''
+                INSERT OR REPLACE INTO archive.orders
+                SELECT orders.id, orders.user_id, users.username, orders.product_id, products.name,
+                       orders.quantity, orders.total_price, orders.created_at, orders.status,
+                       datetime('now')
+                FROM orders
+                LEFT JOIN users ON orders.user_id = users.id
+                LEFT JOIN products ON orders.product_id = products.id
+                WHERE orders.id IN ({placeholders})
+            ''', ids)
+        # Archiving runs in the background: open screens learn about the
+        # removed orders from the change log as if another instance did it
+        with self.manager.writer(track_changes=False) as conn:
+            conn.execute(f"DELETE FROM orders WHERE id IN ({placeholders}) AND status <> 'placed'", ids)
+        # The users' cached histories still hold the archived orders
+        user_tags = {('orders', user_id) for _, user_id in rows}
+        self._invalidate('all_orders', 'archive', *user_tags)
+        return len(ids)
+
+    def archive_old_orders(self, older_than_days=None, batch_size=None, pause=None):
+        """Archive every finished order older than ``older_than_days`` days, batch by batch.
+
+        Sleeps ``pause`` milliseconds between batches so other writers get
+        the lock. Returns the total number of orders moved.
+        """
+        before = archive_cutoff(older_than_days)
+        pause = settings.ARCHIVE_PAUSE if pause is None else pause
+        total = 0
+        while True:
+            moved = self.archive_orders(before, batch_size)
+            total += moved
+            if not moved:
+                return total
+            time.sleep(pause / 1000)
+
+    @_cached('archive', 'orders')
+    def get_archived_orders_page(self, cursor=None, page_size=PAGE_SIZE):
+        """One page of archived orders ordered by id; returns ``(rows, next_cursor)``."""
+        conn = self.conn
+        if not self.manager.attach_archive(conn):
+            return [], None
+        rows = conn.execute('''
+            SELECT id, user_id, username, product_id, product_name, quantity, total_price, created_at, status
+            FROM archive.orders
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        ''', (decode_cursor(cursor) or 0, page_size + 1)).fetchall()
+        return _page(rows, page_size, _row_id, Order)
+
+
+# Per-method timings when WAREHOUSE_DIAGNOSTICS is on
+diagnostics.instrument(Database)
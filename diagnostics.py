@@ -0,0 +1,386 @@
+# diagnostics.py
+"""Opt-in instrumentation of the data layer (``WAREHOUSE_DIAGNOSTICS=1``).
+
+When enabled at startup:
+
+* every public method of ``Database`` (and ``RemoteDatabase``) is timed,
+  so a slow terminal shows whether search, order lists or the bcrypt in
+  ``authenticate_user`` is to blame;
+* every SQL statement is timed from ``execute`` until its rows have been
+  fetched, through the ``TracedConnection``/``TracedCursor`` factories, and
+  ``set_trace_callback`` counts everything SQLite actually runs, including
+  trigger bodies and implicit ``BEGIN``/``COMMIT``;
+* statements slower than ``SLOW_QUERY_MS`` are logged to the
+  ``warehouse.slow_query`` logger together with their ``EXPLAIN QUERY PLAN``.
+
+Latencies go into rolling log-scale histograms (the last
+``DIAGNOSTICS_WINDOWS`` windows of ``DIAGNOSTICS_WINDOW`` seconds): recording
+is a bucket increment, and percentiles are reported as bucket upper bounds.
+``snapshot()`` returns everything as plain data, ``dump(path)`` writes it as
+JSON for a support ticket. When disabled nothing is wrapped and the cost is
+zero.
+"""
+import bisect
+import collections
+import datetime
+import functools
+import json
+import logging
+import platform
+import re
+import sqlite3
+import threading
+import time
+
+import settings
+
+slow_query_logger = logging.getLogger('warehouse.slow_query')
+
+# Bucket upper bounds in milliseconds: 0.01 ms .. ~10 s, doubling
+BUCKET_BOUNDS = [0.01 * 2 ** power for power in range(21)]
+SLOW_LOG_SIZE = 200
+MAX_STATEMENT_KEYS = 500
+
+
+def enabled():
+    return settings.DIAGNOSTICS
+
+
+class Histogram:
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total, 3),
+            'mean_ms': round(self.total / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.50), 3),
+            'p95_ms': round(self.percentile(0.95), 3),
+            'p99_ms': round(self.percentile(0.99), 3),
+            'max_ms': round(self.max, 3),
+        }
+
+
+class RollingHistogram:
+    """Histogram of the last ``windows`` time windows; older samples fall out."""
+
+    __slots__ = ('window', 'slots')
+
+    def __init__(self, window, windows):
+        self.window = window
+        self.slots = [(None, None)] * windows
+
+    def add(self, ms, now):
+        index = int(now // self.window)
+        position = index % len(self.slots)
+        slot_index, histogram = self.slots[position]
+        if slot_index != index:
+            histogram = Histogram()
+            self.slots[position] = (index, histogram)
+        histogram.add(ms)
+
+    def merged(self, now):
+        oldest = int(now // self.window) - len(self.slots) + 1
+        result = Histogram()
+        for slot_index, histogram in self.slots:
+            if slot_index is not None and slot_index >= oldest:
+                result.merge(histogram)
+        return result
+
+
+_SPACES = re.compile(r'\s+')
+_PLACEHOLDER_LIST = re.compile(r'\(\?(?:,\s*\?)+\)')
+
+
+def statement_key(sql):
+    """One line per statement shape: whitespace collapsed, ``IN (?, ?, ...)`` folded."""
+    key = _SPACES.sub(' ', sql).strip()
+    return _PLACEHOLDER_LIST.sub('(?, ...)', key)
+
+
+class Recorder:
+    def __init__(self, window=None, windows=None, slow_ms=None, clock=time.monotonic):
+        self.window = settings.DIAGNOSTICS_WINDOW if window is None else window
+        self.windows = settings.DIAGNOSTICS_WINDOWS if windows is None else windows
+        self.slow_ms = settings.SLOW_QUERY_MS if slow_ms is None else slow_ms
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = datetime.datetime.now(datetime.timezone.utc)
+            self._methods = {}
+            self._statements = {}
+            self._executed = collections.Counter()
+            self._slow = collections.deque(maxlen=SLOW_LOG_SIZE)
+
+    def _add(self, table, name, ms):
+        now = self._clock()
+        with self._lock:
+            histogram = table.get(name)
+            if histogram is None:
+                if len(table) >= MAX_STATEMENT_KEYS:
+                    name = '(other)'
+                    histogram = table.get(name)
+                if histogram is None:
+                    histogram = table[name] = RollingHistogram(self.window, self.windows)
+            histogram.add(ms, now)
+
+    def record_method(self, name, ms):
+        self._add(self._methods, name, ms)
+
+    def record_statement(self, conn, sql, parameters, ms):
+        key = statement_key(sql)
+        self._add(self._statements, key, ms)
+        if ms >= self.slow_ms:
+            self._log_slow(conn, key, sql, parameters, ms)
+
+    def count_executed(self, sql):
+        # set_trace_callback: trigger bodies arrive as "-- TRIGGER name"
+        key = statement_key(sql)
+        with self._lock:
+            if len(self._executed) < MAX_STATEMENT_KEYS or key in self._executed:
+                self._executed[key] += 1
+
+    def _log_slow(self, conn, key, sql, parameters, ms):
+        plan = explain(conn, sql, parameters)
+        entry = {
+            'at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'ms': round(ms, 3),
+            'sql': key,
+            'plan': plan,
+        }
+        with self._lock:
+            self._slow.append(entry)
+        slow_query_logger.warning('%.1f ms: %s\n%s', ms, key, '\n'.join(plan))
+
+    def snapshot(self):
+        now = self._clock()
+        with self._lock:
+            methods = {name: h.merged(now).summary() for name, h in self._methods.items()}
+            statements = {name: h.merged(now).summary() for name, h in self._statements.items()}
+            executed = dict(self._executed.most_common(100))
+            slow = list(self._slow)
+        by_total = lambda item: -item[1]['total_ms']
+        return {
+            'enabled': enabled(),
+            'since': self.started.isoformat(timespec='seconds'),
+            'window_seconds': self.window * self.windows,
+            'slow_query_ms': self.slow_ms,
+            'methods': dict(sorted(((k, v) for k, v in methods.items() if v['count']), key=by_total)),
+            'statements': dict(sorted(((k, v) for k, v in statements.items() if v['count']), key=by_total)),
+            'executed_by_sqlite': executed,
+            'slow_queries': slow,
+        }
+
+
+recorder = Recorder()
+
+
+def explain(conn, sql, parameters):
+    """``EXPLAIN QUERY PLAN`` lines for a statement, or a note why there are none."""
+    if parameters is None:
+        return ['(plan unavailable: parameters were an iterator)']
+    try:
+        rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+    except sqlite3.Error as error:
+        return [f'(plan unavailable: {error})']
+    return [row[-1] for row in rows]
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that times each statement from ``execute`` until its rows are fetched."""
+
+    _sql = None
+
+    def _begin(self, sql, parameters, elapsed):
+        self._sql = sql
+        self._parameters = parameters
+        self._elapsed = elapsed
+
+    def _finish(self):
+        if self._sql is not None:
+            sql, self._sql = self._sql, None
+            recorder.record_statement(self.connection, sql, self._parameters, self._elapsed * 1000)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._begin(sql, parameters, time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        if isinstance(seq_of_parameters, (list, tuple)):
+            first = seq_of_parameters[0] if seq_of_parameters else ()
+        else:
+            first = None
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._begin(sql, first, time.perf_counter() - started)
+            self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - started
+            if row is None:
+                self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - started
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - started
+            self._finish()
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            if self._sql is not None:
+                self._elapsed += time.perf_counter() - started
+                self._finish()
+            raise
+        if self._sql is not None:
+            self._elapsed += time.perf_counter() - started
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Most callers fetch one row and drop the cursor
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection whose statements all go through ``TracedCursor``."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(recorder.count_executed)
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute does not go through cursor(), so route it explicitly
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory():
+    """``factory=`` argument for ``sqlite3.connect``."""
+    return TracedConnection if enabled() else sqlite3.Connection
+
+
+def instrument(cls, prefix=None):
+    """Time every public method of ``cls`` (no-op unless diagnostics are enabled)."""
+    if not enabled():
+        return cls
+    prefix = cls.__name__ + '.' if prefix is None else prefix
+    for name, attribute in list(vars(cls).items()):
+        if name.startswith('_'):
+            continue
+        if isinstance(attribute, staticmethod):
+            setattr(cls, name, staticmethod(_timed(prefix + name, attribute.__func__)))
+        elif callable(attribute) and not isinstance(attribute, type):
+            setattr(cls, name, _timed(prefix + name, attribute))
+    return cls
+
+
+def _timed(name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            recorder.record_method(name, (time.perf_counter() - started) * 1000)
+    return wrapper
+
+
+def snapshot(db=None):
+    """Everything recorded so far, plus write and cache counters of ``db`` when given."""
+    data = recorder.snapshot()
+    if db is not None:
+        manager = getattr(db, 'manager', None)
+        if manager is not None:
+            data['write_stats'] = manager.write_stats()
+        try:
+            data['cache_stats'] = db.cache_stats()
+        except Exception as error:
+            data['cache_stats'] = {'error': str(error)}
+    return data
+
+
+def dump(path, db=None):
+    """Write ``snapshot(db)`` with environment details to ``path`` as JSON."""
+    data = {
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'server': settings.SERVER_URL or None,
+        **snapshot(db),
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    return path
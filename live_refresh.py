@@ -0,0 +1,114 @@
+# live_refresh.py
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+import settings
+
+CHANGES_BATCH = 500
+# Больше изменений за один опрос дешевле показать полной перезагрузкой
+MAX_DELTA_CHANGES = 2000
+PRUNE_EVERY_POLLS = 300
+
+
+class ChangeWatcher(QObject):
+    """Следит за изменениями базы, сделанными любым экземпляром приложения.
+
+    По таймеру читается ``PRAGMA data_version`` — это почти бесплатно и
+    сигнализирует о любом чужом коммите. Только когда версия изменилась,
+    из ``change_log`` (заполняется триггерами) читаются новые записи.
+    Записи, которые сделал сам этот процесс (``Database.own_changes``),
+    пропускаются: экран, выполнивший запись, уже обновил себя сам. Открытым
+    экранам отправляются лишь затронутые строки:
+
+    * ``products_changed(rows, deleted_ids)`` — актуальные строки товаров и
+      id удалённых;
+    * ``orders_changed(rows, deleted_ids)`` — то же для заказов (в форме
+      ``Database.get_orders_by_ids``);
+    * ``reset_required()`` — изменений слишком много или журнал уже очищен,
+      экранам следует перезагрузиться целиком.
+    """
+
+    products_changed = pyqtSignal(list, list)
+    orders_changed = pyqtSignal(list, list)
+    reset_required = pyqtSignal()
+
+    def __init__(self, db, interval_ms=None, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self._data_version = db.data_version()
+        _, newest = db.change_log_bounds()
+        self._last_change_id = newest or 0
+        self._polls = 0
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(settings.LIVE_REFRESH_INTERVAL_MS if interval_ms is None else interval_ms)
+        self._timer.timeout.connect(self.poll)
+
+    def start(self):
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def poll(self):
+        try:
+            self._poll()
+        except PermissionError:
+            # Сервер (server.py) отдаёт журнал только вошедшему терминалу. Пока
+            # никто не вошёл или сеанс заблокирован, изменения копятся в
+            # журнале и приходят после входа
+            pass
+
+    def _poll(self):
+        self._polls += 1
+        if self._polls % PRUNE_EVERY_POLLS == 0:
+            self.db.prune_changes(settings.CHANGE_LOG_KEEP)
+
+        version = self.db.data_version()
+        if version == self._data_version:
+            return
+        self._data_version = version
+
+        oldest, newest = self.db.change_log_bounds()
+        if newest is None or newest <= self._last_change_id:
+            return
+        if (oldest > self._last_change_id + 1 and self._last_change_id) \
+                or newest - self._last_change_id > MAX_DELTA_CHANGES:
+            # Часть журнала уже удалена или изменений слишком много
+            self._last_change_id = newest
+            self.db.invalidate_cache()
+            self.reset_required.emit()
+            return
+
+        changes = []
+        after_id = self._last_change_id
+        while True:
+            batch = self.db.get_changes(after_id, CHANGES_BATCH)
+            changes.extend(batch)
+            if batch:
+                after_id = batch[-1][0]
+            if len(batch) < CHANGES_BATCH:
+                break
+        # Свои записи запрашиваются после чтения журнала: запись, отмеченная
+        # позже, в худшем случае будет применена ещё раз, а не потеряна
+        own = self.db.own_changes(self._last_change_id)
+        self._last_change_id = after_id
+        changed = {'products': set(), 'orders': set()}
+        for change_id, table_name, row_id in changes:
+            if not any(first < change_id <= last for first, last in own):
+                changed.setdefault(table_name, set()).add(row_id)
+
+        # Кэш запросов этого процесса не знает о чужих записях; сбрасываем
+        # его до сигналов, чтобы обработчики читали уже свежие данные
+        if changed['products']:
+            self.db.invalidate_cache('products', 'product_names')
+        if changed['orders']:
+            self.db.invalidate_cache('orders', 'sales')
+
+        if changed['products']:
+            rows = self.db.get_products_by_ids(changed['products'])
+            deleted = changed['products'] - {product.id for product in rows}
+            self.products_changed.emit(rows, sorted(deleted))
+        if changed['orders']:
+            rows = self.db.get_orders_by_ids(changed['orders'])
+            deleted = changed['orders'] - {order.id for order in rows}
+            self.orders_changed.emit(rows, sorted(deleted))
@@ -0,0 +1,324 @@
+# load_test.py
+"""Нагрузочный тест: много терминалов одновременно работают с одной базой.
+
+Запускает ``--workers`` процессов. Каждый входит как отдельный клиент
+(``authenticate_user``), затем до истечения ``--duration`` выбирает
+операции по весам ``--mix`` с паузой «на раздумье» ``--think-ms``
+(экспоненциальное распределение со средним значением):
+
+* ``search`` — первая страница поиска по каталогу;
+* ``order`` — заказ 1–3 штук товара; с ``--hot`` часть заказов идёт в
+  несколько «горячих» товаров, за остаток которых терминалы конкурируют;
+* ``cancel`` — отмена одного из своих заказов;
+* ``my_orders`` — первая страница своих заказов.
+
+Отчёт (JSON): пропускная способность, p50/p95/p99 по каждой операции,
+ошибки блокировки (``database is locked`` после всех повторов) и прочие
+ошибки, счётчики ожиданий блокировки записи. После прогона проверяется
+сохранение остатков: для каждого товара остаток плюс количество в
+заказах не должен измениться, и ни один остаток не должен уйти в минус.
+При нарушении код возврата 1.
+
+    python load_test.py --workers 16 --duration 30 --mix search=60,order=25,cancel=10,my_orders=5
+    python load_test.py --db app.db --set WAREHOUSE_DB_SYNCHRONOUS=FULL
+
+Без ``--db`` база создаётся во временном каталоге генератором из
+``bench_database.py``. ``--set`` задаёт переменные окружения процессов
+(см. ``settings.py``), чтобы сравнить прагмы и параметры повторов на
+одной и той же нагрузке.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+DEFAULT_MIX = 'search=60,order=25,cancel=10,my_orders=5'
+HOT_PRODUCTS = 5
+# Заранее известный пароль и минимальная сложность: без этого вход каждого
+# процесса пересчитывал бы хеш с рабочей сложностью и мерил бы bcrypt
+GENERATED_ENV = {'WAREHOUSE_BCRYPT_ROUNDS': '4'}
+# Сколько ждать отчётов после окончания прогона, прежде чем счесть процесс зависшим
+RESULT_TIMEOUT = 60  # секунд
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ('search', 'order', 'cancel', 'my_orders'):
+            raise argparse.ArgumentTypeError(f'неизвестная операция {name!r}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def stock_snapshot(db):
+    """Остаток и количество в неотменённых заказах для каждого товара."""
+    return {
+        product_id: (quantity, ordered)
+        for product_id, quantity, ordered in db.conn.execute('''
+            SELECT products.id, products.quantity,
+                   (SELECT COALESCE(SUM(quantity), 0) FROM orders
+                    WHERE product_id = products.id AND status <> 'cancelled') AS ordered
+            FROM products
+        ''')
+    }
+
+
+def check_invariants(before, after):
+    violations = []
+    for product_id, (stock, ordered) in after.items():
+        initial_stock, initial_ordered = before.get(product_id, (None, None))
+        if stock < 0:
+            violations.append({'product_id': product_id, 'problem': 'negative_stock', 'stock': stock})
+        if initial_stock is not None and stock + ordered != initial_stock + initial_ordered:
+            violations.append({
+                'product_id': product_id, 'problem': 'stock_not_conserved',
+                'before': initial_stock + initial_ordered, 'after': stock + ordered,
+            })
+    return violations
+
+
+def worker(number, config, start_at, results):
+    """Один терминал; результат — словарь в очередь ``results``.
+
+    Отчёт приходит всегда: ошибка вне операций (вход, открытие базы)
+    превращается в запись ``fatal``, иначе ``main`` ждал бы его вечно.
+    """
+    try:
+        report = run_terminal(number, config, start_at)
+    except BaseException as error:
+        report = {'worker': number, 'fatal': f'{type(error).__name__}: {error}'}
+    results.put(report)
+
+
+def run_terminal(number, config, start_at):
+    from database import Database, is_busy
+    from query_cache import QueryCache
+    from bench_database import SEARCH_TERMS
+
+    rng = random.Random(config['seed'] * 1000 + number)
+    db = Database(config['db'])
+    if not config['with_cache']:
+        db.manager.cache = QueryCache(max_entries=0)
+    latencies = {name: [] for name in ('login', *config['mix'])}
+    errors = {}
+    lock_errors = 0
+    placed = []
+
+    def timed(name, operation, *args):
+        nonlocal lock_errors
+        started = time.perf_counter()
+        try:
+            result = operation(*args)
+        except sqlite3.OperationalError as error:
+            if not is_busy(error):
+                raise
+            lock_errors += 1
+            return None
+        latencies[name].append(time.perf_counter() - started)
+        return result
+
+    username = config['usernames'][number % len(config['usernames'])]
+    while time.time() < start_at:
+        time.sleep(0.001)
+    user = timed('login', db.authenticate_user, username, config['password'])
+    if user is None:
+        if lock_errors:
+            problem = f'вход как {username}: база заблокирована (database is locked)'
+        else:
+            problem = f'не удалось войти как {username}'
+        return {'worker': number, 'fatal': problem, 'lock_errors': lock_errors}
+
+    names, weights = zip(*config['mix'].items())
+    deadline = start_at + config['duration']
+    while time.time() < deadline:
+        name = rng.choices(names, weights)[0]
+        if name == 'cancel' and not placed:
+            name = 'order'
+        try:
+            if name == 'search':
+                timed(name, db.search_products_page, rng.choice(SEARCH_TERMS))
+            elif name == 'order':
+                if config['hot'] and rng.random() < config['hot']:
+                    product_id = rng.randint(1, HOT_PRODUCTS)
+                else:
+                    product_id = rng.randint(1, config['products'])
+                if timed(name, db.place_order, user.id, product_id, rng.randint(1, 3)):
+                    row = db.conn.execute(
+                        'SELECT MAX(id) FROM orders WHERE user_id = ?', (user.id,)
+                    ).fetchone()
+                    placed.append(row[0])
+            elif name == 'cancel':
+                timed(name, db.cancel_order, placed.pop(rng.randrange(len(placed))))
+            else:
+                timed(name, db.get_orders_by_user_page, user.id)
+        except Exception as error:
+            key = f'{name}: {type(error).__name__}: {error}'
+            errors[key] = errors.get(key, 0) + 1
+        if config['think_ms']:
+            time.sleep(rng.expovariate(1000 / config['think_ms']))
+
+    return {
+        'worker': number,
+        'latencies': latencies,
+        'errors': errors,
+        'lock_errors': lock_errors,
+        'write_stats': db.manager.write_stats(),
+    }
+
+
+def collect_reports(processes, results, deadline):
+    """Отчёты всех процессов по номерам.
+
+    Процесс, который завершился без отчёта (например, убит системой) или
+    не прислал его до ``deadline``, получает запись ``fatal``.
+    """
+    reports = {}
+    dead = set()
+    while len(reports) < len(processes):
+        try:
+            report = results.get(timeout=0.5)
+        except queue.Empty:
+            pass
+        else:
+            reports[report['worker']] = report
+            continue
+        # Отчёт уже умершего процесса мог ещё идти по очереди: такой процесс
+        # считается пропавшим только на следующей пустой проверке
+        for number in dead - set(reports):
+            process = processes[number]
+            reports[number] = {
+                'worker': number, 'fatal': f'процесс завершился с кодом {process.exitcode} без отчёта',
+            }
+        dead = {number for number, process in enumerate(processes)
+                if number not in reports and not process.is_alive()}
+        if time.time() > deadline:
+            for number, process in enumerate(processes):
+                if number not in reports:
+                    process.terminate()
+                    reports[number] = {'worker': number, 'fatal': 'нет отчёта: процесс завис'}
+    return [reports[number] for number in range(len(processes))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочный тест базы несколькими процессами.')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20, help='секунд')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'веса операций (по умолчанию {DEFAULT_MIX})')
+    parser.add_argument('--think-ms', type=float, default=5, help='средняя пауза между операциями, мс')
+    parser.add_argument('--hot', type=float, default=0.3,
+                        help=f'доля заказов в {HOT_PRODUCTS} «горячих» товаров (0 — равномерно)')
+    parser.add_argument('--db', help='существующая база; без неё создаётся временная')
+    parser.add_argument('--users', nargs='*', help='логины для входа (с --db), по кругу на процессы')
+    parser.add_argument('--password', help='пароль этих пользователей (с --db)')
+    parser.add_argument('--products', type=int, default=10000, help='товаров во временной базе')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--set', action='append', default=[], metavar='ПЕРЕМЕННАЯ=ЗНАЧЕНИЕ',
+                        help='переменная окружения для всех процессов, например WAREHOUSE_DB_SYNCHRONOUS=FULL')
+    parser.add_argument('--with-cache', action='store_true', help='не выключать кэш запросов в процессах')
+    parser.add_argument('--output', help='сохранить JSON-отчёт в файл')
+    args = parser.parse_args(argv)
+    if args.db and not (args.users and args.password):
+        parser.error('с --db нужны --users и --password')
+
+    overrides = {} if args.db else dict(GENERATED_ENV)
+    for assignment in args.set:
+        name, _, value = assignment.partition('=')
+        overrides[name.strip()] = value
+    # Процессы запускаются через spawn и читают settings.py заново уже с этими значениями
+    os.environ.update(overrides)
+
+    from bench_database import PASSWORD, generate_dataset, summarize
+    from database import ConnectionManager, Database
+
+    workdir = None
+    if args.db:
+        path, usernames, password = args.db, args.users, args.password
+    else:
+        workdir = tempfile.mkdtemp(prefix='warehouse-load-')
+        path = os.path.join(workdir, 'load.db')
+        dataset = generate_dataset(Database(path), args.products, seed=args.seed)
+        usernames, password = dataset.usernames, PASSWORD
+
+    try:
+        db = Database(path)
+        before = stock_snapshot(db)
+        products = max(before) if before else 0
+        ConnectionManager.close_all()
+
+        config = {
+            'db': path, 'usernames': usernames, 'password': password, 'products': products,
+            'mix': args.mix, 'think_ms': args.think_ms, 'hot': args.hot, 'duration': args.duration,
+            'seed': args.seed, 'with_cache': args.with_cache,
+        }
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        start_at = time.time() + 1.0 + args.workers * 0.1  # все процессы успевают запуститься
+        processes = [
+            context.Process(target=worker, args=(number, config, start_at, results))
+            for number in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        reports = collect_reports(processes, results, start_at + args.duration + RESULT_TIMEOUT)
+        for process in processes:
+            process.join()
+
+        after = stock_snapshot(Database(path))
+        violations = check_invariants(before, after)
+    finally:
+        ConnectionManager.close_all()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    fatal = [report['fatal'] for report in reports if 'fatal' in report]
+    lock_errors = sum(report.get('lock_errors', 0) for report in reports)
+    reports = [report for report in reports if 'fatal' not in report]
+    operations = {}
+    for name in ('login', *args.mix):
+        latencies = [value for report in reports for value in report['latencies'].get(name, [])]
+        if latencies:
+            operations[name] = summarize(latencies, args.duration)
+    errors = {}
+    for report in reports:
+        for key, count in report['errors'].items():
+            errors[key] = errors.get(key, 0) + count
+    write_stats = {}
+    for report in reports:
+        for key, value in report['write_stats'].items():
+            write_stats[key] = round(write_stats.get(key, 0) + value, 6)
+    total_ops = sum(stats['count'] for name, stats in operations.items() if name != 'login')
+
+    report = {
+        'meta': {
+            'workers': args.workers, 'duration_s': args.duration, 'mix': args.mix,
+            'think_ms': args.think_ms, 'hot': args.hot, 'seed': args.seed,
+            'environment': overrides, 'sqlite': sqlite3.sqlite_version, 'query_cache': args.with_cache,
+        },
+        'throughput_ops_per_sec': round(total_ops / args.duration, 1),
+        'operations': operations,
+        'lock_errors': lock_errors,
+        'errors': errors,
+        'write_stats': write_stats,
+        'invariants': {'products_checked': len(after), 'violations': violations},
+        'failed_workers': fatal,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+    return 1 if violations or fatal else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
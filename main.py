@@ -1,10 +1,27 @@
 # main.py
+import time
+
+STARTUP_STARTED = time.perf_counter()
+
+import json
+import logging
+import os
 import sys
-from PyQt6.QtWidgets import QApplication, QMainWindow, QStackedWidget, QWidget, QVBoxLayout, QPushButton, QHBoxLayout
-from PyQt6.QtCore import Qt
-from auth import AuthWidget
-from admin_interface import AdminWidget
-from client_interface import ClientWidget
+from PyQt6.QtWidgets import QApplication, QMainWindow, QStackedWidget, QWidget, QVBoxLayout, QPushButton, QHBoxLayout, QMessageBox
+from PyQt6.QtCore import Qt, QObject, QEvent, QTimer
+import settings
+import stall_watchdog
+from auth import AuthWidget, RegistrationWidget, PIN_MIN_LENGTH, ask_pin
+from screens import ScreenManager
+from workers import run_in_background
+
+# Экраны администратора и клиента импортируются при первом переходе на них,
+# чтобы не замедлять показ окна входа
+
+# Первое архивирование — через минуту после запуска, когда вход уже выполнен
+ARCHIVE_FIRST_RUN_MS = 60 * 1000
+
+logger = logging.getLogger(__name__)
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -21,6 +38,16 @@ class MainWindow(QMainWindow):
         central_layout = QHBoxLayout(central_widget)
         central_layout.addWidget(self.stack)
 
+        # Экраны создаются один раз и переиспользуются, лишние уничтожаются
+        self.screens = ScreenManager(self.stack)
+        self._change_watcher = None
+
+        # Заблокированные PIN-кодом сеансы этого терминала: логин -> токен
+        self.terminal_sessions = {}
+        self.current_token = None
+        self.current_username = None
+        self.current_screen_key = None
+
         # Меню
         self.menu_layout = QVBoxLayout()
         self.create_menu()
@@ -30,6 +57,15 @@ class MainWindow(QMainWindow):
         self.stack.addWidget(self.auth_widget)
         self.stack.setCurrentWidget(self.auth_widget)
 
+    @property
+    def change_watcher(self):
+        """Общий для всех экранов источник изменений, сделанных другими терминалами."""
+        if self._change_watcher is None:
+            from live_refresh import ChangeWatcher
+            self._change_watcher = ChangeWatcher(self.auth_widget.db, parent=self)
+            self._change_watcher.start()
+        return self._change_watcher
+
     def create_menu(self):
         """Создание бокового меню."""
         self.auth_button = QPushButton("Авторизация", self)
@@ -46,6 +82,11 @@ class MainWindow(QMainWindow):
         self.menu_layout.addWidget(self.admin_button)
         self.menu_layout.addWidget(self.client_button)
 
+        if settings.DEV_MODE:
+            self.stalls_button = QPushButton("Зависания", self)
+            self.stalls_button.clicked.connect(self.view_stalls)
+            self.menu_layout.addWidget(self.stalls_button)
+
         # Добавляем меню в основной layout
         self.menu_layout.setAlignment(Qt.AlignmentFlag.AlignTop)
         self.stack.addWidget(self.create_side_menu())
@@ -56,19 +97,71 @@ class MainWindow(QMainWindow):
         side_menu.setLayout(self.menu_layout)
         return side_menu
 
+    def view_stalls(self):
+        """Режим разработчика: какие обработчики дольше всего держали окно."""
+        if stall_watchdog.active() is None:
+            QMessageBox.information(self, 'Зависания', 'Сторож выключен (WAREHOUSE_WATCHDOG=0).')
+            return
+        dialog = stall_watchdog.StallReportDialog(stall_watchdog.active(), self)
+        dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        dialog.show()
+
     def switch_to_admin(self):
-        self.admin_widget = AdminWidget(self)
-        self.stack.addWidget(self.admin_widget)
-        self.stack.setCurrentWidget(self.admin_widget)
+        from admin_interface import AdminWidget
+        self.current_screen_key = 'admin'
+        self.admin_widget = self.screens.show('admin', lambda: AdminWidget(self))
 
     def switch_to_client(self, user_id, username):
-        self.client_widget = ClientWidget(self, user_id, username)
-        self.stack.addWidget(self.client_widget)
-        self.stack.setCurrentWidget(self.client_widget)
+        from client_interface import ClientWidget
+        # Отдельный экран на пользователя: корзина и поиск сохраняются при смене пользователя
+        self.current_screen_key = ('client', user_id)
+        self.client_widget = self.screens.show(
+            self.current_screen_key, lambda: ClientWidget(self, user_id, username)
+        )
+
+    def switch_to_registration(self):
+        self.registration_widget = self.screens.show('registration', lambda: RegistrationWidget(self))
 
     def switch_to_auth(self):
+        self.auth_widget.refresh_sessions()
         self.stack.setCurrentWidget(self.auth_widget)
 
+    def start_session(self, user):
+        # Новый вход по паролю заменяет заблокированный сеанс того же пользователя
+        locked = self.terminal_sessions.pop(user.username, None)
+        if locked is not None:
+            self.auth_widget.db.end_session(locked)
+        self.current_token = user.token
+        self.current_username = user.username
+
+    def lock(self):
+        """Смена пользователя: сеанс блокируется PIN-кодом и остаётся открытым до истечения простоя."""
+        if self.current_token is not None:
+            pin = ask_pin(self, 'Смена пользователя', f'PIN для возврата в сеанс (не короче {PIN_MIN_LENGTH} символов):')
+            if pin is None:
+                return
+            if len(pin) < PIN_MIN_LENGTH:
+                QMessageBox.warning(self, 'Ошибка', f'PIN должен быть не короче {PIN_MIN_LENGTH} символов.')
+                return
+            # Простой отсчитывается с момента блокировки
+            if self.auth_widget.db.lock_session(self.current_token, pin):
+                self.terminal_sessions[self.current_username] = self.current_token
+        self.current_token = None
+        self.current_username = None
+        self.switch_to_auth()
+
+    def logout(self):
+        """Выход: сеанс закрывается, для повторного входа нужен пароль."""
+        if isinstance(self.current_screen_key, tuple):
+            # Экран клиента хранит его корзину — после выхода он не нужен
+            self.screens.drop(self.current_screen_key)
+        self.current_screen_key = None
+        if self.current_token is not None:
+            self.auth_widget.db.end_session(self.current_token)
+        self.current_token = None
+        self.current_username = None
+        self.switch_to_auth()
+
     def closeEvent(self, event):
         """Закрытие всех дочерних окон при выходе."""
         for widget in self.findChildren(QWidget):
@@ -76,6 +169,84 @@ class MainWindow(QMainWindow):
                 widget.close()
         event.accept()
 
+class FirstFrameProbe(QObject):
+    """Для bench_startup.py: печатает время до первой отрисовки окна и завершает приложение."""
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.window = window
+        window.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if obj is self.window and event.type() == QEvent.Type.Paint:
+            self.window.removeEventFilter(self)
+            elapsed_ms = (time.perf_counter() - STARTUP_STARTED) * 1000
+            print('STARTUP_PROBE ' + json.dumps({'first_frame_ms': round(elapsed_ms, 2)}), flush=True)
+            QTimer.singleShot(0, QApplication.instance().quit)
+        return False
+
+
+def warm_up_database():
+    """Открывает базу и применяет миграции в фоне, пока пользователь вводит логин."""
+    from database import open_database
+    open_database()
+
+
+def archive_old_orders():
+    """Переносит старые выполненные и отменённые заказы в архивную базу."""
+    from database import Database
+    return Database().archive_old_orders()
+
+
+def start_archiving(parent):
+    """Периодический перенос старых заказов в архив в фоновом потоке.
+
+    Терминалы общего сервера (``WAREHOUSE_SERVER``) не архивируют: это делает сам сервер.
+    """
+    def run():
+        run_in_background(
+            archive_old_orders,
+            on_failed=lambda error: logger.warning('archiving orders failed: %s', error),
+        )
+
+    timer = QTimer(parent)
+    timer.timeout.connect(run)
+    timer.start(settings.ARCHIVE_INTERVAL * 1000)
+    QTimer.singleShot(ARCHIVE_FIRST_RUN_MS, run)
+    return timer
+
+
+def start_backups(app):
+    """Резервные копии по расписанию (``backup.py``); копирование, идущее при выходе, прерывается."""
+    from backup import BackupScheduler
+    scheduler = BackupScheduler()
+    scheduler.start()
+    app.aboutToQuit.connect(scheduler.stop)
+    return scheduler
+
+
+def install_session_guard(window):
+    """Отказ сервера в обработчике Qt не завершает приложение.
+
+    Необработанное в слоте исключение PyQt6 передаёт в ``sys.excepthook``.
+    Истёкший сеанс (``RemoteAuthError`` с кодом 401) возвращает к окну
+    входа, нехватка прав (403) только сообщается; прочие ошибки идут в
+    прежний обработчик.
+    """
+    previous = sys.excepthook
+
+    def hook(kind, error, traceback):
+        if not issubclass(kind, PermissionError):
+            previous(kind, error, traceback)
+        elif getattr(error, 'status', None) == 401:
+            QMessageBox.warning(window, 'Сеанс', 'Сеанс истёк. Войдите заново.')
+            window.logout()
+        else:
+            QMessageBox.warning(window, 'Ошибка', f'Недостаточно прав: {error}')
+
+    sys.excepthook = hook
+
+
 def main():
     app = QApplication(sys.argv)
 
@@ -87,6 +258,18 @@ def main():
         pass  # Если файл стилей не найден, продолжаем без него
 
     window = MainWindow()
+    if settings.SERVER_URL:
+        install_session_guard(window)
+    if os.environ.get('WAREHOUSE_STARTUP_PROBE'):
+        FirstFrameProbe(window)
+    else:
+        QTimer.singleShot(0, lambda: run_in_background(warm_up_database))
+        if settings.WATCHDOG:
+            stall_watchdog.install(app)
+        if settings.ARCHIVE_AFTER_DAYS and not settings.SERVER_URL:
+            start_archiving(window)
+        if settings.BACKUP_INTERVAL and not settings.SERVER_URL:
+            start_backups(app)
     window.show()
     sys.exit(app.exec())
 
@@ -0,0 +1,103 @@
+# migration_tests.py
+"""Upgrade of a database created before migrations to the current schema.
+
+    python -m unittest migration_tests
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+os.environ.setdefault('WAREHOUSE_BCRYPT_ROUNDS', '4')
+
+import migrations
+from database import ConnectionManager, Database
+
+# The schema the app created before migrations.py existed
+BASELINE_SCHEMA = '''
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password BLOB NOT NULL,
+        role TEXT NOT NULL CHECK(role IN ('admin', 'client'))
+    );
+    CREATE TABLE products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        description TEXT,
+        price REAL NOT NULL CHECK(price >= 0),
+        quantity INTEGER NOT NULL CHECK(quantity >= 0)
+    );
+    CREATE TABLE orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL CHECK(quantity > 0),
+        total_price REAL NOT NULL CHECK(total_price >= 0),
+        FOREIGN KEY(user_id) REFERENCES users(id),
+        FOREIGN KEY(product_id) REFERENCES products(id)
+    );
+    INSERT INTO users (username, password, role) VALUES ('client', x'00', 'client');
+    INSERT INTO products (name, description, price, quantity) VALUES ('Widget', '', 2.5, 10), ('Gadget', '', 4.0, 3);
+    INSERT INTO orders (user_id, product_id, quantity, total_price) VALUES (1, 1, 2, 5.0), (1, 2, 1, 4.0);
+'''
+
+ORDER_INDEXES = {
+    'idx_orders_user_id',
+    'idx_orders_product_id',
+    'idx_orders_placed',
+    'idx_orders_finished_created',
+}
+
+
+class MigrationTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'app.db')
+        conn = sqlite3.connect(self.path)
+        conn.executescript(BASELINE_SCHEMA)
+        conn.close()
+        self.db = Database(self.path)
+
+    def tearDown(self):
+        ConnectionManager.close_all()
+        self.directory.cleanup()
+
+    def test_baseline_reaches_current_version(self):
+        version = self.db.conn.execute('PRAGMA user_version').fetchone()[0]
+        self.assertEqual(version, migrations.SCHEMA_VERSION)
+        self.assertEqual(migrations.migrate(self.db.manager), [])
+
+    def test_existing_orders_survive(self):
+        orders = self.db.get_orders_by_user(1)
+        self.assertEqual([(order.product_id, order.quantity, order.status) for order in orders],
+                         [(1, 2, 'placed'), (2, 1, 'placed')])
+        self.assertEqual(self.db.get_sales_totals().orders, 2)
+
+    def test_order_indexes(self):
+        indexes = {row[0] for row in self.db.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'orders' AND sql IS NOT NULL"
+        )}
+        self.assertEqual(indexes, ORDER_INDEXES)
+
+    def test_hot_queries_use_their_indexes(self):
+        plans = {
+            'idx_orders_placed': (
+                "SELECT id FROM orders WHERE status = 'placed' AND id > ? ORDER BY id LIMIT 10", (0,)
+            ),
+            'idx_orders_user_id': (
+                'SELECT id FROM orders WHERE user_id = ? AND id > ? ORDER BY id LIMIT 10', (1, 0)
+            ),
+            'idx_orders_finished_created': (
+                "SELECT id FROM orders WHERE status <> 'placed' AND created_at < ? ORDER BY created_at",
+                ('2026-01-01',),
+            ),
+        }
+        for index, (sql, params) in plans.items():
+            with self.subTest(index=index):
+                plan = ' '.join(row[3] for row in self.db.conn.execute('EXPLAIN QUERY PLAN ' + sql, params))
+                self.assertIn(index, plan)
+
+
+if __name__ == '__main__':
+    unittest.main()
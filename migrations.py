@@ -0,0 +1,203 @@
+# migrations.py
+"""Versioned schema migrations.
+
+The schema version is stored in ``PRAGMA user_version``. ``migrate`` applies
+every migration newer than the stored version in order, each one in its own
+``BEGIN IMMEDIATE`` transaction together with the version bump, so an
+interrupted upgrade never leaves a half-migrated database and several
+processes starting at once apply each step exactly once.
+
+To change the schema, append a new function to ``MIGRATIONS``; never edit a
+migration that has already shipped.
+"""
+
+
+def _001_base_schema(cursor):
+    # IF NOT EXISTS: databases created before migrations already have these tables
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password BLOB NOT NULL,
+            role TEXT NOT NULL CHECK(role IN ('admin', 'client'))
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            price REAL NOT NULL CHECK(price >= 0),
+            quantity INTEGER NOT NULL CHECK(quantity >= 0)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK(quantity > 0),
+            total_price REAL NOT NULL CHECK(total_price >= 0),
+            FOREIGN KEY(user_id) REFERENCES users(id),
+            FOREIGN KEY(product_id) REFERENCES products(id)
+        )
+    ''')
+
+
+def _002_order_indexes(cursor):
+    # "My orders" filters on user_id and pages by id
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders(user_id, id)')
+    # Joins and lookups of the orders for one product
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_product_id ON orders(product_id)')
+    cursor.execute('ANALYZE')
+
+
+def _003_change_log(cursor):
+    # Row-level change feed for live refresh across app instances (live_refresh.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL
+        )
+    ''')
+    for table in ('products', 'orders'):
+        for event, row in (('INSERT', 'new'), ('UPDATE', 'new'), ('DELETE', 'old')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {table}_change_log_{event.lower()}
+                AFTER {event} ON {table} BEGIN
+                    INSERT INTO change_log (table_name, row_id) VALUES ('{table}', {row}.id);
+                END
+            ''')
+
+
+# Day bucket of an order in the sales summaries. Orders placed before
+# created_at existed have no date and are counted under the empty day.
+_ORDER_DAY = "COALESCE(date({row}.created_at), '')"
+
+# (summary table, grouping column of orders)
+_SALES_SUMMARIES = (
+    ('sales_by_product_day', 'product_id'),
+    ('sales_by_user_day', 'user_id'),
+)
+
+
+def _004_sales_analytics(cursor):
+    # ALTER TABLE cannot add a column with a non-constant default: the
+    # timestamp (UTC) is written by the INSERT in Database.checkout
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(orders)')]
+    if 'created_at' not in columns:
+        cursor.execute('ALTER TABLE orders ADD COLUMN created_at TEXT')
+    for table, key in _SALES_SUMMARIES:
+        # Aggregates per day: dashboards read these instead of scanning orders
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                day TEXT NOT NULL,
+                {key} INTEGER NOT NULL,
+                orders INTEGER NOT NULL,
+                units INTEGER NOT NULL,
+                revenue REAL NOT NULL,
+                PRIMARY KEY (day, {key})
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS orders_{table}_insert
+            AFTER INSERT ON orders BEGIN
+                INSERT INTO {table} (day, {key}, orders, units, revenue)
+                VALUES ({_ORDER_DAY.format(row='new')}, new.{key}, 1, new.quantity, new.total_price)
+                ON CONFLICT (day, {key}) DO UPDATE SET
+                    orders = orders + 1,
+                    units = units + excluded.units,
+                    revenue = revenue + excluded.revenue;
+            END
+        ''')
+        # A cancelled order is deleted; take it back out of its day
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS orders_{table}_delete
+            AFTER DELETE ON orders BEGIN
+                UPDATE {table}
+                SET orders = orders - 1, units = units - old.quantity, revenue = revenue - old.total_price
+                WHERE day = {_ORDER_DAY.format(row='old')} AND {key} = old.{key};
+                DELETE FROM {table}
+                WHERE day = {_ORDER_DAY.format(row='old')} AND {key} = old.{key} AND orders <= 0;
+            END
+        ''')
+        # Existing orders: build the summaries once from scratch
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.execute(f'''
+            INSERT INTO {table} (day, {key}, orders, units, revenue)
+            SELECT {_ORDER_DAY.format(row='orders')}, {key}, COUNT(*), SUM(quantity), SUM(total_price)
+            FROM orders
+            GROUP BY 1, 2
+        ''')
+
+
+ORDER_STATUSES = ('placed', 'cancelled', 'fulfilled')
+
+
+def _005_order_status(cursor):
+    # Cancelling no longer deletes the order; every existing order is still placed
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(orders)')]
+    if 'status' not in columns:
+        cursor.execute(f'''
+            ALTER TABLE orders ADD COLUMN status TEXT NOT NULL DEFAULT 'placed'
+            CHECK(status IN {ORDER_STATUSES!r})
+        ''')
+    # Partial indexes: only the orders they serve are indexed. The queue of
+    # orders awaiting fulfillment (Database.get_placed_orders_page) walks the
+    # placed ones by id...
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orders_placed ON orders(id)
+        WHERE status = 'placed'
+    ''')
+    # ...and archiving (Database.archive_orders) looks for old finished ones.
+    # A user's history lists orders of every status and keeps idx_orders_user_id
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_orders_finished_created ON orders(created_at)
+        WHERE status <> 'placed'
+    ''')
+    for table, key in _SALES_SUMMARIES:
+        # A cancelled order leaves the sales summaries. Archived orders are
+        # deleted from orders but stay in the history, so deletes no longer count
+        cursor.execute(f'DROP TRIGGER IF EXISTS orders_{table}_delete')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS orders_{table}_cancel
+            AFTER UPDATE OF status ON orders
+            WHEN old.status <> 'cancelled' AND new.status = 'cancelled' BEGIN
+                UPDATE {table}
+                SET orders = orders - 1, units = units - old.quantity, revenue = revenue - old.total_price
+                WHERE day = {_ORDER_DAY.format(row='old')} AND {key} = old.{key};
+                DELETE FROM {table}
+                WHERE day = {_ORDER_DAY.format(row='old')} AND {key} = old.{key} AND orders <= 0;
+            END
+        ''')
+    cursor.execute('ANALYZE')
+
+
+MIGRATIONS = [
+    _001_base_schema,
+    _002_order_indexes,
+    _003_change_log,
+    _004_sales_analytics,
+    _005_order_status,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(manager):
+    """Bring the database up to ``SCHEMA_VERSION``. Returns the list of applied versions."""
+    applied = []
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        with manager.writer() as conn:
+            # Re-read inside the write transaction: another process may have migrated meanwhile
+            if schema_version(conn) >= version:
+                continue
+            migration(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {version}')
+            applied.append(version)
+    return applied
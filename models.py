@@ -0,0 +1,99 @@
+# models.py
+"""Records returned by ``Database`` and ``RemoteDatabase``.
+
+Each record declares ``__slots__``, so an instance carries no ``__dict__``
+and large result sets stay compact; ``Database`` builds them straight from
+the cursor's tuples (``Product(*row)``) instead of going through a row
+factory. Results are shared through the query cache, so callers must not
+modify records they did not create.
+
+The slots are listed by hand, in field order, because ``Record.to_dict``
+and ``from_dict`` take the field order from them.
+"""
+from dataclasses import dataclass
+
+
+class Record:
+    __slots__ = ()
+
+    def to_dict(self):
+        """Plain dict for JSON (``server.py``)."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Inverse of ``to_dict``; missing fields become None."""
+        return cls(*(data.get(name) for name in cls.__slots__))
+
+
+@dataclass
+class User(Record):
+    """A user without the password hash; ``token`` is set for a login session."""
+
+    __slots__ = ('id', 'username', 'role', 'token')
+    id: int
+    username: str
+    role: str
+    token: str
+
+
+@dataclass
+class Product(Record):
+    __slots__ = ('id', 'name', 'description', 'price', 'quantity')
+    id: int
+    name: str
+    description: str
+    price: float
+    quantity: int
+
+
+@dataclass
+class Order(Record):
+    """An order row joined with the names of its user and product."""
+
+    __slots__ = ('id', 'user_id', 'username', 'product_id', 'product_name', 'quantity', 'total_price',
+                 'created_at', 'status')
+    id: int
+    user_id: int
+    username: str
+    product_id: int
+    product_name: str
+    quantity: int
+    total_price: float
+    # 'YYYY-MM-DD HH:MM:SS' UTC; None for orders placed before it was recorded
+    created_at: str
+    # 'placed', 'cancelled' or 'fulfilled' (migrations.ORDER_STATUSES)
+    status: str
+
+
+@dataclass
+class OrderLine(Record):
+    """A product and quantity in a cart, before it is ordered with ``Database.checkout``."""
+
+    __slots__ = ('product_id', 'name', 'price', 'quantity')
+    product_id: int
+    name: str
+    price: float
+    quantity: int
+
+    @property
+    def total(self):
+        return self.price * self.quantity
+
+
+@dataclass
+class Sales(Record):
+    """Sales figures of one group in an analytics report.
+
+    ``key`` is the day for ``get_sales_by_day``, the product id for
+    ``get_top_products`` and the user id for ``get_top_customers`` (None
+    for ``get_sales_totals``); ``name`` is the product name or username, or
+    None if that product or user has been deleted.
+    """
+
+    __slots__ = ('key', 'name', 'orders', 'units', 'revenue')
+    key: object
+    name: str
+    orders: int
+    units: int
+    revenue: float
@@ -0,0 +1,121 @@
+# query_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+import settings
+
+
+class _Entry:
+    __slots__ = ('value', 'tags', 'expires')
+
+    def __init__(self, value, tags, expires):
+        self.value = value
+        self.tags = tags
+        self.expires = expires
+
+
+class QueryCache:
+    """Bounded read-through cache of query results.
+
+    Entries are keyed by ``(method, args)`` and carry a set of tags naming
+    the data they were read from (``'products'``, ``('orders', user_id)``,
+    ...). A write invalidates exactly the tags it touched. The least
+    recently used entry is evicted once ``max_entries`` is reached, and any
+    entry older than ``ttl`` seconds is reloaded; the TTL bounds staleness
+    for writes made by other processes that nobody reported.
+
+    A result loaded while an invalidation happened is returned but not
+    stored, so a slow read that started before a write can never put
+    pre-write data back into the cache.
+    """
+
+    def __init__(self, max_entries=None, ttl=None, clock=time.monotonic):
+        self.max_entries = settings.QUERY_CACHE_SIZE if max_entries is None else max_entries
+        self.ttl = settings.QUERY_CACHE_TTL if ttl is None else ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._by_tag = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get_or_load(self, key, tags, load):
+        """Cached value for ``key``, or the result of ``load()`` stored under ``tags``."""
+        if not self.enabled:
+            return load()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires is None or entry.expires > self._clock():
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return self._copy(entry.value)
+                self._remove(key)
+                self._stats['expirations'] += 1
+            self._stats['misses'] += 1
+            generation = self._generation
+
+        value = load()
+
+        with self._lock:
+            if generation == self._generation:
+                self._store(key, frozenset(tags), value)
+        return self._copy(value)
+
+    def invalidate(self, *tags):
+        """Drop every entry carrying any of ``tags``."""
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in self._by_tag.pop(tag, ()):
+                    if self._remove(key):
+                        self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._stats['invalidations'] += len(self._entries)
+            self._entries.clear()
+            self._by_tag.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
+
+    @staticmethod
+    def _copy(value):
+        # Callers may reorder or extend the list they get; the records in it
+        # are shared and must not be modified (see models.py)
+        return list(value) if isinstance(value, list) else value
+
+    def _store(self, key, tags, value):
+        if key in self._entries:
+            self._remove(key)
+        expires = self._clock() + self.ttl if self.ttl > 0 else None
+        self._entries[key] = _Entry(value, tags, expires)
+        for tag in tags:
+            self._by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self._stats['evictions'] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        for tag in entry.tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+        return True
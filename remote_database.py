@@ -0,0 +1,310 @@
+# remote_database.py
+"""``Database`` look-alike that forwards every call to ``server.py``.
+
+Selected by ``database.open_database()`` when ``WAREHOUSE_SERVER`` is set.
+Methods keep the names, arguments and results of ``Database``: records
+(``models.py``) travel as JSON objects and are rebuilt here, so the widgets
+work unchanged against either store.
+"""
+import http.client
+import json
+import socket
+import threading
+from urllib.parse import urlsplit
+
+import diagnostics
+import settings
+from database import PAGE_SIZE
+from models import Order, Product, Sales, User
+
+# Safe to send again when a kept-alive connection turned out to be closed
+_RETRYABLE = frozenset({
+    'resume_session', 'get_products', 'get_products_page', 'get_products_by_ids',
+    'search_products', 'search_products_page', 'get_orders_by_user', 'get_orders_by_user_page',
+    'get_orders_by_ids', 'get_all_orders', 'get_all_orders_page', 'get_placed_orders_page',
+    'get_archived_orders_page', 'get_sales_totals', 'get_sales_by_day', 'get_top_products',
+    'get_top_customers', 'cache_stats',
+    'get_changes', 'change_log_bounds', 'is_session_locked',
+})
+
+
+class RemoteError(Exception):
+    """The server rejected the call; ``status`` is the HTTP status code."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RemoteAuthError(RemoteError, PermissionError):
+    """Not logged in, or the session's user may not do this."""
+
+
+class _Channel:
+    """Kept-alive HTTP connection of one thread.
+
+    ``interrupt()`` may be called from any thread: it aborts the request in
+    progress, like ``sqlite3.Connection.interrupt`` (used by ``CatalogSearch``).
+    """
+
+    def __init__(self, host, port, timeout):
+        self.http = http.client.HTTPConnection(host, port, timeout=timeout)
+        self.used = False
+
+    def interrupt(self):
+        sock = self.http.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self):
+        self.http.close()
+        self.used = False
+
+
+class _Client:
+    """Per-server state shared by every ``RemoteDatabase``: connections and the session token."""
+
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, url, timeout=None):
+        parts = urlsplit(url if '//' in url else f'http://{url}')
+        self.host = parts.hostname or '127.0.0.1'
+        self.port = parts.port or settings.SERVER_PORT
+        self.timeout = settings.SERVER_TIMEOUT if timeout is None else timeout
+        # Token of the user currently working at this terminal
+        self.token = None
+        self._local = threading.local()
+
+    @classmethod
+    def instance(cls, url):
+        with cls._instances_lock:
+            if url not in cls._instances:
+                cls._instances[url] = cls(url)
+            return cls._instances[url]
+
+    def channel(self):
+        channel = getattr(self._local, 'channel', None)
+        if channel is None:
+            channel = self._local.channel = _Channel(self.host, self.port, self.timeout)
+        return channel
+
+    def call(self, method, **params):
+        body = json.dumps(params, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        if self.token is not None:
+            headers['Authorization'] = f'Bearer {self.token}'
+        channel = self.channel()
+        while True:
+            reused = channel.used
+            try:
+                channel.http.request('POST', f'/api/{method}', body, headers)
+                response = channel.http.getresponse()
+                payload = response.read()
+                channel.used = True
+                break
+            except (http.client.HTTPException, OSError):
+                channel.close()
+                # The server may have dropped an idle connection: reads are sent again
+                if not (reused and method in _RETRYABLE):
+                    raise
+
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            raise RemoteError(response.status, f'invalid response from server ({response.status})')
+        if response.status == 200:
+            return data['result']
+        error = data.get('error', response.reason)
+        if response.status in (401, 403):
+            raise RemoteAuthError(response.status, error)
+        raise RemoteError(response.status, error)
+
+
+class RemoteDatabase:
+    def __init__(self, url=None):
+        self.client = _Client.instance(url or settings.SERVER_URL)
+
+    @property
+    def conn(self):
+        """This thread's connection to the server; only ``interrupt()`` is meaningful."""
+        return self.client.channel()
+
+    def _call(self, method, **params):
+        return self.client.call(method, **params)
+
+    @staticmethod
+    def _user(data):
+        return None if data is None else User.from_dict(data)
+
+    @staticmethod
+    def _records(record, rows):
+        return [record.from_dict(row) for row in rows]
+
+    @classmethod
+    def _page(cls, record, result):
+        rows, next_cursor = result
+        return cls._records(record, rows), next_cursor
+
+    # Users and sessions
+    def add_user(self, username, password, role='client'):
+        return self._call('add_user', username=username, password=password, role=role)
+
+    def login(self, username, password):
+        user = self._user(self._call('login', username=username, password=password))
+        if user is not None:
+            self.client.token = user.token
+        return user
+
+    def resume_session(self, token, touch=True):
+        user = self._user(self._call('resume_session', token=token, touch=touch))
+        if user is not None and touch:
+            self.client.token = token
+        return user
+
+    def lock_session(self, token, pin):
+        locked = self._call('lock_session', token=token, pin=pin)
+        # A locked token no longer authorizes calls until unlock_session
+        if locked and self.client.token == token:
+            self.client.token = None
+        return locked
+
+    def unlock_session(self, token, pin):
+        user = self._user(self._call('unlock_session', token=token, pin=pin))
+        if user is not None:
+            self.client.token = token
+        return user
+
+    def is_session_locked(self, token):
+        return self._call('is_session_locked', token=token)
+
+    def end_session(self, token):
+        self._call('end_session', token=token)
+        if self.client.token == token:
+            self.client.token = None
+
+    def change_password(self, user_id, new_password):
+        return self._call('change_password', user_id=user_id, new_password=new_password)
+
+    # Products
+    def add_product(self, name, description, price, quantity):
+        self._call('add_product', name=name, description=description, price=price, quantity=quantity)
+
+    def get_products(self):
+        return self._records(Product, self._call('get_products'))
+
+    def get_products_page(self, cursor=None, page_size=PAGE_SIZE):
+        return self._page(Product, self._call('get_products_page', cursor=cursor, page_size=page_size))
+
+    def get_products_by_ids(self, product_ids):
+        return self._records(Product, self._call('get_products_by_ids', product_ids=list(product_ids)))
+
+    def upsert_products(self, rows):
+        self._call('upsert_products', rows=[list(row) for row in rows])
+
+    def update_product(self, product_id, name, description, price, quantity):
+        self._call(
+            'update_product', product_id=product_id, name=name, description=description,
+            price=price, quantity=quantity,
+        )
+
+    def delete_product(self, product_id):
+        self._call('delete_product', product_id=product_id)
+
+    def search_products(self, search_text):
+        return self._records(Product, self._call('search_products', search_text=search_text))
+
+    def search_products_page(self, search_text, cursor=None, page_size=PAGE_SIZE):
+        return self._page(Product, self._call(
+            'search_products_page', search_text=search_text, cursor=cursor, page_size=page_size
+        ))
+
+    # Orders
+    def place_order(self, user_id, product_id, quantity):
+        return self._call('place_order', user_id=user_id, product_id=product_id, quantity=quantity)
+
+    def checkout(self, user_id, lines):
+        success, shortages = self._call('checkout', user_id=user_id, lines=[list(line) for line in lines])
+        return success, [tuple(line) for line in shortages]
+
+    def cancel_order(self, order_id):
+        return self._call('cancel_order', order_id=order_id)
+
+    def fulfill_order(self, order_id):
+        return self._call('fulfill_order', order_id=order_id)
+
+    def get_orders_by_user(self, user_id):
+        return self._records(Order, self._call('get_orders_by_user', user_id=user_id))
+
+    def get_orders_by_user_page(self, user_id, cursor=None, page_size=PAGE_SIZE):
+        return self._page(Order, self._call(
+            'get_orders_by_user_page', user_id=user_id, cursor=cursor, page_size=page_size
+        ))
+
+    def get_orders_by_ids(self, order_ids):
+        return self._records(Order, self._call('get_orders_by_ids', order_ids=list(order_ids)))
+
+    def get_all_orders(self):
+        return self._records(Order, self._call('get_all_orders'))
+
+    def get_all_orders_page(self, cursor=None, page_size=PAGE_SIZE):
+        return self._page(Order, self._call('get_all_orders_page', cursor=cursor, page_size=page_size))
+
+    def get_placed_orders_page(self, cursor=None, page_size=PAGE_SIZE):
+        return self._page(Order, self._call('get_placed_orders_page', cursor=cursor, page_size=page_size))
+
+    def get_archived_orders_page(self, cursor=None, page_size=PAGE_SIZE):
+        return self._page(Order, self._call('get_archived_orders_page', cursor=cursor, page_size=page_size))
+
+    # Sales analytics
+    def get_sales_totals(self, date_from=None, date_to=None):
+        return Sales.from_dict(self._call('get_sales_totals', date_from=date_from, date_to=date_to))
+
+    def get_sales_by_day(self, date_from=None, date_to=None):
+        return self._records(Sales, self._call('get_sales_by_day', date_from=date_from, date_to=date_to))
+
+    def get_top_products(self, date_from=None, date_to=None, limit=10):
+        return self._records(Sales, self._call(
+            'get_top_products', date_from=date_from, date_to=date_to, limit=limit
+        ))
+
+    def get_top_customers(self, date_from=None, date_to=None, limit=10):
+        return self._records(Sales, self._call(
+            'get_top_customers', date_from=date_from, date_to=date_to, limit=limit
+        ))
+
+    # Query cache lives in the server process
+    def invalidate_cache(self, *tags):
+        pass
+
+    def cache_stats(self):
+        return self._call('cache_stats')
+
+    # Change feed used by live refresh
+    def data_version(self):
+        # PRAGMA data_version is per connection and means nothing across the
+        # server's pool threads; the newest change_log id serves the same purpose
+        _, newest = self.change_log_bounds()
+        return newest or 0
+
+    def get_changes(self, after_id, limit):
+        return [tuple(change) for change in self._call('get_changes', after_id=after_id, limit=limit)]
+
+    def change_log_bounds(self):
+        oldest, newest = self._call('change_log_bounds')
+        return oldest, newest
+
+    def prune_changes(self, keep):
+        self._call('prune_changes', keep=keep)
+
+    def own_changes(self, after_id):
+        # Every terminal writes through the server, which cannot tell them
+        # apart: a remote terminal's own writes come back like anyone else's
+        return []
+
+
+# Timings include the round trip to the server
+diagnostics.instrument(RemoteDatabase)
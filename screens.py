@@ -0,0 +1,68 @@
+# screens.py
+from collections import OrderedDict
+
+import settings
+
+
+class ScreenManager:
+    """Жизненный цикл экранов в ``QStackedWidget`` главного окна.
+
+    Каждый экран создаётся один раз по ключу (например, ``'admin'`` или
+    ``('client', user_id)``) и при повторном входе переиспользуется: у него
+    вызывается ``refresh()``. Число живых экранов ограничено; дольше всех не
+    использовавшийся экран вытесняется — удаляется из стека, получает
+    ``dispose()`` и уничтожается через ``deleteLater()``.
+    """
+
+    def __init__(self, stack, max_screens=None):
+        self.stack = stack
+        self.max_screens = settings.MAX_CACHED_SCREENS if max_screens is None else max_screens
+        self._screens = OrderedDict()
+
+    def show(self, key, factory):
+        """Показывает экран ``key``, создавая его через ``factory()`` при первом обращении."""
+        widget = self._screens.get(key)
+        if widget is None:
+            widget = factory()
+            self._screens[key] = widget
+            self.stack.addWidget(widget)
+        else:
+            self._screens.move_to_end(key)
+            refresh = getattr(widget, 'refresh', None)
+            if refresh is not None:
+                refresh()
+        self.stack.setCurrentWidget(widget)
+        self._evict()
+        return widget
+
+    def get(self, key):
+        return self._screens.get(key)
+
+    def drop(self, key):
+        """Уничтожает экран ``key``, если он существует."""
+        widget = self._screens.pop(key, None)
+        if widget is not None:
+            self._dispose(widget)
+
+    def clear(self):
+        while self._screens:
+            _, widget = self._screens.popitem(last=False)
+            self._dispose(widget)
+
+    def __len__(self):
+        return len(self._screens)
+
+    def _evict(self):
+        current = self.stack.currentWidget()
+        for key in list(self._screens):
+            if len(self._screens) <= self.max_screens:
+                break
+            if self._screens[key] is not current:
+                self._dispose(self._screens.pop(key))
+
+    def _dispose(self, widget):
+        self.stack.removeWidget(widget)
+        dispose = getattr(widget, 'dispose', None)
+        if dispose is not None:
+            dispose()
+        widget.deleteLater()
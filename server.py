@@ -0,0 +1,463 @@
+# server.py
+"""Headless HTTP/JSON server in front of one database file.
+
+Many desktop front ends (``WAREHOUSE_SERVER=http://host:port``, see
+``remote_database.py``) share one store through this process instead of
+opening ``app.db`` themselves, so SQLite only ever sees one writer.
+
+Every operation is ``POST /api/<method>`` with the ``Database`` method's
+keyword arguments as a JSON object; the answer is ``{"result": ...}`` or
+``{"error": "..."}`` with a matching HTTP status. ``login`` returns a
+session token, which later requests pass as ``Authorization: Bearer
+<token>``. ``GET /health`` answers ``{"status": "ok"}``.
+
+Requests are handled concurrently on an asyncio loop. Writes run on a
+single dedicated thread, reads on a small thread pool (each thread with its
+own WAL read connection) and bcrypt on its own pool, so a burst of logins
+never delays catalog reads. Old finished orders are moved to the archive
+database on a schedule (``settings.ARCHIVE_AFTER_DAYS``), the change log
+is trimmed to ``settings.CHANGE_LOG_KEEP`` entries, and online backups are
+taken every ``settings.BACKUP_INTERVAL`` seconds (``backup.py``).
+
+    python server.py --port 8765 --db app.db
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import json
+import logging
+import sqlite3
+from http import HTTPStatus
+
+import settings
+from backup import BackupScheduler
+from database import Database, archive_cutoff, is_busy
+from models import Record
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 32 * 1024 * 1024
+MAX_HEADER_LINES = 100
+# Upper bound for the row-count arguments of paged and top-N methods
+MAX_PAGE_SIZE = 1000
+ROW_COUNT_PARAMS = ('page_size', 'limit')
+
+
+
+def _is_int(value):
+    # JSON true/false arrive as bool, which is an int subclass
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_number(value):
+    return _is_int(value) or isinstance(value, float)
+
+
+def _is_text(value):
+    return isinstance(value, str)
+
+
+def _optional(check):
+    return lambda value: value is None or check(value)
+
+
+def _list_of(check):
+    return lambda value: isinstance(value, list) and all(check(item) for item in value)
+
+
+def _row_of(*checks):
+    return lambda value: (isinstance(value, list) and len(value) == len(checks)
+                          and all(check(item) for check, item in zip(checks, value)))
+
+
+# parameter -> (check, what the check expects); every parameter of every
+# method in METHODS needs an entry, and a failed check is a 400
+PARAM_TYPES = {
+    'after_id': (_is_int, 'an integer'),
+    'cursor': (_optional(_is_text), 'a cursor string or null'),
+    'date_from': (_optional(_is_text), 'a date string or null'),
+    'date_to': (_optional(_is_text), 'a date string or null'),
+    'description': (_is_text, 'a string'),
+    'keep': (_is_int, 'an integer'),
+    'limit': (_is_int, 'an integer'),
+    'lines': (_list_of(_row_of(_is_int, _is_int)), 'a list of [product_id, quantity] pairs'),
+    'name': (_is_text, 'a string'),
+    'new_password': (_is_text, 'a string'),
+    'order_id': (_is_int, 'an integer'),
+    'order_ids': (_list_of(_is_int), 'a list of integers'),
+    'page_size': (_is_int, 'an integer'),
+    'password': (_is_text, 'a string'),
+    'pin': (_is_text, 'a string'),
+    'price': (_is_number, 'a number'),
+    'product_id': (_is_int, 'an integer'),
+    'product_ids': (_list_of(_is_int), 'a list of integers'),
+    'quantity': (_is_int, 'an integer'),
+    'role': (_is_text, 'a string'),
+    'rows': (_list_of(_row_of(_optional(_is_int), _is_text, _is_text, _is_number, _is_int)),
+             'a list of [id, name, description, price, quantity] rows'),
+    'search_text': (_is_text, 'a string'),
+    'token': (_is_text, 'a string'),
+    'touch': (lambda value: isinstance(value, bool), 'true or false'),
+    'user_id': (_is_int, 'an integer'),
+    'username': (_is_text, 'a string'),
+}
+
+# Who may call a method:
+PUBLIC = 'public'    # anyone, including a terminal nobody is logged into
+SESSION = 'session'  # any logged-in user
+OWNER = 'owner'      # a client only for their own user_id, an admin for anyone
+ADMIN = 'admin'
+
+# method -> (thread pool, access)
+METHODS = {
+    'login': ('auth', PUBLIC),
+    'add_user': ('auth', PUBLIC),
+    'resume_session': ('inline', PUBLIC),
+    'lock_session': ('inline', PUBLIC),
+    'unlock_session': ('inline', PUBLIC),
+    'is_session_locked': ('inline', PUBLIC),
+    'end_session': ('inline', PUBLIC),
+    'change_password': ('auth', OWNER),
+
+    'get_products': ('read', PUBLIC),
+    'get_products_page': ('read', PUBLIC),
+    'get_products_by_ids': ('read', PUBLIC),
+    'search_products': ('read', PUBLIC),
+    'search_products_page': ('read', PUBLIC),
+    'add_product': ('write', ADMIN),
+    'update_product': ('write', ADMIN),
+    'delete_product': ('write', ADMIN),
+    'upsert_products': ('write', ADMIN),
+
+    'place_order': ('write', OWNER),
+    'checkout': ('write', OWNER),
+    'cancel_order': ('write', OWNER),
+    'fulfill_order': ('write', ADMIN),
+    'get_orders_by_user': ('read', OWNER),
+    'get_orders_by_user_page': ('read', OWNER),
+    'get_orders_by_ids': ('read', SESSION),
+    'get_all_orders': ('read', ADMIN),
+    'get_all_orders_page': ('read', ADMIN),
+    'get_placed_orders_page': ('read', ADMIN),
+    'get_archived_orders_page': ('read', ADMIN),
+
+    'get_sales_totals': ('read', ADMIN),
+    'get_sales_by_day': ('read', ADMIN),
+    'get_top_products': ('read', ADMIN),
+    'get_top_customers': ('read', ADMIN),
+    'cache_stats': ('inline', ADMIN),
+
+    'get_changes': ('read', SESSION),
+    'change_log_bounds': ('read', SESSION),
+    'prune_changes': ('write', SESSION),
+}
+
+# Live refresh calls these in the background; they check the session
+# without restarting its idle timer
+BACKGROUND = frozenset({'get_changes', 'change_log_bounds', 'prune_changes', 'get_orders_by_ids'})
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def _readline(reader):
+    try:
+        return await reader.readline()
+    except (asyncio.LimitOverrunError, ValueError):
+        # StreamReader.readline reports a line over its buffer limit as ValueError
+        raise ApiError(HTTPStatus.BAD_REQUEST, 'request line or header too long')
+
+
+def _json_default(value):
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class DatabaseServer:
+    def __init__(self, db=None, read_threads=None, auth_threads=None, max_concurrency=None):
+        self.db = db if db is not None else Database()
+        self.pools = {
+            'write': concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='db-write'),
+            'read': concurrent.futures.ThreadPoolExecutor(
+                settings.SERVER_READ_THREADS if read_threads is None else read_threads,
+                thread_name_prefix='db-read',
+            ),
+            'auth': concurrent.futures.ThreadPoolExecutor(
+                settings.SERVER_AUTH_THREADS if auth_threads is None else auth_threads,
+                thread_name_prefix='db-auth',
+            ),
+        }
+        self._limit = asyncio.Semaphore(
+            settings.SERVER_MAX_CONCURRENCY if max_concurrency is None else max_concurrency
+        )
+        self._signatures = {name: inspect.signature(getattr(self.db, name)) for name in METHODS}
+        unchecked = {param for signature in self._signatures.values()
+                     for param in signature.parameters} - PARAM_TYPES.keys()
+        if unchecked:
+            raise ValueError(f'no PARAM_TYPES entry for {", ".join(sorted(unchecked))}')
+
+    async def serve(self, host=None, port=None):
+        server = await asyncio.start_server(
+            self.handle_connection,
+            settings.SERVER_HOST if host is None else host,
+            settings.SERVER_PORT if port is None else port,
+        )
+        for sock in server.sockets:
+            logger.info('listening on %s:%s', *sock.getsockname()[:2])
+        return server
+
+    async def archive_periodically(self, interval=None, older_than_days=None):
+        """Move old finished orders to the archive every ``interval`` seconds.
+
+        Each batch is a separate job on the write thread, so requests queued
+        meanwhile are served between batches.
+        """
+        interval = settings.ARCHIVE_INTERVAL if interval is None else interval
+        loop = asyncio.get_running_loop()
+        while True:
+            before = archive_cutoff(older_than_days)
+            total = 0
+            try:
+                while True:
+                    moved = await loop.run_in_executor(self.pools['write'], self.db.archive_orders, before)
+                    total += moved
+                    if not moved:
+                        break
+                    await asyncio.sleep(settings.ARCHIVE_PAUSE / 1000)
+            except sqlite3.Error:
+                logger.exception('archiving orders failed')
+            if total:
+                logger.info('archived %d orders', total)
+            await asyncio.sleep(interval)
+
+    async def prune_changes_periodically(self, interval=None, keep=None):
+        """Trim the change log every ``interval`` seconds, even with no terminal logged in."""
+        interval = settings.CHANGE_LOG_PRUNE_INTERVAL if interval is None else interval
+        keep = settings.CHANGE_LOG_KEEP if keep is None else keep
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(self.pools['write'], self.db.prune_changes, keep)
+            except sqlite3.Error:
+                logger.exception('pruning the change log failed')
+            await asyncio.sleep(interval)
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.shutdown(wait=True)
+
+    # HTTP
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except ApiError as error:
+                    await self._respond(writer, error.status, {'error': str(error)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self._route(method, path, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        try:
+            request_line = await asyncio.wait_for(_readline(reader), settings.SERVER_IDLE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return None  # idle kept-alive connection
+        if not request_line:
+            return None
+        try:
+            return await asyncio.wait_for(self._read_rest(reader, request_line), settings.SERVER_READ_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise ApiError(HTTPStatus.REQUEST_TIMEOUT, 'request not received in time')
+
+    @staticmethod
+    async def _read_rest(reader, request_line):
+        try:
+            method, path, _version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'malformed request line')
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await _readline(reader)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise ApiError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'too many headers')
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'bad Content-Length')
+        if length < 0:
+            raise ApiError(HTTPStatus.BAD_REQUEST, 'bad Content-Length')
+        if length > MAX_BODY_SIZE:
+            raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'request body too large')
+        body = await reader.readexactly(length) if length else b''
+        return method, path, headers, body
+
+    @staticmethod
+    async def _respond(writer, status, payload, keep_alive):
+        body = json.dumps(payload, default=_json_default, ensure_ascii=False).encode('utf-8')
+        status = HTTPStatus(status)
+        head = (
+            f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+            'Content-Type: application/json; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+            '\r\n'
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def _route(self, method, path, headers, body):
+        if method == 'GET' and path == '/health':
+            return HTTPStatus.OK, {'status': 'ok'}
+        if method != 'POST' or not path.startswith('/api/'):
+            return HTTPStatus.NOT_FOUND, {'error': f'no route for {method} {path}'}
+        try:
+            params = json.loads(body or b'{}')
+            if not isinstance(params, dict):
+                raise ValueError
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, {'error': 'request body must be a JSON object'}
+        scheme, _, token = headers.get('authorization', '').partition(' ')
+        token = token.strip() if scheme == 'Bearer' else None
+        try:
+            async with self._limit:
+                result = await self.call(path[len('/api/'):], params, token or None)
+        except ApiError as error:
+            return error.status, {'error': str(error)}
+        except Exception:
+            logger.exception('%s failed', path)
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'internal error'}
+        return HTTPStatus.OK, {'result': result}
+
+    # Operations
+
+    async def call(self, name, params, token=None):
+        """Check access to ``name`` and run it on its thread pool."""
+        if name not in METHODS:
+            raise ApiError(HTTPStatus.NOT_FOUND, f'unknown method {name!r}')
+        pool, access = METHODS[name]
+        try:
+            self._signatures[name].bind(**params)
+        except TypeError as error:
+            raise ApiError(HTTPStatus.BAD_REQUEST, str(error))
+        for param, value in params.items():
+            check, expected = PARAM_TYPES[param]
+            if not check(value):
+                raise ApiError(HTTPStatus.BAD_REQUEST, f'{param} must be {expected}')
+        for param in ROW_COUNT_PARAMS:
+            if param in params:
+                if params[param] < 1:
+                    raise ApiError(HTTPStatus.BAD_REQUEST, f'{param} must be a positive integer')
+                params = dict(params, **{param: min(params[param], MAX_PAGE_SIZE)})
+
+        # Only calls a user makes count as activity of their session
+        touch = access != PUBLIC and name not in BACKGROUND
+        user = self.db.resume_session(token, touch) if token else None
+        call = await self._authorize(name, access, params, user)
+        if pool == 'inline':
+            return self._run(call)
+        return await asyncio.get_running_loop().run_in_executor(self.pools[pool], self._run, call)
+
+    async def _authorize(self, name, access, params, user):
+        method = getattr(self.db, name)
+        if access == PUBLIC:
+            if name == 'add_user' and not (user and user.role == 'admin'):
+                # Self-registration only creates clients
+                params = dict(params, role='client')
+            return functools.partial(method, **params)
+        if user is None:
+            raise ApiError(HTTPStatus.UNAUTHORIZED, 'login required')
+        is_admin = user.role == 'admin'
+        if access == ADMIN and not is_admin:
+            raise ApiError(HTTPStatus.FORBIDDEN, 'admin only')
+        if access == OWNER and not is_admin:
+            if name == 'cancel_order':
+                owner = await asyncio.get_running_loop().run_in_executor(
+                    self.pools['read'], self.db.get_order_owner, params.get('order_id')
+                )
+                if owner is not None and owner != user.id:
+                    raise ApiError(HTTPStatus.FORBIDDEN, 'not your order')
+            elif params.get('user_id') != user.id:
+                raise ApiError(HTTPStatus.FORBIDDEN, 'not your account')
+        if name == 'get_orders_by_ids' and not is_admin:
+            # Live refresh of a client terminal: only the client's own orders
+            return lambda: [order for order in method(**params) if order.user_id == user.id]
+        return functools.partial(method, **params)
+
+    @staticmethod
+    def _run(call):
+        try:
+            return call()
+        except ValueError as error:
+            raise ApiError(HTTPStatus.BAD_REQUEST, str(error))
+        except sqlite3.OperationalError as error:
+            if is_busy(error):
+                raise ApiError(HTTPStatus.SERVICE_UNAVAILABLE, 'database is busy, try again')
+            logger.exception('database error')
+            raise ApiError(HTTPStatus.INTERNAL_SERVER_ERROR, 'database error')
+        except sqlite3.Error:
+            logger.exception('database error')
+            raise ApiError(HTTPStatus.INTERNAL_SERVER_ERROR, 'database error')
+
+
+async def run(host=None, port=None, db_path=None):
+    app = DatabaseServer(Database(db_path))
+    server = await app.serve(host, port)
+    archiver = asyncio.get_running_loop().create_task(app.archive_periodically()) \
+        if settings.ARCHIVE_AFTER_DAYS else None
+    pruner = asyncio.get_running_loop().create_task(app.prune_changes_periodically())
+    # Backups copy through the write connection, so the server's own writes
+    # never restart them
+    backups = BackupScheduler(app.db.manager.path) if settings.BACKUP_INTERVAL else None
+    if backups is not None:
+        backups.start()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if archiver is not None:
+            archiver.cancel()
+        pruner.cancel()
+        if backups is not None:
+            backups.stop()
+        app.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='HTTP/JSON сервер базы магазина для нескольких терминалов.')
+    parser.add_argument('--host', default=settings.SERVER_HOST)
+    parser.add_argument('--port', type=int, default=settings.SERVER_PORT)
+    parser.add_argument('--db', help='путь к файлу базы данных')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    try:
+        asyncio.run(run(args.host, args.port, args.db))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,145 @@
+# sessions.py
+import dataclasses
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+
+import settings
+
+
+class Session:
+    __slots__ = ('token', 'user', 'created', 'last_seen', 'pin', 'pin_attempts')
+
+    def __init__(self, token, user, now):
+        self.token = token
+        self.user = user
+        self.created = now
+        self.last_seen = now
+        self.pin = None  # HMAC of the PIN while the session is locked
+        self.pin_attempts = 0
+
+
+class SessionStore:
+    """In-memory store of login sessions.
+
+    A token is issued after a successful bcrypt check and can then be
+    validated with a dictionary lookup instead of re-hashing the password.
+    Sessions expire after ``idle_timeout`` seconds without use or
+    ``max_age`` seconds after login, and can be revoked one by one or for
+    a whole user (for example after a password change).
+
+    A session can be locked with a PIN when its terminal switches users: a
+    locked session is not touched by requests, and returning to it takes
+    the PIN. The PIN is kept only as an HMAC with a key private to this
+    store, and after ``pin_attempts`` wrong PINs the session is revoked.
+    """
+
+    def __init__(self, idle_timeout=None, max_age=None, clock=time.monotonic, pin_attempts=None):
+        self.idle_timeout = settings.SESSION_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self.max_age = settings.SESSION_MAX_AGE if max_age is None else max_age
+        self.pin_attempts = settings.SESSION_PIN_ATTEMPTS if pin_attempts is None else pin_attempts
+        self._clock = clock
+        self._pin_key = secrets.token_bytes(32)
+        self._sessions = {}
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def issue(self, user):
+        """Create a session for ``user`` (a ``models.User``) and return its token."""
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._sessions[token] = Session(token, dataclasses.replace(user, token=token), self._clock())
+            self._by_user.setdefault(user.id, set()).add(token)
+        return token
+
+    def validate(self, token, touch=True):
+        """``User`` of a live session (with its ``token``), or None. ``touch`` resets the idle timer.
+
+        A locked session is not usable until ``unlock``: it yields None too.
+        """
+        now = self._clock()
+        with self._lock:
+            session = self._live(token, now)
+            if session is None or session.pin is not None:
+                return None
+            if touch:
+                session.last_seen = now
+            return dataclasses.replace(session.user)
+
+    def is_locked(self, token):
+        """True if ``token`` is a live session waiting for its PIN."""
+        with self._lock:
+            session = self._live(token, self._clock())
+            return session is not None and session.pin is not None
+
+    def lock(self, token, pin):
+        """Lock a live session with ``pin``; False if there is no such session."""
+        now = self._clock()
+        with self._lock:
+            session = self._live(token, now)
+            if session is None:
+                return False
+            session.pin = self._digest(pin)
+            session.pin_attempts = 0
+            session.last_seen = now
+            return True
+
+    def unlock(self, token, pin):
+        """``User`` of a locked session if ``pin`` matches, or None.
+
+        The session is revoked after too many wrong PINs.
+        """
+        now = self._clock()
+        with self._lock:
+            session = self._live(token, now)
+            if session is None or session.pin is None:
+                return None
+            if not hmac.compare_digest(session.pin, self._digest(pin)):
+                session.pin_attempts += 1
+                if session.pin_attempts >= self.pin_attempts:
+                    self._remove(session)
+                return None
+            session.pin = None
+            session.last_seen = now
+            return dataclasses.replace(session.user)
+
+    def revoke(self, token):
+        with self._lock:
+            session = self._sessions.get(token)
+            if session is not None:
+                self._remove(session)
+
+    def revoke_user(self, user_id):
+        with self._lock:
+            for token in list(self._by_user.get(user_id, ())):
+                self._remove(self._sessions[token])
+
+    def purge_expired(self):
+        now = self._clock()
+        with self._lock:
+            for session in [s for s in self._sessions.values() if self._expired(s, now)]:
+                self._remove(session)
+
+    def _live(self, token, now):
+        session = self._sessions.get(token)
+        if session is not None and self._expired(session, now):
+            self._remove(session)
+            return None
+        return session
+
+    def _digest(self, pin):
+        return hmac.new(self._pin_key, pin.encode('utf-8'), hashlib.sha256).digest()
+
+    def _expired(self, session, now):
+        return (now - session.last_seen > self.idle_timeout
+                or now - session.created > self.max_age)
+
+    def _remove(self, session):
+        del self._sessions[session.token]
+        tokens = self._by_user.get(session.user.id)
+        if tokens is not None:
+            tokens.discard(session.token)
+            if not tokens:
+                del self._by_user[session.user.id]
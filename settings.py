@@ -0,0 +1,117 @@
+# settings.py
+"""Параметры развёртывания. Каждое значение можно переопределить переменной окружения."""
+import os
+
+
+def _flag(value):
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(name)
+    if value is None or value == '':
+        return default
+    return cast(value)
+
+
+# Database file and connection pragmas
+DB_PATH = _env('WAREHOUSE_DB', 'app.db')
+DB_SYNCHRONOUS = _env('WAREHOUSE_DB_SYNCHRONOUS', 'NORMAL')
+DB_CACHE_SIZE = _env('WAREHOUSE_DB_CACHE_SIZE', -16000, int)  # negative = KiB, ~16 MB per connection
+DB_MMAP_SIZE = _env('WAREHOUSE_DB_MMAP_SIZE', 256 * 1024 * 1024, int)
+DB_BUSY_TIMEOUT = _env('WAREHOUSE_DB_BUSY_TIMEOUT', 5000, int)  # milliseconds
+
+# Client catalog search
+SEARCH_DEBOUNCE_MS = _env('WAREHOUSE_SEARCH_DEBOUNCE_MS', 250, int)
+
+# Write transactions: how long one BEGIN IMMEDIATE attempt waits for the lock,
+# and the bounded exponential backoff between attempts
+DB_WRITE_BUSY_TIMEOUT = _env('WAREHOUSE_DB_WRITE_BUSY_TIMEOUT', 250, int)  # milliseconds
+DB_WRITE_RETRIES = _env('WAREHOUSE_DB_WRITE_RETRIES', 6, int)
+DB_RETRY_BASE_DELAY = _env('WAREHOUSE_DB_RETRY_BASE_DELAY', 20, int)  # milliseconds
+DB_RETRY_MAX_DELAY = _env('WAREHOUSE_DB_RETRY_MAX_DELAY', 1000, int)  # milliseconds
+
+# Password hashing: bcrypt work factor (each +1 doubles login time).
+# Stored hashes with a different cost are re-hashed on the next successful login.
+BCRYPT_ROUNDS = _env('WAREHOUSE_BCRYPT_ROUNDS', 12, int)
+
+# Login sessions: a locked screen can be resumed with its PIN instead of the
+# password until it has been idle this long
+SESSION_IDLE_TIMEOUT = _env('WAREHOUSE_SESSION_IDLE_TIMEOUT', 15 * 60, int)  # seconds
+SESSION_MAX_AGE = _env('WAREHOUSE_SESSION_MAX_AGE', 12 * 60 * 60, int)  # seconds
+# Wrong PINs after which a locked session is closed
+SESSION_PIN_ATTEMPTS = _env('WAREHOUSE_SESSION_PIN_ATTEMPTS', 5, int)
+
+# How many admin/client/registration screens MainWindow keeps alive for reuse
+MAX_CACHED_SCREENS = _env('WAREHOUSE_MAX_CACHED_SCREENS', 4, int)
+
+# Live refresh: how often open screens poll for changes made by other app instances
+LIVE_REFRESH_INTERVAL_MS = _env('WAREHOUSE_LIVE_REFRESH_INTERVAL_MS', 1000, int)
+# Newest change_log entries kept for lagging instances; the server prunes the
+# rest every CHANGE_LOG_PRUNE_INTERVAL seconds, desktop watchers now and then
+CHANGE_LOG_KEEP = _env('WAREHOUSE_CHANGE_LOG_KEEP', 50000, int)
+CHANGE_LOG_PRUNE_INTERVAL = _env('WAREHOUSE_CHANGE_LOG_PRUNE_INTERVAL', 5 * 60, int)  # seconds
+
+# Read-through cache of query results (query_cache.py): entries kept per
+# process and how long one may be served before it is re-read. 0 disables
+QUERY_CACHE_SIZE = _env('WAREHOUSE_QUERY_CACHE_SIZE', 512, int)
+QUERY_CACHE_TTL = _env('WAREHOUSE_QUERY_CACHE_TTL', 30, float)  # seconds
+
+# Shared server (server.py). When WAREHOUSE_SERVER is set (e.g.
+# http://127.0.0.1:8765) the desktop app talks to that server instead of
+# opening the database file itself
+SERVER_URL = _env('WAREHOUSE_SERVER', '')
+SERVER_TIMEOUT = _env('WAREHOUSE_SERVER_TIMEOUT', 30, float)  # seconds, per request
+SERVER_HOST = _env('WAREHOUSE_SERVER_HOST', '127.0.0.1')
+SERVER_PORT = _env('WAREHOUSE_SERVER_PORT', 8765, int)
+SERVER_READ_THREADS = _env('WAREHOUSE_SERVER_READ_THREADS', 4, int)
+SERVER_AUTH_THREADS = _env('WAREHOUSE_SERVER_AUTH_THREADS', 2, int)  # bcrypt
+SERVER_MAX_CONCURRENCY = _env('WAREHOUSE_SERVER_MAX_CONCURRENCY', 64, int)  # requests executing at once
+# The server closes a kept-alive connection idle this long and answers 408
+# to a request that does not arrive completely within the read timeout
+SERVER_IDLE_TIMEOUT = _env('WAREHOUSE_SERVER_IDLE_TIMEOUT', 120, float)  # seconds
+SERVER_READ_TIMEOUT = _env('WAREHOUSE_SERVER_READ_TIMEOUT', 30, float)  # seconds
+
+# Instrumentation (diagnostics.py): method and SQL timings, slow-query log.
+# Off by default; read once at startup
+DIAGNOSTICS = _env('WAREHOUSE_DIAGNOSTICS', False, _flag)
+SLOW_QUERY_MS = _env('WAREHOUSE_SLOW_QUERY_MS', 100, float)
+DIAGNOSTICS_WINDOW = _env('WAREHOUSE_DIAGNOSTICS_WINDOW', 60, int)  # seconds per histogram window
+DIAGNOSTICS_WINDOWS = _env('WAREHOUSE_DIAGNOSTICS_WINDOWS', 10, int)  # windows kept
+
+# Developer mode: extra tools in the main window (worst GUI stalls)
+DEV_MODE = _env('WAREHOUSE_DEV_MODE', False, _flag)
+
+# GUI stall watchdog (stall_watchdog.py): a heartbeat timer on the GUI thread;
+# when it is late by more than the threshold the GUI thread's stack is
+# sampled and the stall is recorded. A developer tool: by default it runs,
+# and writes the rotating log file, only in developer mode
+WATCHDOG = _env('WAREHOUSE_WATCHDOG', DEV_MODE, _flag)
+WATCHDOG_HEARTBEAT_MS = _env('WAREHOUSE_WATCHDOG_HEARTBEAT_MS', 50, int)
+STALL_THRESHOLD_MS = _env('WAREHOUSE_STALL_THRESHOLD_MS', 200, int)
+STALL_LOG = _env('WAREHOUSE_STALL_LOG', 'stalls.log' if DEV_MODE else '')  # empty string: no file
+STALL_LOG_MAX_BYTES = _env('WAREHOUSE_STALL_LOG_MAX_BYTES', 1024 * 1024, int)
+STALL_LOG_BACKUPS = _env('WAREHOUSE_STALL_LOG_BACKUPS', 3, int)
+
+# Order archive: finished (cancelled or fulfilled) orders older than
+# ARCHIVE_AFTER_DAYS are moved in batches into a separate database file
+# attached as "archive". Empty ARCHIVE_DB: "<database>-archive.db" next to
+# the database. 0 days disables the scheduled job
+ARCHIVE_DB = _env('WAREHOUSE_ARCHIVE_DB', '')
+ARCHIVE_AFTER_DAYS = _env('WAREHOUSE_ARCHIVE_AFTER_DAYS', 365, int)
+ARCHIVE_INTERVAL = _env('WAREHOUSE_ARCHIVE_INTERVAL', 60 * 60, int)  # seconds between runs
+ARCHIVE_BATCH_SIZE = _env('WAREHOUSE_ARCHIVE_BATCH_SIZE', 500, int)  # orders per write transaction
+ARCHIVE_PAUSE = _env('WAREHOUSE_ARCHIVE_PAUSE', 50, int)  # milliseconds between batches
+
+# Online backups (backup.py): the database and its archive are copied with
+# the SQLite backup API, BACKUP_PAGES pages per step with a pause between
+# steps, so terminals keep working during the copy. BACKUP_INTERVAL 0
+# disables scheduled backups; the newest BACKUP_KEEP copies are kept
+BACKUP_DIR = _env('WAREHOUSE_BACKUP_DIR', 'backups')
+BACKUP_INTERVAL = _env('WAREHOUSE_BACKUP_INTERVAL', 0, int)  # seconds
+BACKUP_KEEP = _env('WAREHOUSE_BACKUP_KEEP', 24, int)
+BACKUP_PAGES = _env('WAREHOUSE_BACKUP_PAGES', 1024, int)  # pages per step
+BACKUP_PAUSE = _env('WAREHOUSE_BACKUP_PAUSE', 20, int)  # milliseconds between steps
+BACKUP_COMPRESS = _env('WAREHOUSE_BACKUP_COMPRESS', False, _flag)  # gzip
+BACKUP_VERIFY = _env('WAREHOUSE_BACKUP_VERIFY', True, _flag)  # integrity check of each new copy
+BACKUP_MAX_RESTARTS = _env('WAREHOUSE_BACKUP_MAX_RESTARTS', 5, int)
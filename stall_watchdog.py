@@ -0,0 +1,330 @@
+# stall_watchdog.py
+"""Сторож цикла событий Qt: находит, какой обработчик «заморозил» окно.
+
+Инструмент разработчика: по умолчанию ``main.py`` ставит его только в
+режиме разработчика (``WAREHOUSE_DEV_MODE=1``, см. ``settings.WATCHDOG``).
+
+Таймер-пульс в потоке GUI срабатывает каждые ``WATCHDOG_HEARTBEAT_MS``;
+опоздание пульса — это время, на которое цикл событий был занят, и оно
+копится в гистограмме (задержка цикла событий ≈ время кадра). Отдельный
+поток-сэмплер раз в ``SAMPLE_MS`` проверяет, не просрочен ли пульс больше
+чем на ``STALL_THRESHOLD_MS``, и пока поток GUI занят, снимает его
+Python-стек (``sys._current_frames``). Когда пульс возвращается,
+зависание записывается:
+
+* в журнал ``warehouse.stall`` — файл ``STALL_LOG`` с ротацией
+  (``RotatingFileHandler``, по умолчанию только в режиме разработчика):
+  длительность, обработчик и самый частый стек;
+* в сводку по обработчикам — сколько раз, суммарно и максимально он
+  держал окно; её показывает ``StallReportDialog``.
+
+Обработчик — первый Python-кадр над самым вложенным циклом событий (слот
+кнопки, таймера и т. п.): цикл находится по каждому снимку стека — это
+кадр, стоящий на вызове ``exec()``, ``processEvents()`` или модального
+диалога, поэтому зависание в окне, открытом из другого обработчика,
+приписывается его собственному обработчику. Если во время зависания
+Python-кода над циклом не было, значит, время ушло внутри Qt (компоновка,
+отрисовка). Если поток GUI всё время держал GIL в коде расширения,
+сэмплер не успевает снять стек, и зависание записывается без него.
+"""
+import collections
+import datetime
+import logging
+import logging.handlers
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+
+from PyQt6.QtCore import QObject, Qt, QTimer
+from PyQt6.QtWidgets import (
+    QDialog, QHBoxLayout, QHeaderView, QLabel, QPlainTextEdit, QPushButton, QSplitter,
+    QTableWidget, QTableWidgetItem, QVBoxLayout,
+)
+
+import settings
+from diagnostics import RollingHistogram
+
+stall_logger = logging.getLogger('warehouse.stall')
+
+SAMPLE_MS = 20
+# Сколько снимков стека хранить за одно зависание
+MAX_SAMPLES = 200
+MAX_STACK_DEPTH = 30
+NO_PYTHON_HANDLER = '(внутри Qt, без Python-кода)'
+NO_SAMPLES = '(стек не снят)'
+# Строка кадра, который запустил цикл событий: приложения, диалога или окна сообщения
+EVENT_LOOP_CALL = re.compile(
+    r'\.(exec_?|processEvents)\s*\(|\b(QMessageBox\.(warning|information|question|critical|about)'
+    r'|QInputDialog\.get\w+|QFileDialog\.get\w+)\s*\('
+)
+
+
+class StallWatchdog(QObject):
+    def __init__(self, parent=None, heartbeat_ms=None, threshold_ms=None, log_path=None):
+        super().__init__(parent)
+        self.heartbeat = (settings.WATCHDOG_HEARTBEAT_MS if heartbeat_ms is None else heartbeat_ms) / 1000
+        self.threshold = (settings.STALL_THRESHOLD_MS if threshold_ms is None else threshold_ms) / 1000
+        self._lock = threading.Lock()
+        self._gui_thread = threading.get_ident()
+        # Глубина стека главного цикла событий — на случай, если у кадров нет исходного текста
+        self._base_depth = None
+        self._last_beat = None
+        self._samples = []
+        self._running = False
+        self._sampler = None
+        self.reset()
+
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.setInterval(round(self.heartbeat * 1000))
+        self._timer.timeout.connect(self._beat)
+
+        self._log_handler = None
+        log_path = settings.STALL_LOG if log_path is None else log_path
+        if log_path:
+            self._log_handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=settings.STALL_LOG_MAX_BYTES,
+                backupCount=settings.STALL_LOG_BACKUPS, encoding='utf-8', delay=True,
+            )
+            self._log_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            stall_logger.addHandler(self._log_handler)
+            stall_logger.setLevel(logging.INFO)
+
+    def reset(self):
+        with self._lock:
+            self.started = datetime.datetime.now()
+            self.latency = RollingHistogram(settings.DIAGNOSTICS_WINDOW, settings.DIAGNOSTICS_WINDOWS)
+            self.beats = 0
+            self.offenders = {}
+            self.recent = collections.deque(maxlen=50)
+
+    def start(self):
+        self._last_beat = time.monotonic()
+        self._running = True
+        self._timer.start()
+        self._sampler = threading.Thread(target=self._sample_loop, name='stall-watchdog', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._running = False
+        self._timer.stop()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        if self._log_handler is not None:
+            stall_logger.removeHandler(self._log_handler)
+            self._log_handler.close()
+            self._log_handler = None
+
+    # Поток GUI
+
+    def _beat(self):
+        now = time.monotonic()
+        if self._base_depth is None:
+            # Пульс вызывается прямо из цикла событий: всё ниже него — сам цикл
+            self._base_depth = len(traceback.extract_stack()) - 1
+        with self._lock:
+            lateness = now - self._last_beat - self.heartbeat
+            samples, self._samples = self._samples, []
+            self._last_beat = now
+            self.beats += 1
+            self.latency.add(max(lateness, 0.0) * 1000, now)
+        if lateness >= self.threshold:
+            self._record_stall(lateness, samples)
+
+    def _record_stall(self, seconds, samples):
+        if samples:
+            handlers = collections.Counter(self._handler(stack) for stack in samples)
+            handler, _ = handlers.most_common(1)[0]
+            stacks = collections.Counter(stack for stack in samples if self._handler(stack) == handler)
+            stack, _ = stacks.most_common(1)[0]
+        else:
+            stack, handler = (), NO_SAMPLES
+        ms = round(seconds * 1000, 1)
+        stall = {
+            'at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'ms': ms,
+            'handler': handler,
+            'samples': len(samples),
+            'stack': self._format(stack),
+        }
+        with self._lock:
+            self.recent.append(stall)
+            offender = self.offenders.get(handler)
+            if offender is None:
+                offender = self.offenders[handler] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            offender['count'] += 1
+            offender['total_ms'] = round(offender['total_ms'] + ms, 1)
+            if ms >= offender['max_ms']:
+                offender['max_ms'] = ms
+                offender['stack'] = stall['stack']
+            offender['last_at'] = stall['at']
+        stall_logger.warning(
+            'окно не отвечало %.0f мс, обработчик %s (снимков стека: %d)\n%s',
+            ms, handler, len(samples), ''.join(stall['stack']) or '  ' + NO_SAMPLES + '\n',
+        )
+
+    def _depth(self, stack):
+        """Номер кадра обработчика: следующий за самым вложенным вызовом цикла событий."""
+        for index in range(len(stack) - 1, -1, -1):
+            line = stack[index][3]
+            if line and EVENT_LOOP_CALL.search(line):
+                return index + 1
+        return self._base_depth or 0
+
+    def _handler(self, stack):
+        depth = self._depth(stack)
+        if len(stack) <= depth:
+            return NO_PYTHON_HANDLER
+        filename, _, name, _ = stack[depth]
+        return f'{os.path.basename(filename)}:{name}'
+
+    def _format(self, stack):
+        # Кадры циклов событий не нужны, глубокие стеки обрезаются снизу
+        frames = stack[self._depth(stack):][-MAX_STACK_DEPTH:]
+        return traceback.format_list(traceback.StackSummary.from_list(frames))
+
+    # Поток сэмплера
+
+    def _sample_loop(self):
+        while self._running:
+            time.sleep(SAMPLE_MS / 1000)
+            beat = self._last_beat
+            if time.monotonic() - beat - self.heartbeat < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._gui_thread)
+            if frame is None:
+                continue
+            stack = tuple(
+                (summary.filename, summary.lineno, summary.name, summary.line)
+                for summary in traceback.extract_stack(frame)
+            )
+            del frame
+            with self._lock:
+                # Пульс мог вернуться, пока снимался стек: снимок тогда не относится к зависанию
+                if self._last_beat == beat and len(self._samples) < MAX_SAMPLES:
+                    self._samples.append(stack)
+
+    # Отчёт
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            latency = self.latency.merged(now).summary()
+            offenders = {name: dict(stats) for name, stats in self.offenders.items()}
+            recent = list(self.recent)
+            beats = self.beats
+        return {
+            'since': self.started.isoformat(timespec='seconds'),
+            'heartbeat_ms': round(self.heartbeat * 1000),
+            'threshold_ms': round(self.threshold * 1000),
+            'beats': beats,
+            'latency': latency,
+            'offenders': dict(sorted(offenders.items(), key=lambda item: -item[1]['total_ms'])),
+            'recent': recent,
+        }
+
+
+_watchdog = None
+
+
+def install(parent=None):
+    """Запускает сторож для приложения (один на процесс) и возвращает его."""
+    global _watchdog
+    if _watchdog is None:
+        _watchdog = StallWatchdog(parent)
+        _watchdog.start()
+    return _watchdog
+
+
+def active():
+    return _watchdog
+
+
+class StallReportDialog(QDialog):
+    """Режим разработчика: обработчики, дольше всего державшие окно."""
+
+    HEADERS = ['Обработчик', 'Зависаний', 'Всего, мс', 'Макс., мс', 'Последнее']
+
+    def __init__(self, watchdog, parent=None):
+        super().__init__(parent)
+        self.watchdog = watchdog
+        self.init_ui()
+        self.load()
+
+    def init_ui(self):
+        self.setWindowTitle('Зависания интерфейса')
+        self.resize(800, 550)
+
+        self.summary_label = QLabel()
+        self.summary_label.setWordWrap(True)
+
+        self.table = QTableWidget(0, len(self.HEADERS))
+        self.table.setHorizontalHeaderLabels(self.HEADERS)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableWidget.SelectionBehavior.SelectRows)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.currentCellChanged.connect(self.show_stack)
+
+        # Стек самого долгого зависания выбранного обработчика
+        self.stack_view = QPlainTextEdit()
+        self.stack_view.setReadOnly(True)
+        self.stack_view.setLineWrapMode(QPlainTextEdit.LineWrapMode.NoWrap)
+
+        splitter = QSplitter(Qt.Orientation.Vertical)
+        splitter.addWidget(self.table)
+        splitter.addWidget(self.stack_view)
+
+        self.refresh_button = QPushButton('Обновить')
+        self.refresh_button.clicked.connect(self.load)
+        self.reset_button = QPushButton('Сбросить')
+        self.reset_button.clicked.connect(self.reset)
+
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addWidget(self.refresh_button)
+        buttons_layout.addWidget(self.reset_button)
+
+        layout = QVBoxLayout()
+        layout.addWidget(self.summary_label)
+        layout.addWidget(splitter)
+        layout.addLayout(buttons_layout)
+        self.setLayout(layout)
+
+    def load(self):
+        snapshot = self.watchdog.snapshot()
+        latency = snapshot['latency']
+        self.summary_label.setText(
+            f'С {snapshot["since"]}: пульс каждые {snapshot["heartbeat_ms"]} мс, зависание — от '
+            f'{snapshot["threshold_ms"]} мс, журнал: {settings.STALL_LOG or "выключен"}.\n'
+            f'Задержка цикла событий за последние минуты: p50 {latency["p50_ms"]:g} мс, '
+            f'p95 {latency["p95_ms"]:g} мс, p99 {latency["p99_ms"]:g} мс, макс. {latency["max_ms"]:g} мс '
+            f'(пульсов: {latency["count"]}).'
+        )
+        self.offenders = list(snapshot['offenders'].items())
+        self.table.setRowCount(len(self.offenders))
+        for row_index, (handler, stats) in enumerate(self.offenders):
+            values = (handler, stats['count'], stats['total_ms'], stats['max_ms'], stats['last_at'])
+            for col_index, value in enumerate(values):
+                item = QTableWidgetItem(str(value))
+                if col_index in (1, 2, 3):
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.table.setItem(row_index, col_index, item)
+        if self.offenders:
+            self.table.setCurrentCell(0, 0)
+        else:
+            self.stack_view.setPlainText('Зависаний не было.')
+
+    def show_stack(self, row, *_):
+        if 0 <= row < len(self.offenders):
+            handler, stats = self.offenders[row]
+            stack = ''.join(stats.get('stack') or []) or NO_SAMPLES
+            self.stack_view.setPlainText(f'{handler}, {stats["max_ms"]:g} мс:\n\n{stack}')
+
+    def reset(self):
+        self.watchdog.reset()
+        self.load()
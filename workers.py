@@ -0,0 +1,79 @@
+# workers.py
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+DB_POOL_THREADS = 2
+AUTH_POOL_THREADS = 1
+
+_pools = {}
+
+
+def _pool(name, threads):
+    # Потоки пулов живут всё время работы приложения: у каждого из них своё
+    # соединение чтения из ``ConnectionManager``, и пересоздавать их незачем
+    pool = _pools.get(name)
+    if pool is None:
+        pool = QThreadPool()
+        pool.setMaxThreadCount(threads)
+        pool.setExpiryTimeout(-1)
+        _pools[name] = pool
+    return pool
+
+
+def db_pool():
+    """Пул потоков для запросов к базе данных."""
+    return _pool('db', DB_POOL_THREADS)
+
+
+def auth_pool():
+    """Пул для хеширования и проверки паролей bcrypt.
+
+    Отдельный, чтобы долгий bcrypt не задерживал поиск по каталогу.
+    """
+    return _pool('auth', AUTH_POOL_THREADS)
+
+
+class TaskSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    progress = pyqtSignal(object)
+
+
+class Task(QRunnable):
+    """Выполняет ``fn(*args, **kwargs)`` в пуле потоков.
+
+    Результат приходит в поток GUI через ``signals.finished``, исключение —
+    через ``signals.failed``.
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = TaskSignals()
+
+    def run(self):
+        try:
+            result = self.fn(*self.args, **self.kwargs)
+        except Exception as error:
+            self.signals.failed.emit(error)
+        else:
+            self.signals.finished.emit(result)
+
+
+def run_in_background(fn, *args, on_finished=None, on_failed=None, on_progress=None, pool=None, **kwargs):
+    """Запускает ``fn`` в пуле.
+
+    Если задан ``on_progress``, функция получает аргумент ``progress`` — вызов
+    из рабочего потока доставляется в ``on_progress`` в потоке GUI.
+    """
+    task = Task(fn, *args, **kwargs)
+    if on_progress is not None:
+        task.kwargs['progress'] = task.signals.progress.emit
+        task.signals.progress.connect(on_progress)
+    if on_finished is not None:
+        task.signals.finished.connect(on_finished)
+    if on_failed is not None:
+        task.signals.failed.connect(on_failed)
+    (pool or db_pool()).start(task)
+    return task